@@ -0,0 +1,570 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# --- Motor de almacenamiento del historial ---
+# El historial se guarda como un log JSONL de solo-añadido:
+#   {"op": "add", "registro": {...}}   -> alta de un registro
+#   {"op": "del", "ids": [...]}        -> borrado lógico (tombstone)
+# Un pequeño archivo de metadatos guarda el último id asignado y los contadores
+# que deciden cuándo compactar, así que guardar y borrar no recorren el log.
+#
+# Concurrencia: varias sesiones y varios procesos (réplicas sobre un volumen
+# compartido) escriben el mismo log. Cada escritura toma un bloqueo de archivo
+# exclusivo solo mientras dura el append; los metadatos y la compactación se
+# confirman con archivo temporal + fsync + rename atómico. Al leer, una última
+# línea truncada por una caída se ignora y se repara en la siguiente escritura.
+
+COMPACTAR_MIN_BORRADOS = int(os.environ.get("HISTORIAL_COMPACTAR_MIN_BORRADOS", "500"))
+COMPACTAR_PROPORCION = float(os.environ.get("HISTORIAL_COMPACTAR_PROPORCION", "0.5"))
+
+class AlmacenHistorial:
+    """
+    Log JSONL de solo-añadido con contador de ids persistido, borrados por
+    tombstone y compactación en segundo plano.
+    """
+
+    def __init__(self, ruta_log, ruta_legado=None):
+        self.ruta_log = ruta_log
+        self.ruta_meta = f"{ruta_log}.meta"
+        self.ruta_legado = ruta_legado
+        self.ruta_bloqueo = f"{ruta_log}.lock"
+        self._lock = threading.RLock()
+        self._compactando = False
+
+    @contextmanager
+    def _bloqueo(self):
+        """
+        Bloqueo exclusivo entre hilos (RLock) y entre procesos (bloqueo de archivo).
+        Solo se mantiene durante la escritura en sí.
+        """
+        with self._lock:
+            directorio = os.path.dirname(os.path.abspath(self.ruta_bloqueo))
+            os.makedirs(directorio, exist_ok=True)
+            with open(self.ruta_bloqueo, "a+b") as f:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _escribir_atomico(self, ruta, escribir):
+        """Escribe en un temporal, hace fsync y lo renombra sobre `ruta`."""
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporal, "w", encoding="utf-8") as f:
+                escribir(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, ruta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def _append(self, *operaciones):
+        """
+        Añade operaciones al log con una sola escritura y un solo fsync. Si la última
+        línea quedó truncada por una caída anterior, se recorta antes de escribir
+        para no corromper las nuevas.
+        """
+        linea = "".join(json.dumps(operacion, ensure_ascii=False) + "\n" for operacion in operaciones).encode("utf-8")
+        with open(self.ruta_log, "a+b") as f:
+            f.seek(0, os.SEEK_END)
+            tamano = f.tell()
+            if tamano:
+                f.seek(tamano - 1)
+                if f.read(1) != b"\n":
+                    self._reparar_cola(f, tamano)
+            f.write(linea)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _reparar_cola(self, f, tamano):
+        """Recorta la última línea incompleta del log (escritura interrumpida)."""
+        bloque = min(tamano, 64 * 1024)
+        while True:
+            f.seek(tamano - bloque)
+            datos = f.read(bloque)
+            corte = datos.rfind(b"\n")
+            if corte != -1 or bloque == tamano:
+                break
+            bloque = min(tamano, bloque * 2)
+        nuevo_tamano = tamano - bloque + corte + 1 if corte != -1 else 0
+        logger.warning("Historial: se descartan %d bytes de una escritura incompleta.", tamano - nuevo_tamano)
+        f.truncate(nuevo_tamano)
+        f.seek(0, os.SEEK_END)
+
+    # --- Metadatos ---
+    def _meta_vacia(self):
+        return {"ultimo_id": 0, "agregados": 0, "borrados": 0, "generacion": 0}
+
+    def _leer_meta(self):
+        try:
+            with open(self.ruta_meta, "r", encoding="utf-8") as f:
+                return {**self._meta_vacia(), **json.load(f)}
+        except (OSError, ValueError):
+            if os.path.exists(self.ruta_log):
+                return self._reconstruir_meta()
+            return self._meta_vacia()
+
+    def _reconstruir_meta(self):
+        """Recalcula los metadatos recorriendo el log (solo si se perdieron)."""
+        logger.warning("Historial: metadatos ausentes o dañados; se reconstruyen desde %s.", self.ruta_log)
+        meta = self._meta_vacia()
+        for operacion in self.iterar_operaciones():
+            if operacion["op"] == "add":
+                meta["agregados"] += 1
+                meta["ultimo_id"] = max(meta["ultimo_id"], operacion["registro"]["id"])
+            elif operacion["op"] == "del":
+                meta["borrados"] += len(operacion["ids"])
+        return meta
+
+    def _escribir_meta(self, meta):
+        self._escribir_atomico(self.ruta_meta, lambda f: json.dump(meta, f))
+
+    # --- Migración desde el JSON antiguo ---
+    def migrar_legado(self):
+        """
+        Convierte una sola vez el archivo JSON antiguo (lista de registros) al log.
+        El archivo original se conserva renombrado con el sufijo `.migrado`.
+        """
+        if not self.ruta_legado or not os.path.exists(self.ruta_legado) or os.path.exists(self.ruta_log):
+            return 0
+        with self._bloqueo():
+            if not os.path.exists(self.ruta_legado) or os.path.exists(self.ruta_log):
+                return 0
+            with open(self.ruta_legado, "r", encoding="utf-8") as f:
+                try:
+                    registros = json.load(f)
+                except json.JSONDecodeError:
+                    # No se pierde nada: el archivo dañado se aparta para revisarlo a mano.
+                    logger.error("Historial: %s está dañado; se guarda como .corrupto.", self.ruta_legado)
+                    os.replace(self.ruta_legado, f"{self.ruta_legado}.corrupto")
+                    return 0
+
+            def escribir(f):
+                for registro in registros:
+                    f.write(json.dumps({"op": "add", "registro": registro}, ensure_ascii=False) + "\n")
+            self._escribir_atomico(self.ruta_log, escribir)
+
+            meta = self._meta_vacia()
+            meta["ultimo_id"] = max((r["id"] for r in registros), default=0)
+            meta["agregados"] = len(registros)
+            self._escribir_meta(meta)
+            os.replace(self.ruta_legado, f"{self.ruta_legado}.migrado")
+            return len(registros)
+
+    # --- Operaciones ---
+    def agregar(self, registro):
+        """
+        Asigna un id nuevo al registro y lo añade al final del log. Coste O(1).
+        Devuelve el registro con su id.
+        """
+        self.migrar_legado()
+        with self._bloqueo():
+            meta = self._leer_meta()
+            meta["ultimo_id"] += 1
+            meta["agregados"] += 1
+            registro = {"id": meta["ultimo_id"], **registro}
+            # El contador se confirma antes del append: si el proceso cae entre
+            # ambos pasos queda un hueco en los ids, nunca un id duplicado.
+            self._escribir_meta(meta)
+            self._append({"op": "add", "registro": registro})
+        return registro
+
+    def agregar_lote(self, registros):
+        """
+        Como `agregar`, pero para muchos registros a la vez: un solo bloqueo, una
+        escritura de metadatos y un append. Devuelve los registros con sus ids.
+        """
+        registros = list(registros)
+        if not registros:
+            return []
+        self.migrar_legado()
+        with self._bloqueo():
+            meta = self._leer_meta()
+            primero = meta["ultimo_id"] + 1
+            meta["ultimo_id"] += len(registros)
+            meta["agregados"] += len(registros)
+            registros = [
+                {"id": id_registro, **{k: v for k, v in registro.items() if k != "id"}}
+                for id_registro, registro in enumerate(registros, primero)
+            ]
+            self._escribir_meta(meta)
+            self._append(*({"op": "add", "registro": registro} for registro in registros))
+        return registros
+
+    def borrar(self, ids):
+        """Marca los ids como borrados añadiendo un tombstone al log. Coste O(1)."""
+        ids = list(ids)
+        if not ids:
+            return
+        self.migrar_legado()
+        with self._bloqueo():
+            meta = self._leer_meta()
+            meta["borrados"] += len(ids)
+            self._escribir_meta(meta)
+            self._append({"op": "del", "ids": ids})
+            necesita_compactar = (
+                meta["borrados"] >= COMPACTAR_MIN_BORRADOS
+                and meta["borrados"] >= meta["agregados"] * COMPACTAR_PROPORCION
+            )
+        if necesita_compactar:
+            self.compactar_en_segundo_plano()
+
+    def iterar_operaciones(self, hasta=None):
+        """
+        Recorre las operaciones del log en orden (opcionalmente hasta un offset en bytes).
+        Las líneas ilegibles (p. ej. una escritura cortada por una caída) se saltan
+        con un aviso en el log en vez de invalidar todo el historial.
+        """
+        if not os.path.exists(self.ruta_log):
+            return
+        with open(self.ruta_log, "rb") as f:
+            leidos = 0
+            for linea in f:
+                leidos += len(linea)
+                if hasta is not None and leidos > hasta:
+                    break
+                if not linea.strip():
+                    continue
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    logger.warning("Historial: se ignora una línea dañada en %s.", self.ruta_log)
+
+    def iterar_registros(self):
+        """
+        Recorre los registros vivos en orden de inserción sin cargarlos todos en
+        memoria: una primera pasada reúne solo los ids borrados y la segunda va
+        devolviendo las altas. Ambas pasadas leen el mismo archivo abierto, así que
+        una compactación simultánea no les afecta.
+        """
+        self.migrar_legado()
+        try:
+            f = open(self.ruta_log, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            borrados = set()
+            for linea in f:
+                # Las operaciones se escriben con json.dumps, así que el prefijo identifica los borrados.
+                if linea.startswith(b'{"op": "del"'):
+                    try:
+                        borrados.update(json.loads(linea)["ids"])
+                    except ValueError:
+                        pass
+            f.seek(0)
+            for linea in f:
+                if not linea.startswith(b'{"op": "add"'):
+                    continue
+                try:
+                    registro = json.loads(linea)["registro"]
+                except ValueError:
+                    logger.warning("Historial: se ignora una línea dañada en %s.", self.ruta_log)
+                    continue
+                if registro["id"] not in borrados:
+                    yield registro
+
+    def leer_cambios(self, cursor=None):
+        """
+        Devuelve las operaciones añadidas desde `cursor` = (generacion, offset).
+        Resultado: (operaciones, nuevo_cursor, reinicio), donde cada operación va
+        acompañada de su posición (offset, longitud) en el log. Si el log se compactó o
+        se limpió desde entonces, `reinicio` es True y se devuelven todas las
+        operaciones desde el principio, para que el consumidor rehaga su estado.
+        """
+        self.migrar_legado()
+        while True:
+            meta = self._leer_meta()
+            if meta.get("compactando"):
+                self._esperar_compactacion()
+                continue
+            generacion = meta["generacion"]
+            reinicio = cursor is None or cursor[0] != generacion
+            offset = 0 if reinicio else cursor[1]
+            operaciones = []
+            danadas = 0
+            try:
+                with open(self.ruta_log, "rb") as f:
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() < offset:
+                        reinicio, offset = True, 0
+                    f.seek(offset)
+                    for linea in f:
+                        if not linea.endswith(b"\n"):
+                            break  # escritura en curso: se leerá en la próxima llamada
+                        posicion = (offset, len(linea))
+                        offset += len(linea)
+                        if not linea.strip():
+                            continue
+                        try:
+                            operaciones.append((posicion, json.loads(linea)))
+                        except ValueError:
+                            danadas += 1
+            except FileNotFoundError:
+                offset = 0
+            meta = self._leer_meta()
+            if meta["generacion"] == generacion and not meta.get("compactando"):
+                # Las líneas dañadas de una lectura que se repite no cuentan (era el log anterior).
+                if danadas:
+                    logger.warning("Historial: se ignoran %d líneas dañadas en %s.", danadas, self.ruta_log)
+                return operaciones, (generacion, offset), reinicio
+
+    def _esperar_compactacion(self):
+        """
+        Espera a que termine la compactación en curso (la hace bajo el bloqueo). Si
+        la marca sigue ahí con el bloqueo libre, la dejó una compactación que se
+        cayó a medias y se quita.
+        """
+        with self._bloqueo():
+            meta = self._leer_meta()
+            if meta.pop("compactando", None):
+                self._escribir_meta(meta)
+
+    def leer_registros(self, posiciones):
+        """
+        Lee directamente los registros de las posiciones (offset, longitud) dadas,
+        sin recorrer el resto del log. Devuelve None si alguna posición ya no
+        corresponde a un alta (el log se compactó entre medias) para que el
+        llamante se resincronice y repita.
+        """
+        registros = []
+        try:
+            with open(self.ruta_log, "rb") as f:
+                for offset, longitud in posiciones:
+                    f.seek(offset)
+                    try:
+                        operacion = json.loads(f.read(longitud))
+                    except ValueError:
+                        return None
+                    if operacion.get("op") != "add":
+                        return None
+                    registros.append(operacion["registro"])
+        except FileNotFoundError:
+            return None if posiciones else []
+        return registros
+
+    def cargar(self):
+        """Reconstruye la lista de registros vivos, en orden de inserción."""
+        self.migrar_legado()
+        registros = {}
+        for operacion in self.iterar_operaciones():
+            self._aplicar(registros, operacion)
+        return list(registros.values())
+
+    @staticmethod
+    def _aplicar(registros, operacion):
+        """Aplica una operación del log sobre un diccionario {id: registro}."""
+        if operacion["op"] == "add":
+            registros[operacion["registro"]["id"]] = operacion["registro"]
+        elif operacion["op"] == "del":
+            for id_borrado in operacion["ids"]:
+                registros.pop(id_borrado, None)
+
+    def limpiar(self):
+        """
+        Elimina el log y el JSON antiguo si no se había migrado. Los metadatos se
+        reinician pero la generación avanza, para que las vistas sepan que deben rehacerse.
+        """
+        with self._bloqueo():
+            generacion = self._leer_meta()["generacion"]
+            for ruta in (self.ruta_log, self.ruta_legado):
+                if ruta and os.path.exists(ruta):
+                    os.remove(ruta)
+            meta = self._meta_vacia()
+            meta["generacion"] = generacion + 1
+            self._escribir_meta(meta)
+
+    # --- Compactación ---
+    def compactar(self):
+        """
+        Reescribe el log dejando solo los registros vivos (sin tombstones).
+        La parte pesada (leer y reescribir) se hace sin bloqueo sobre una foto
+        del log; bajo bloqueo solo se copian las operaciones llegadas mientras
+        tanto y se hace el rename atómico.
+
+        `leer_cambios` no toma el bloqueo, así que la nueva generación se publica
+        antes del rename, con la marca "compactando": un lector que la ve espera,
+        y uno que leyó la meta antes ve cambiar la generación y repite. Así nunca
+        aplica un offset de la generación anterior sobre el log nuevo.
+        """
+        with self._bloqueo():
+            if not os.path.exists(self.ruta_log):
+                return
+            foto = os.path.getsize(self.ruta_log)
+            generacion = self._leer_meta()["generacion"]
+
+        registros = {}
+        for operacion in self.iterar_operaciones(hasta=foto):
+            self._aplicar(registros, operacion)
+
+        temporal = f"{self.ruta_log}.{os.getpid()}.compactando"
+        try:
+            with open(temporal, "wb") as f:
+                for registro in registros.values():
+                    f.write((json.dumps({"op": "add", "registro": registro}, ensure_ascii=False) + "\n").encode("utf-8"))
+
+            with self._bloqueo():
+                meta = self._leer_meta()
+                if meta["generacion"] != generacion:
+                    # Otro proceso compactó mientras tanto: la foto ya no vale.
+                    return
+                with open(self.ruta_log, "rb") as original:
+                    original.seek(foto)
+                    cola = original.read()
+                with open(temporal, "ab") as f:
+                    f.write(cola)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                meta["agregados"] = len(registros) + cola.count(b'"op": "add"')
+                meta["borrados"] = cola.count(b'"op": "del"')
+                meta["generacion"] += 1
+                self._escribir_meta({**meta, "compactando": True})
+                os.replace(temporal, self.ruta_log)
+                self._escribir_meta(meta)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+
+    def compactar_en_segundo_plano(self):
+        """Lanza la compactación en un hilo aparte si no hay otra en curso."""
+        with self._lock:
+            if self._compactando:
+                return
+            self._compactando = True
+
+        def tarea():
+            try:
+                self.compactar()
+            finally:
+                self._compactando = False
+
+        threading.Thread(target=tarea, name="compactacion-historial", daemon=True).start()
+
+class VistaHistorial:
+    """
+    Base para estructuras derivadas del historial (índices, cachés, agregados)
+    que se mantienen al día leyendo solo las operaciones nuevas del log.
+    Las subclases implementan `_reiniciar`, `_al_agregar` y `_al_borrar`.
+    """
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+        self._cursor = None
+        self._lock_vista = threading.RLock()
+
+    def sincronizar(self):
+        """Aplica las operaciones del log que aún no se han procesado."""
+        with self._lock_vista:
+            operaciones, cursor, reinicio = self.almacen.leer_cambios(self._cursor)
+            if reinicio:
+                self._reiniciar()
+            for posicion, operacion in operaciones:
+                if operacion["op"] == "add":
+                    self._al_agregar(operacion["registro"], posicion)
+                elif operacion["op"] == "del":
+                    self._al_borrar(operacion["ids"])
+            self._cursor = cursor
+            return bool(operaciones) or reinicio
+
+    @property
+    def inicializada(self):
+        return self._cursor is not None
+
+    def _reiniciar(self):
+        raise NotImplementedError
+
+    def _al_agregar(self, registro, posicion):
+        raise NotImplementedError
+
+    def _al_borrar(self, ids):
+        raise NotImplementedError
+
+class RegistrosEnMemoria(VistaHistorial):
+    """Copia en memoria de los registros vivos, actualizada de forma incremental."""
+
+    def __init__(self, almacen):
+        super().__init__(almacen)
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.registros = {}
+
+    def _al_agregar(self, registro, posicion):
+        self.registros[registro["id"]] = registro
+
+    def _al_borrar(self, ids):
+        for id_registro in ids:
+            self.registros.pop(id_registro, None)
+
+    def lista(self):
+        """Registros vivos en orden de inserción."""
+        self.sincronizar()
+        with self._lock_vista:
+            return list(self.registros.values())
+
+class IndicePaginas(VistaHistorial):
+    """
+    Índice id -> posición en el log, en orden de inserción. Permite servir una
+    página del historial leyendo solo sus registros, sin cargar el resto en memoria.
+    """
+
+    def __init__(self, almacen):
+        super().__init__(almacen)
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.posiciones = {}
+
+    def _al_agregar(self, registro, posicion):
+        self.posiciones.pop(registro["id"], None)
+        self.posiciones[registro["id"]] = posicion
+
+    def _al_borrar(self, ids):
+        for id_registro in ids:
+            self.posiciones.pop(id_registro, None)
+
+    def total(self):
+        self.sincronizar()
+        return len(self.posiciones)
+
+    def pagina(self, numero, tamano, mas_recientes_primero=True):
+        """
+        Devuelve (registros, total) de la página `numero` (empezando en 1).
+        """
+        for _ in range(3):
+            self.sincronizar()
+            with self._lock_vista:
+                ids = list(self.posiciones)
+                total = len(ids)
+                if mas_recientes_primero:
+                    ids.reverse()
+                inicio = max(numero - 1, 0) * tamano
+                posiciones = [self.posiciones[i] for i in ids[inicio:inicio + tamano]]
+            registros = self.almacen.leer_registros(posiciones)
+            if registros is not None:
+                return registros, total
+            # El log cambió de generación mientras leíamos: se fuerza la resincronización.
+            with self._lock_vista:
+                self._cursor = None
+        return [], 0
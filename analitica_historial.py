@@ -0,0 +1,221 @@
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+from almacen_historial import VistaHistorial
+from analizador_scripts import ORIGEN_MODELO, SECCIONES_CON_PUNTUACION
+
+# --- Analítica de puntuaciones del historial ---
+# Cada registro guardado con su análisis lleva "puntuaciones" ({dimensión: 0-100})
+# y, opcionalmente, un "nicho". La vista las guarda en columnas NumPy (una fila
+# por registro) y mantiene, por nicho, por semana ISO y por (nicho, semana), un
+# histograma exacto de 101 niveles por dimensión. Con los histogramas, un alta o
+# un borrado es sumar o restar 1 en una celda, y la media y los percentiles salen
+# de ellos sin recorrer los registros. Tras reconstruir la vista (arranque o
+# compactación del log) los histogramas se rehacen de golpe con `np.bincount`.
+
+DIMENSIONES = SECCIONES_CON_PUNTUACION
+DIMENSION_GANCHO = "Gancho (Hook)"
+NICHOS = ["Inteligencia Artificial", "Formula 1", "Marketing Digital", "Mindset", "Mascotas"]
+SIN_NICHO = "Sin nicho"
+SIN_FECHA = "sin fecha"
+AGRUPACIONES = ("nicho", "semana", "nicho_semana")
+NIVELES = 101
+
+@lru_cache(maxsize=4096)
+def _semana_de_dia(dia):
+    try:
+        anio, semana, _ = date.fromisoformat(dia).isocalendar()
+    except ValueError:
+        return SIN_FECHA
+    return f"{anio}-W{semana:02d}"
+
+def semana_de(fecha):
+    """Semana ISO ("2024-W05") de una fecha "AAAA-MM-DD ...", o SIN_FECHA."""
+    return _semana_de_dia(str(fecha)[:10])
+
+def puntuaciones_registro(registro):
+    """
+    Puntuaciones en el orden de DIMENSIONES (lista de enteros 0-100); -1 donde falta.
+    Solo cuentan las del modelo: las del analizador local se tratan como ausentes.
+    """
+    puntuaciones = registro.get("puntuaciones")
+    if not puntuaciones or registro.get("origen_puntuaciones", ORIGEN_MODELO) != ORIGEN_MODELO:
+        return [-1] * len(DIMENSIONES)
+    return [min(100, max(0, int(valor))) if (valor := puntuaciones.get(d)) is not None else -1 for d in DIMENSIONES]
+
+class HistogramasPorGrupo:
+    """
+    Histogramas exactos (grupo, dimensión, nivel 0-100) de puntuaciones. Admiten
+    altas y bajas en O(1) y se pueden reconstruir en bloque.
+    """
+
+    def __init__(self):
+        self.claves = []
+        self.codigos = {}
+        self.conteos = np.zeros((0, len(DIMENSIONES), NIVELES), dtype=np.int64)
+
+    def codigo(self, clave):
+        """Código del grupo `clave`, creándolo si es nuevo."""
+        codigo = self.codigos.get(clave)
+        if codigo is None:
+            codigo = self.codigos[clave] = len(self.claves)
+            self.claves.append(clave)
+            if codigo >= len(self.conteos):
+                extra = np.zeros((max(8, len(self.conteos)), len(DIMENSIONES), NIVELES), dtype=np.int64)
+                self.conteos = np.concatenate([self.conteos, extra])
+        return codigo
+
+    def actualizar(self, codigo, puntuaciones, signo):
+        dimensiones = np.flatnonzero(puntuaciones >= 0)
+        self.conteos[codigo, dimensiones, puntuaciones[dimensiones]] += signo
+
+    def reconstruir(self, codigos, puntuaciones):
+        """Rehace todos los histogramas a partir de las columnas (n,) y (n, dimensiones)."""
+        filas, dimensiones = np.nonzero(puntuaciones >= 0)
+        celdas = (codigos[filas].astype(np.int64) * len(DIMENSIONES) + dimensiones) * NIVELES + puntuaciones[filas, dimensiones]
+        tamano = len(self.conteos) * len(DIMENSIONES) * NIVELES
+        self.conteos = np.bincount(celdas, minlength=tamano).reshape(self.conteos.shape)
+
+    def estadisticas(self, codigos, percentiles=(50, 90)):
+        """
+        (totales, medias, {p: percentiles}) de los grupos dados, cada uno de forma
+        (len(codigos), dimensiones). Donde no hay puntuaciones el resultado es NaN.
+        """
+        conteos = self.conteos[codigos]
+        totales = conteos.sum(axis=2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            medias = (conteos @ np.arange(NIVELES)) / totales
+        acumulados = conteos.cumsum(axis=2)
+        resultado = {}
+        for p in percentiles:
+            umbral = np.maximum(1, np.ceil(totales * p / 100))
+            nivel = (acumulados >= umbral[..., None]).argmax(axis=2).astype(float)
+            nivel[totales == 0] = np.nan
+            resultado[p] = nivel
+        return totales, medias, resultado
+
+class AnaliticaHistorial(VistaHistorial):
+    """
+    Columnas de puntuaciones, nicho y semana de cada registro del historial, con
+    agregados por nicho, por semana y por (nicho, semana) al día de forma incremental.
+    """
+
+    def __init__(self, almacen):
+        super().__init__(almacen)
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.fila_por_id = {}
+        self._n = 0
+        self.agregados = {agrupacion: HistogramasPorGrupo() for agrupacion in AGRUPACIONES}
+        # Tras un reinicio los histogramas se rehacen en bloque en la primera consulta.
+        self._al_dia = False
+        self._reservar(1024)
+
+    def _reservar(self, capacidad):
+        self._puntuaciones = np.full((capacidad, len(DIMENSIONES)), -1, dtype=np.int16)
+        self._grupos = np.zeros((capacidad, len(AGRUPACIONES)), dtype=np.int32)
+        self._vivas = np.zeros(capacidad, dtype=bool)
+
+    def _crecer(self):
+        n, capacidad = self._n, len(self._vivas)
+        anteriores = (self._puntuaciones, self._grupos, self._vivas)
+        self._reservar(capacidad * 2)
+        for nueva, anterior in zip((self._puntuaciones, self._grupos, self._vivas), anteriores):
+            nueva[:n] = anterior[:n]
+
+    def _actualizar_agregados(self, fila, signo):
+        for columna, agrupacion in enumerate(AGRUPACIONES):
+            self.agregados[agrupacion].actualizar(self._grupos[fila, columna], self._puntuaciones[fila], signo)
+
+    def _al_agregar(self, registro, posicion):
+        self._al_borrar([registro["id"]])
+        if self._n == len(self._vivas):
+            self._crecer()
+        fila = self._n
+        nicho = registro.get("nicho") or SIN_NICHO
+        semana = semana_de(registro.get("fecha"))
+        self._grupos[fila] = [
+            self.agregados[agrupacion].codigo(clave)
+            for agrupacion, clave in zip(AGRUPACIONES, (nicho, semana, (nicho, semana)))
+        ]
+        self._puntuaciones[fila] = puntuaciones_registro(registro)
+        self._vivas[fila] = True
+        self.fila_por_id[registro["id"]] = fila
+        self._n += 1
+        if self._al_dia:
+            self._actualizar_agregados(fila, 1)
+
+    def _al_borrar(self, ids):
+        for id_registro in ids:
+            fila = self.fila_por_id.pop(id_registro, None)
+            if fila is not None:
+                self._vivas[fila] = False
+                if self._al_dia:
+                    self._actualizar_agregados(fila, -1)
+
+    def recalcular(self):
+        """Reconstruye todos los agregados desde las columnas, vectorizado."""
+        with self._lock_vista:
+            vivas = np.flatnonzero(self._vivas[:self._n])
+            for columna, agrupacion in enumerate(AGRUPACIONES):
+                self.agregados[agrupacion].reconstruir(self._grupos[vivas, columna], self._puntuaciones[vivas])
+            self._al_dia = True
+
+    def _sincronizar_agregados(self):
+        self.sincronizar()
+        if not self._al_dia:
+            self.recalcular()
+
+    def resumen(self, agrupacion="nicho", percentiles=(50, 90)):
+        """
+        Una fila por grupo de `agrupacion` ("nicho", "semana" o "nicho_semana") con,
+        por dimensión, el número de puntuaciones, la media y los percentiles pedidos.
+        """
+        with self._lock_vista:
+            self._sincronizar_agregados()
+            histogramas = self.agregados[agrupacion]
+            codigos = np.arange(len(histogramas.claves))
+            totales, medias, por_percentil = histogramas.estadisticas(codigos, percentiles)
+            filas = []
+            for codigo, clave in enumerate(histogramas.claves):
+                if not totales[codigo].any():
+                    continue
+                dimensiones = {}
+                for d, dimension in enumerate(DIMENSIONES):
+                    if not totales[codigo, d]:
+                        continue
+                    dimensiones[dimension] = {
+                        "n": int(totales[codigo, d]),
+                        "media": float(medias[codigo, d]),
+                        **{f"p{p}": int(por_percentil[p][codigo, d]) for p in percentiles},
+                    }
+                filas.append({"grupo": clave, "registros": int(totales[codigo].max()), "dimensiones": dimensiones})
+            return sorted(filas, key=lambda fila: str(fila["grupo"]))
+
+    def tendencia_gancho(self, nicho=None):
+        """
+        Media semanal de la puntuación del gancho (de un nicho o de todo el historial)
+        y su pendiente en puntos por semana (regresión lineal; None con menos de dos semanas).
+        """
+        d = DIMENSIONES.index(DIMENSION_GANCHO)
+        with self._lock_vista:
+            self._sincronizar_agregados()
+            if nicho is None:
+                histogramas = self.agregados["semana"]
+                grupos = [(semana, codigo) for semana, codigo in histogramas.codigos.items()]
+            else:
+                histogramas = self.agregados["nicho_semana"]
+                grupos = [(semana, codigo) for (n, semana), codigo in histogramas.codigos.items() if n == nicho]
+            grupos = sorted((semana, codigo) for semana, codigo in grupos if semana != SIN_FECHA)
+            totales, medias, _ = histogramas.estadisticas([codigo for _, codigo in grupos], percentiles=())
+        semanas = [semana for (semana, _), total in zip(grupos, totales[:, d]) if total] if grupos else []
+        valores = [float(media) for media, total in zip(medias[:, d], totales[:, d]) if total] if grupos else []
+
+        pendiente = None
+        if len(semanas) >= 2:
+            x = [date.fromisocalendar(int(s[:4]), int(s[6:]), 1).toordinal() / 7 for s in semanas]
+            pendiente = float(np.polyfit(x, valores, 1)[0])
+        return {"semanas": semanas, "medias": valores, "pendiente": pendiente}
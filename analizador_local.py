@@ -0,0 +1,209 @@
+import re
+
+import numpy as np
+
+from analizador_scripts import ORDERED_SECTION_TITLES, ORIGEN_LOCAL, SECCIONES_CON_PUNTUACION
+
+# --- Análisis heurístico local ---
+# Estima en microsegundos las mismas dimensiones que el análisis de Gemini a
+# partir de rasgos del texto (longitud, gancho, CTA, escenas, frases...). La
+# extracción de rasgos es una pasada de regex por script; la puntuación se hace
+# en bloque con NumPy sobre la matriz de rasgos, así que puntuar miles de
+# scripts del historial cuesta lo mismo que construir esa matriz.
+
+# Velocidad de locución típica en reels (~150 palabras por minuto).
+PALABRAS_POR_SEGUNDO = 2.5
+
+PALABRA_REGEX = re.compile(r"\w+", re.UNICODE)
+FRASE_REGEX = re.compile(r"[^.!?¿¡\n]+[.!?]*")
+ESCENA_REGEX = re.compile(r"^\W*escena\s*\d+", re.IGNORECASE | re.MULTILINE)
+CABECERA_REGEX = re.compile(r"^\W*(t[íi]tulo|gancho|desarrollo del contenido|llamada a la acci[óo]n|"
+                            r"elementos visuales/sonido)\W*:?\**\s*", re.IGNORECASE | re.MULTILINE)
+EMOJI_REGEX = re.compile("[\U0001F300-\U0001FAFF☀-➿]")
+SEGUNDA_PERSONA = {"tú", "tu", "te", "ti", "tus", "contigo", "usted", "vosotros", "os"}
+VERBOS_CTA = re.compile(
+    r"\b(s[íi]gue(me|nos)?|comenta|comparte|guarda|suscr[íi]bete|dale like|link|enlace|compra|"
+    r"visita|descarga|escr[íi]be(me|nos)?|etiqueta|activa la campanita)\b", re.IGNORECASE)
+IMPERATIVO_INICIAL = re.compile(
+    r"^\W*(mira|descubre|imagina|olvida|deja|para|escucha|aprende|evita|haz|prueba|no hagas)\b", re.IGNORECASE)
+CLICHES = re.compile(
+    r"(lo que nadie te cuenta|no vas a creer|te va a volar la cabeza|quédate hasta el final|"
+    r"esto cambiará tu vida|el secreto que)", re.IGNORECASE)
+
+# Columnas de la matriz de rasgos.
+RASGOS = (
+    "palabras", "palabras_gancho", "gancho_pregunta", "gancho_imperativo", "gancho_numero",
+    "cta_presente", "cta_verbos", "escenas", "palabras_por_frase", "proporcion_frases_largas",
+    "segunda_persona", "exclamaciones", "emojis", "diversidad_lexica", "cliches", "visuales",
+)
+_COL = {nombre: i for i, nombre in enumerate(RASGOS)}
+
+def _bloques(texto):
+    """
+    Texto de cada cabecera del formato de script (**Gancho:**, **Llamada a la Acción:**...)
+    hasta la siguiente, indexado por la primera palabra de la cabecera en minúsculas.
+    """
+    cabeceras = list(CABECERA_REGEX.finditer(texto))
+    bloques = {}
+    for i, match in enumerate(cabeceras):
+        fin = cabeceras[i + 1].start() if i + 1 < len(cabeceras) else len(texto)
+        bloques.setdefault(match.group(1).split()[0].lower(), texto[match.end():fin].strip())
+    return bloques
+
+def extraer_rasgos(script_texto):
+    """Vector de rasgos (en el orden de RASGOS) de un script."""
+    palabras = PALABRA_REGEX.findall(script_texto)
+    n_palabras = len(palabras)
+    frases = [f for f in (m.group(0).strip() for m in FRASE_REGEX.finditer(script_texto)) if PALABRA_REGEX.search(f)]
+    longitudes = [len(PALABRA_REGEX.findall(f)) for f in frases] or [0]
+    bloques = _bloques(script_texto)
+
+    gancho = bloques.get("gancho")
+    if gancho is None:
+        gancho = frases[0] if frases else ""
+    cta = bloques.get("llamada")
+    if cta is None:
+        # Sin cabecera, se busca la CTA en el último tramo del script.
+        cta = script_texto[-max(200, len(script_texto) // 5):]
+    verbos_cta = len(VERBOS_CTA.findall(cta))
+
+    escenas = len(ESCENA_REGEX.findall(script_texto))
+    if not escenas:
+        escenas = len([l for l in bloques.get("desarrollo", "").splitlines() if l.strip()])
+
+    minusculas = [p.lower() for p in palabras]
+    return (
+        n_palabras,
+        len(PALABRA_REGEX.findall(gancho)),
+        "?" in gancho,
+        bool(IMPERATIVO_INICIAL.search(gancho)),
+        bool(re.search(r"\d", gancho)),
+        bool(verbos_cta) or "llamada" in bloques,
+        verbos_cta,
+        escenas,
+        sum(longitudes) / len(longitudes),
+        sum(l > 20 for l in longitudes) / len(longitudes),
+        sum(p in SEGUNDA_PERSONA for p in minusculas) / max(n_palabras, 1),
+        script_texto.count("!") + script_texto.count("¡"),
+        len(EMOJI_REGEX.findall(script_texto)),
+        len(set(minusculas)) / max(n_palabras, 1),
+        len(CLICHES.findall(script_texto)),
+        "elementos" in bloques,
+    )
+
+def matriz_rasgos(scripts):
+    """Matriz (n_scripts, len(RASGOS)) en float64."""
+    return np.array([extraer_rasgos(s) for s in scripts], dtype=np.float64).reshape(-1, len(RASGOS))
+
+def _campana(x, minimo, maximo, caida):
+    """1 dentro de [minimo, maximo] y baja linealmente a 0 a `caida` unidades de distancia."""
+    distancia = np.maximum(minimo - x, 0) + np.maximum(x - maximo, 0)
+    return np.clip(1 - distancia / caida, 0, 1)
+
+def puntuar_rasgos(rasgos):
+    """
+    Puntúa en bloque una matriz de rasgos. Devuelve (puntuaciones, segundos):
+    `puntuaciones` es (n, len(SECCIONES_CON_PUNTUACION)) con enteros 0-100 en el
+    orden de SECCIONES_CON_PUNTUACION y `segundos` la duración hablada estimada.
+    """
+    r = {nombre: rasgos[:, i] for nombre, i in _COL.items()}
+    segundos = r["palabras"] / PALABRAS_POR_SEGUNDO
+
+    tono = 45 + 25 * np.clip(r["segunda_persona"] / 0.04, 0, 1) \
+        + 15 * np.clip(r["exclamaciones"] / 3, 0, 1) + 15 * np.clip(r["emojis"] / 3, 0, 1)
+    # Un gancho de 3-5 segundos son ~8-13 palabras.
+    gancho = 40 * _campana(r["palabras_gancho"], 6, 14, 12) + 25 * r["gancho_pregunta"] \
+        + 20 * r["gancho_imperativo"] + 15 * r["gancho_numero"]
+    gancho = np.where(r["palabras_gancho"] > 0, gancho, 0)
+    desarrollo = 30 + 50 * _campana(r["escenas"], 3, 6, 3) + 20 * r["visuales"]
+    cta = np.where(r["cta_presente"] > 0, 60 + 20 * np.clip(r["cta_verbos"] / 2, 0, 1), 10)
+    originalidad = 30 + 70 * np.clip((r["diversidad_lexica"] - 0.35) / 0.35, 0, 1) - 15 * r["cliches"]
+    claridad = 100 * _campana(r["palabras_por_frase"], 5, 15, 15) - 40 * r["proporcion_frases_largas"]
+
+    puntuaciones = np.stack([tono, gancho, desarrollo, cta, originalidad, claridad], axis=1)
+    # Un script vacío no puntúa.
+    puntuaciones = np.where(r["palabras"][:, None] > 0, puntuaciones, 0)
+    return np.clip(np.rint(puntuaciones), 0, 100).astype(np.int64), segundos
+
+def puntuar_lote(scripts):
+    """Puntúa una lista de scripts. Ver `puntuar_rasgos`."""
+    return puntuar_rasgos(matriz_rasgos(scripts))
+
+def _sugerencias(r, segundos, duracion):
+    sugerencias = {
+        "Tono y Estilo": "Háblale directamente al espectador (tú/te) y añade algún emoji o exclamación."
+        if r["segunda_persona"] < 0.02 else "",
+        "Gancho (Hook)": "Convierte el gancho en una pregunta o un dato concreto de 3-5 segundos (8-13 palabras)."
+        if not (r["gancho_pregunta"] or r["gancho_numero"]) or not 6 <= r["palabras_gancho"] <= 14 else "",
+        "Desarrollo del Contenido": "Organiza el desarrollo en 3-6 escenas cortas."
+        if not 3 <= r["escenas"] <= 6 else "",
+        "Llamada a la Acción (CTA - Call To Action)": "Cierra con una acción concreta: comenta, guarda o sigue la cuenta."
+        if not r["cta_verbos"] else "",
+        "Originalidad y Creatividad": "Evita frases hechas y busca un ángulo propio."
+        if r["cliches"] or r["diversidad_lexica"] < 0.5 else "",
+        "Claridad y Concisión": "Parte las frases de más de 20 palabras."
+        if r["proporcion_frases_largas"] > 0 else "",
+    }
+    if segundos > duracion * 1.15:
+        sugerencias["Longitud y Ritmo"] = f"Recorta unas {int((segundos - duracion) * PALABRAS_POR_SEGUNDO)} palabras."
+    elif segundos < duracion * 0.6:
+        sugerencias["Longitud y Ritmo"] = "Hay margen para otra escena o un dato más."
+    else:
+        sugerencias["Longitud y Ritmo"] = ""
+    return sugerencias
+
+def analizar_local(script_texto, duracion=30):
+    """
+    Análisis heurístico de un script con el mismo formato que
+    `analizador_scripts.obtener_analisis` ({"texto", "secciones", "error"}), más
+    "origen": ORIGEN_LOCAL para no confundir sus puntuaciones con las del modelo.
+    """
+    if not script_texto.strip():
+        return {"texto": "", "secciones": [], "error": None, "origen": ORIGEN_LOCAL}
+
+    rasgos = matriz_rasgos([script_texto])
+    puntuaciones, segundos = puntuar_rasgos(rasgos)
+    puntuaciones, segundos, rasgos = puntuaciones[0], float(segundos[0]), rasgos[0]
+    por_dimension = dict(zip(SECCIONES_CON_PUNTUACION, (int(p) for p in puntuaciones)))
+    r = {nombre: rasgos[i] for nombre, i in _COL.items()}
+    forma_gancho = "".join((
+        ", en forma de pregunta" if r["gancho_pregunta"] else "",
+        ", con imperativo" if r["gancho_imperativo"] else "",
+        ", con un dato numérico" if r["gancho_numero"] else "",
+    ))
+    cliches = f" y {r['cliches']:.0f} frases hechas" if r["cliches"] else ""
+    descripciones = {
+        "Tono y Estilo": f"{r['exclamaciones']:.0f} exclamaciones, {r['emojis']:.0f} emojis y "
+                         f"{r['segunda_persona']:.0%} de palabras dirigidas al espectador.",
+        "Gancho (Hook)": f"{r['palabras_gancho']:.0f} palabras{forma_gancho}.",
+        "Desarrollo del Contenido": f"{r['escenas']:.0f} escenas.",
+        "Llamada a la Acción (CTA - Call To Action)": "CTA detectada." if r["cta_presente"]
+                                                       else "No se detecta una llamada a la acción.",
+        "Originalidad y Creatividad": f"Diversidad léxica del {r['diversidad_lexica']:.0%}{cliches}.",
+        "Claridad y Concisión": f"{r['palabras_por_frase']:.0f} palabras por frase de media; "
+                                f"{r['proporcion_frases_largas']:.0%} de frases largas.",
+        "Longitud y Ritmo": f"{r['palabras']:.0f} palabras ≈ {segundos:.0f}s hablados para un reel de {duracion}s.",
+    }
+    sugerencias = _sugerencias(r, segundos, duracion)
+    media = sum(por_dimension.values()) / len(por_dimension)
+    descripciones["Resumen General y Conclusión Final"] = (
+        f"Puntuación media estimada: {media:.0f}%. Estimación local instantánea; "
+        f"pide el análisis con Gemini para una revisión en profundidad."
+    )
+
+    secciones = []
+    for titulo in ORDERED_SECTION_TITLES:
+        dimension = titulo.split(". ", 1)[1]
+        secciones.append({
+            "titulo": dimension,
+            "descripcion": descripciones[dimension],
+            "puntuacion": por_dimension.get(dimension),
+            "sugerencia": sugerencias.get(dimension, ""),
+        })
+    texto = "\n".join(
+        f"{titulo}: {s['descripcion']}"
+        + (f" Puntuación: {s['puntuacion']}%" if s["puntuacion"] is not None else "")
+        + (f" Sugerencia: {s['sugerencia']}" if s["sugerencia"] else "")
+        for titulo, s in zip(ORDERED_SECTION_TITLES, secciones)
+    )
+    return {"texto": texto, "secciones": secciones, "error": None, "origen": ORIGEN_LOCAL}
@@ -1,40 +1,41 @@
-import google.generativeai as genai
-import os
-import streamlit as st
 import re
-from dotenv import load_dotenv
-
-load_dotenv()
-
-# --- Configuración de la API de Google Gemini ---
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") 
-GEMINI_MODEL_NAME = "gemini-2.0-flash" 
-
-client = None
-if not GEMINI_API_KEY:
-    st.error("Error: GEMINI_API_KEY no encontrada en los secretos de Streamlit. Por favor, configúrala.")
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        client = genai.GenerativeModel(GEMINI_MODEL_NAME)
-    except Exception as e:
-        st.error(f"Error al configurar la API de Gemini o inicializar el modelo: {e}")
-        client = None
-
-def analizar_script(script_texto):
+from cache_respuestas import respuesta_cacheada, respuesta_cacheada_stream
+from cliente_gemini import obtener_cliente
+from metricas import registrar_parseo
+from peticiones_gemini import llamar_modelo
+from presupuesto_tokens import preparar_prompt
+
+ORDERED_SECTION_TITLES = [
+    "1. Tono y Estilo",
+    "2. Gancho (Hook)",
+    "3. Desarrollo del Contenido",
+    "4. Llamada a la Acción (CTA - Call To Action)",
+    "5. Originalidad y Creatividad",
+    "6. Claridad y Concisión",
+    "7. Longitud y Ritmo",
+    "8. Resumen General y Conclusión Final"
+]
+
+SECCIONES_CON_PUNTUACION = ["Tono y Estilo", "Gancho (Hook)", "Desarrollo del Contenido",
+                            "Llamada a la Acción (CTA - Call To Action)", "Originalidad y Creatividad",
+                            "Claridad y Concisión"]
+
+# Temperatura 0: el mismo script recibe la misma valoración, y así el análisis se
+# puede cachear (ver cache_respuestas.es_determinista).
+CONFIG_ANALISIS = {"max_output_tokens": 800, "temperature": 0}
+
+SECTION_REGEX = re.compile(
+    r"^\s*(?P<title>\d+\.\s*[^:]+):\s*(?P<content>.*?)(?=\s*\d+\.\s*[^:]+:|$)",
+    re.MULTILINE | re.DOTALL
+)
+
+def construir_prompt_analisis(script_texto):
     """
-    Realiza un análisis avanzado de un script usando la API de Google Gemini.
+    Construye el prompt de análisis para un script, compactado y ajustado al
+    presupuesto de tokens (ver presupuesto_tokens.py).
     """
-    if not script_texto.strip():
-        st.warning("El script está vacío. No hay nada que analizar.")
-        return
-
-    if client is None:
-        st.error("Cliente de Gemini API no inicializado. Revisa tu clave API y logs.")
-        return
-
-    full_analysis_text = ""
-    prompt_text = f"""
+    def plantilla(script_texto):
+        return f"""
     Eres un **analista de contenido de primer nivel para reels de redes sociales** (TikTok, Instagram, YouTube Shorts).
     Tu misión es realizar un análisis **profundo, dinámico y accionable** del siguiente script para un reel.
     Evalúa cada punto de forma crítica pero constructiva, y **siempre proporciona una sugerencia concreta o un ejemplo de cómo mejorar** si detectas una debilidad.
@@ -82,94 +83,260 @@ def analizar_script(script_texto):
     [Conclusión general y potencial. Mensaje motivador final].
     """
 
-    st.info(f"✨ Enviando script a Gemini para un análisis *supercargado*...")
-    try:
-        response = client.generate_content(prompt_text,
-                                           generation_config={"max_output_tokens": 800, "temperature": 0.7})
-        if response and response.text:
-            full_analysis_text = response.text
-        else:
-            st.warning("😕 Gemini no devolvió un análisis válido. La respuesta estaba vacía o incompleta.")
-            return
+    return preparar_prompt(plantilla, script_texto, "analizar_script")
 
-        st.success("✅ ¡Análisis completo generado!")
+def parsear_seccion(full_title, content_raw):
+    """
+    Separa el contenido de una sección en descripción, puntuación y sugerencia.
+    """
+    display_title = re.sub(r'^\d+\.\s*', '', full_title).strip()
+
+    score = None
+    description_text = content_raw
+    suggestion_text = ""
+
+    score_match = re.search(r'Puntuación:[\s\n]*(\d+)%', content_raw, re.IGNORECASE)
+    if score_match:
+        score = int(score_match.group(1))
+        description_text = content_raw.split(score_match.group(0))[0].strip()
+
+    suggestion_match = re.search(r'Sugerencia:\s*(.*)', content_raw, re.DOTALL | re.IGNORECASE)
+    if suggestion_match:
+        suggestion_text = suggestion_match.group(1).strip()
+        description_text = description_text.split('Sugerencia:')[0].strip()
+
+    return {
+        "titulo": display_title,
+        "descripcion": description_text,
+        "puntuacion": score,
+        "sugerencia": suggestion_text,
+    }
+
+def parsear_analisis(full_analysis_text):
+    """
+    Convierte el texto de análisis de Gemini en una lista ordenada de secciones.
+    """
+    parsed_data = {}
+    for match in SECTION_REGEX.finditer(full_analysis_text):
+        title = match.group('title').strip()
+        content = match.group('content').strip()
+        parsed_data[title] = content
+
+    secciones = []
+    for full_title_in_order in ORDERED_SECTION_TITLES:
+        content_raw = parsed_data.get(full_title_in_order, "")
+        if content_raw:
+            secciones.append(parsear_seccion(full_title_in_order, content_raw))
+    return secciones
+
+# Origen de un análisis: el modelo (por defecto) o el analizador heurístico local.
+ORIGEN_MODELO = "modelo"
+ORIGEN_LOCAL = "local"
+
+def origen_analisis(analisis):
+    """Origen de un análisis; los que no lo indican vienen del modelo."""
+    return (analisis or {}).get("origen", ORIGEN_MODELO)
+
+def puntuaciones_analisis(analisis):
+    """
+    Puntuaciones {dimensión: 0-100} de un análisis de `obtener_analisis`, solo de las
+    secciones con puntuación. Devuelve None si no hay análisis o terminó con error.
+    """
+    if not analisis or analisis.get("error"):
+        return None
+    puntuaciones = {
+        seccion["titulo"]: seccion["puntuacion"]
+        for seccion in analisis.get("secciones", [])
+        if seccion["titulo"] in SECCIONES_CON_PUNTUACION and seccion["puntuacion"] is not None
+    }
+    return puntuaciones or None
+
+class ParserAnalisisIncremental:
+    """
+    Parser del análisis que trabaja sobre texto en streaming.
+    Una sección se considera completa cuando ya ha llegado el título de la siguiente;
+    `alimentar` devuelve las secciones que se completan con cada fragmento y
+    `finalizar` las que quedan al cerrar el stream.
+    """
 
-        st.expander("Ver respuesta RAW de Gemini (para depuración)").code(full_analysis_text)
+    def __init__(self):
+        self.texto = ""
+        self._emitidas = 0
+        self._titulos_emitidos = set()
 
-        # --- PARSING Y PRESENTACIÓN ---
-        st.subheader("🚀 Análisis Detallado y Accionable de tu Script")
-        st.markdown("---")
+    def _nuevas_secciones(self, incluir_ultima):
+        coincidencias = list(SECTION_REGEX.finditer(self.texto))
+        completas = coincidencias if incluir_ultima else coincidencias[:-1]
+        secciones = []
+        for match in completas[self._emitidas:]:
+            title = match.group('title').strip()
+            content = match.group('content').strip()
+            if title in ORDERED_SECTION_TITLES and content and title not in self._titulos_emitidos:
+                self._titulos_emitidos.add(title)
+                secciones.append(parsear_seccion(title, content))
+        self._emitidas = max(self._emitidas, len(completas))
+        return secciones
+
+    def alimentar(self, fragmento):
+        """Añade un fragmento de texto y devuelve las secciones recién completadas."""
+        self.texto += fragmento
+        return self._nuevas_secciones(incluir_ultima=False)
+
+    def finalizar(self):
+        """Devuelve las secciones pendientes una vez terminado el stream."""
+        return self._nuevas_secciones(incluir_ultima=True)
+
+def obtener_analisis(script_texto):
+    """
+    Pide el análisis a Gemini y lo devuelve parseado, sin pintar nada en la interfaz.
+    Devuelve un diccionario con el texto crudo, las secciones y un posible error.
+    """
+    client = obtener_cliente()
+    if client is None:
+        return {"texto": "", "secciones": [], "error": "Cliente de Gemini API no inicializado. Revisa tu clave API y logs."}
 
-        section_regex = re.compile(
-            r"^\s*(?P<title>\d+\.\s*[^:]+):\s*(?P<content>.*?)(?=\s*\d+\.\s*[^:]+:|$)",
-            re.MULTILINE | re.DOTALL
+    generation_config = CONFIG_ANALISIS
+    try:
+        prompt_text = construir_prompt_analisis(script_texto)
+        full_analysis_text = respuesta_cacheada(
+            client.nombre, prompt_text, generation_config,
+            lambda: llamar_modelo(client, prompt_text, generation_config, funcion="analizar_script").text
         )
+    except Exception as e:
+        return {"texto": "", "secciones": [], "error": f"{e}"}
 
-        parsed_data = {}
-        for match in section_regex.finditer(full_analysis_text):
-            title = match.group('title').strip()
-            content = match.group('content').strip()
-            parsed_data[title] = content
-
-        ordered_section_titles = [
-            "1. Tono y Estilo",
-            "2. Gancho (Hook)",
-            "3. Desarrollo del Contenido",
-            "4. Llamada a la Acción (CTA - Call To Action)",
-            "5. Originalidad y Creatividad",
-            "6. Claridad y Concisión",
-            "7. Longitud y Ritmo",
-            "8. Resumen General y Conclusión Final"
-        ]
-
-        for full_title_in_order in ordered_section_titles:
-            content_raw = parsed_data.get(full_title_in_order, "")
-
-            if content_raw:
-                display_title = re.sub(r'^\d+\.\s*', '', full_title_in_order).strip()
-
-                score = None
-                description_text = content_raw
-                suggestion_text = ""
-                
-                score_match = re.search(r'Puntuación:[\s\n]*(\d+)%', content_raw, re.IGNORECASE)
-                if score_match:
-                    score = int(score_match.group(1))
-                    description_text = content_raw.split(score_match.group(0))[0].strip()
-
-                suggestion_match = re.search(r'Sugerencia:\s*(.*)', content_raw, re.DOTALL | re.IGNORECASE)
-                if suggestion_match:
-                    suggestion_text = suggestion_match.group(1).strip()
-                    description_text = description_text.split('Sugerencia:')[0].strip()
-
-                if display_title in ["Tono y Estilo", "Gancho (Hook)", "Desarrollo del Contenido",
-                                     "Llamada a la Acción (CTA - Call To Action)", "Originalidad y Creatividad",
-                                     "Claridad y Concisión"]:
-                    
-                    col1, col2 = st.columns([1, 4])
-                    with col1:
-                        st.metric(display_title, f"{score}%" if score is not None else "N/A")
-                    with col2:
-                        st.markdown(f"**{display_title}:** {description_text}")
-                        if score is not None:
-                            st.progress(score)
-                        if suggestion_text:
-                            st.info(f"💡 Sugerencia: {suggestion_text}")
-
-                elif display_title == "Longitud y Ritmo":
-                    st.markdown(f"**{display_title}:** {description_text}")
-                    if suggestion_text:
-                        st.info(f"💡 Sugerencia: {suggestion_text}")
-
-                elif display_title == "Resumen General y Conclusión Final":
-                    st.markdown(f"### {display_title}")
-                    st.markdown(description_text)
-
-                st.markdown("---")
-            else:
-                pass
-    
+    if not full_analysis_text:
+        return {"texto": "", "secciones": [], "error": None}
+
+    secciones = parsear_analisis(full_analysis_text)
+    registrar_parseo("analizar_script", bool(secciones))
+    return {"texto": full_analysis_text, "secciones": secciones, "error": None}
+
+def obtener_analisis_stream(script_texto):
+    """
+    Pide el análisis a Gemini en streaming. Devuelve eventos (tipo, dato):
+    ("seccion", seccion) en cuanto cada sección numerada está completa y, al final,
+    ("fin", analisis) con el mismo diccionario que devuelve `obtener_analisis`.
+    """
+    client = obtener_cliente()
+    if client is None:
+        yield "fin", {"texto": "", "secciones": [], "error": "Cliente de Gemini API no inicializado. Revisa tu clave API y logs."}
+        return
+
+    generation_config = CONFIG_ANALISIS
+    parser = ParserAnalisisIncremental()
+    try:
+        prompt_text = construir_prompt_analisis(script_texto)
+        fragmentos = respuesta_cacheada_stream(
+            client.nombre, prompt_text, generation_config,
+            lambda: (chunk.text for chunk in llamar_modelo(
+                client, prompt_text, generation_config, stream=True, funcion="analizar_script"))
+        )
+        for fragmento in fragmentos:
+            for seccion in parser.alimentar(fragmento):
+                yield "seccion", seccion
+        for seccion in parser.finalizar():
+            yield "seccion", seccion
     except Exception as e:
-        st.error(f"❌ ¡Ups! Ha ocurrido un error inesperado al analizar el script con Gemini: {e}. Por favor, revisa tu código.")
+        yield "fin", {"texto": parser.texto, "secciones": [], "error": f"{e}"}
+        return
+
+    secciones = parsear_analisis(parser.texto)
+    if parser.texto:
+        registrar_parseo("analizar_script", bool(secciones))
+    yield "fin", {"texto": parser.texto, "secciones": secciones, "error": None}
+
+def mostrar_seccion(seccion):
+    """
+    Pinta una sección ya parseada del análisis.
+    """
+    import streamlit as st
+
+    display_title = seccion["titulo"]
+    score = seccion["puntuacion"]
+    description_text = seccion["descripcion"]
+    suggestion_text = seccion["sugerencia"]
+
+    if display_title in SECCIONES_CON_PUNTUACION:
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            st.metric(display_title, f"{score}%" if score is not None else "N/A")
+        with col2:
+            st.markdown(f"**{display_title}:** {description_text}")
+            if score is not None:
+                st.progress(score)
+            if suggestion_text:
+                st.info(f"💡 Sugerencia: {suggestion_text}")
+
+    elif display_title == "Longitud y Ritmo":
+        st.markdown(f"**{display_title}:** {description_text}")
+        if suggestion_text:
+            st.info(f"💡 Sugerencia: {suggestion_text}")
+
+    elif display_title == "Resumen General y Conclusión Final":
+        st.markdown(f"### {display_title}")
+        st.markdown(description_text)
+
+    st.markdown("---")
+
+def mostrar_analisis(analisis):
+    """
+    Pinta en Streamlit un análisis devuelto por `obtener_analisis`.
+    """
+    import streamlit as st
+
+    full_analysis_text = analisis["texto"]
+
+    if analisis["error"]:
+        st.error(f"❌ ¡Ups! Ha ocurrido un error inesperado al analizar el script con Gemini: {analisis['error']}. Por favor, revisa tu código.")
         st.markdown(f"**Análisis de Gemini (Texto Crudo - Fallback por error en la app):**")
         st.code(full_analysis_text if full_analysis_text else "No se pudo obtener el análisis de Gemini debido a un error interno.")
+        return
+
+    if not full_analysis_text:
+        st.warning("😕 Gemini no devolvió un análisis válido. La respuesta estaba vacía o incompleta.")
+        return
+
+    st.success("✅ ¡Análisis completo generado!")
+
+    st.expander("Ver respuesta RAW de Gemini (para depuración)").code(full_analysis_text)
+
+    # --- PRESENTACIÓN ---
+    st.subheader("🚀 Análisis Detallado y Accionable de tu Script")
+    st.markdown("---")
+
+    for seccion in analisis["secciones"]:
+        mostrar_seccion(seccion)
+
+def analizar_script(script_texto):
+    """
+    Realiza un análisis avanzado de un script usando la API de Google Gemini.
+    """
+    import streamlit as st
+
+    if not script_texto.strip():
+        st.warning("El script está vacío. No hay nada que analizar.")
+        return
+
+    if obtener_cliente() is None:
+        st.error("Cliente de Gemini API no inicializado. Revisa tu clave API y logs.")
+        return
+
+    st.info(f"✨ Enviando script a Gemini para un análisis *supercargado*...")
+
+    # Las secciones se pintan en cuanto llegan; el resumen final va en su propio contenedor.
+    cabecera = st.container()
+    hay_secciones = False
+    for tipo, dato in obtener_analisis_stream(script_texto):
+        if tipo == "seccion":
+            if not hay_secciones:
+                cabecera.subheader("🚀 Análisis Detallado y Accionable de tu Script")
+                cabecera.markdown("---")
+                hay_secciones = True
+            mostrar_seccion(dato)
+        elif tipo == "fin":
+            if hay_secciones and not dato["error"]:
+                st.success("✅ ¡Análisis completo generado!")
+                st.expander("Ver respuesta RAW de Gemini (para depuración)").code(dato["texto"])
+            else:
+                mostrar_analisis(dato)
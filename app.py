@@ -1,7 +1,17 @@
+import json
+import os
 import streamlit as st
-from generadores import generar_script, generar_copy_hooks
-from analizador_scripts import analizar_script
-from historial_manager import guardar_en_historial, cargar_historial, borrar_registros_seleccionados, limpiar_historial
+from generadores import VALORES_POR_DEFECTO, Variante, script_valido, copy_hooks_valido
+from analizador_scripts import ORIGEN_LOCAL, analizar_script, mostrar_analisis, mostrar_seccion, origen_analisis
+from analizador_local import analizar_local
+from historial_manager import (guardar_en_historial, cargar_pagina_historial, borrar_registros_seleccionados,
+                               limpiar_historial, buscar_en_historial, buscar_similares, resumen_analitica,
+                               tendencia_gancho)
+from analitica_historial import NICHOS, SIN_NICHO
+from cache_respuestas import estadisticas_cache
+from metricas import metricas, registrar_accion, resumen_por_funcion, exportar_textfile
+from cliente_gemini import obtener_cliente, error_cliente
+from cola_trabajos import cola, COMPLETADO, ESTADOS_ACTIVOS, ESTADOS_REINTENTABLES
 
 # --- Configuración de la Página y Estado de la Sesión ---
 st.set_page_config(
@@ -15,13 +25,87 @@ if 'script_generado' not in st.session_state:
     st.session_state['script_generado'] = None
 if 'copy_hooks_generado' not in st.session_state:
     st.session_state['copy_hooks_generado'] = None
+if 'analisis_generado' not in st.session_state:
+    st.session_state['analisis_generado'] = None
+if 'variantes_generado' not in st.session_state:
+    st.session_state['variantes_generado'] = []
+if 'tiempos_etapas' not in st.session_state:
+    st.session_state['tiempos_etapas'] = {}
 if 'tema_input' not in st.session_state:
     st.session_state['tema_input'] = ""
+# El trabajo en curso también va en la URL para recuperarlo al recargar la página.
+if 'trabajo_activo' not in st.session_state:
+    st.session_state['trabajo_activo'] = st.query_params.get("trabajo")
+
+ETAPAS_PIPELINE = ("variantes", "script", "copy_hooks", "analisis")
+ICONOS_ESTADO = {"pendiente": "🕓", "en_curso": "⏳", "completado": "✅", "error": "❌",
+                 "cancelado": "🚫", "interrumpido": "⚠️"}
+
+def seguir_trabajo(id_trabajo):
+    st.session_state['trabajo_activo'] = id_trabajo
+    st.query_params["trabajo"] = id_trabajo
+
+def soltar_trabajo():
+    st.session_state['trabajo_activo'] = None
+    st.query_params.pop("trabajo", None)
+
+def cargar_resultados_trabajo(trabajo):
+    """Pasa los resultados de un trabajo terminado al estado de la sesión."""
+    resultados = trabajo["resultados"]
+    st.session_state['script_generado'] = resultados.get('script')
+    st.session_state['copy_hooks_generado'] = resultados.get('copy_hooks')
+    st.session_state['analisis_generado'] = resultados.get('analisis')
+    st.session_state['variantes_generado'] = [Variante(**v) for v in resultados.get('variantes', [])]
+    st.session_state['tiempos_etapas'] = trabajo['etapas']
+
+def cargar_trabajo(id_trabajo):
+    trabajo = cola.obtener(id_trabajo)
+    if trabajo is not None:
+        cargar_resultados_trabajo(trabajo)
+
+def reintentar_trabajo(id_trabajo):
+    if cola.reintentar(id_trabajo):
+        seguir_trabajo(id_trabajo)
+
+@st.fragment(run_every=1)
+def progreso_trabajo():
+    """Consulta el trabajo activo cada segundo y muestra el estado de cada etapa."""
+    trabajo = cola.obtener(st.session_state['trabajo_activo'])
+    if trabajo is None:
+        soltar_trabajo()
+        return
+    if trabajo["estado"] not in ESTADOS_ACTIVOS:
+        if trabajo["estado"] == COMPLETADO:
+            cargar_resultados_trabajo(trabajo)
+            if script_valido(trabajo["resultados"].get("script")):
+                st.session_state['aviso_trabajo'] = ("success", "¡Contenido generado con éxito!")
+        else:
+            st.session_state['aviso_trabajo'] = ("warning", f"El trabajo \"{trabajo['parametros']['tema']}\" terminó "
+                                                 f"como {trabajo['estado']}. {trabajo['error'] or ''}")
+        soltar_trabajo()
+        exportar_textfile()
+        st.rerun()
+
+    st.info(f'{ICONOS_ESTADO[trabajo["estado"]]} Generando contenido para "{trabajo["parametros"]["tema"]}"... '
+            "Puedes seguir usando la página.")
+    lineas = []
+    for etapa in ETAPAS_PIPELINE:
+        if etapa in trabajo["etapas"]:
+            lineas.append(f"✅ {etapa} · {trabajo['etapas'][etapa]:.1f}s")
+        elif etapa != "variantes" or trabajo["parametros"].get("variantes", 1) > 1:
+            lineas.append(f"⏳ {etapa}")
+    st.caption(" · ".join(lineas))
+    if trabajo.get("script_parcial"):
+        st.markdown(trabajo["script_parcial"])
+    st.button("Cancelar", key="cancelar_trabajo_activo", on_click=cola.cancelar, args=(trabajo["id"],))
 
 # --- Título Principal ---
 st.title("🎬 Generador de Contenido para Reels y Redes Sociales")
 st.markdown("Crea scripts, copys y hooks para TikTok, Instagram y YouTube.")
 
+if obtener_cliente() is None:
+    st.error(f"Error al configurar la API de Gemini: {error_cliente()}")
+
 # --- Campo de Texto para el Tema ---
 st.session_state['tema_input'] = st.text_input(
     "Ingresa el tema para tu Contenido",
@@ -36,28 +120,121 @@ opcion_seleccionada = st.sidebar.radio(
     ("Generador de Contenido Completo", "Analizador de Scripts", "Historial de Contenido")
 )
 
+with st.sidebar.expander("Caché de Gemini"):
+    stats_cache = estadisticas_cache()
+    st.write(f"Aciertos (memoria): {stats_cache['aciertos_memoria']}")
+    st.write(f"Aciertos (disco): {stats_cache['aciertos_disco']}")
+    st.write(f"Fallos: {stats_cache['fallos']}")
+    st.write(f"Tasa de aciertos: {stats_cache['tasa_aciertos']:.0%}")
+
+with st.sidebar.expander("Trabajos"):
+    trabajos = cola.listar(limite=10)
+    if not trabajos:
+        st.caption("Todavía no hay trabajos.")
+    for trabajo in trabajos:
+        st.write(f"{ICONOS_ESTADO[trabajo['estado']]} **{trabajo['parametros']['tema']}** · {trabajo['estado']}")
+        if trabajo["estado"] in ESTADOS_ACTIVOS:
+            st.button("Cancelar", key=f"cancelar_{trabajo['id']}", on_click=cola.cancelar, args=(trabajo["id"],))
+        elif trabajo["estado"] in ESTADOS_REINTENTABLES:
+            st.button("Reintentar", key=f"reintentar_{trabajo['id']}", on_click=reintentar_trabajo,
+                      args=(trabajo["id"],))
+        else:
+            st.button("Cargar", key=f"cargar_{trabajo['id']}", on_click=cargar_trabajo, args=(trabajo["id"],))
+
+# Panel de operación, oculto salvo con ?metricas=1 en la URL o METRICAS_PANEL=1.
+if st.query_params.get("metricas") == "1" or os.environ.get("METRICAS_PANEL") == "1":
+    with st.sidebar.expander("Métricas"):
+        resumen = resumen_por_funcion()
+        llamadas = sum(fila["llamadas"] for fila in resumen["funciones"])
+        acciones = sum(resumen["acciones"].values())
+        if acciones:
+            st.write(f"Llamadas al modelo por acción: {llamadas / acciones:.1f}")
+        for fila in resumen["funciones"]:
+            p95 = f"{fila['p95_s']:.2f}s" if fila["p95_s"] is not None else "-"
+            fallos = f"{fila['fallos_parseo'] / fila['parseos']:.0%}" if fila["parseos"] else "-"
+            st.write(f"**{fila['funcion']}**: {fila['llamadas']} llamadas ({fila['errores']} errores), "
+                     f"p95 ≤ {p95}, tokens {fila['tokens_entrada']}→{fila['tokens_salida']}, "
+                     f"fallos de parseo {fallos}")
+            if fila.get("coberturas") or fila.get("plazos_excedidos"):
+                tasa = fila.get("coberturas", 0) / fila["llamadas"] if fila["llamadas"] else 0
+                st.write(f"  Coberturas: {fila.get('coberturas', 0)} ({tasa:.1%}), ganadas "
+                         f"{fila.get('coberturas_ganadas', 0)}, ahorro {fila.get('ahorro_cobertura_s', 0):.1f}s; "
+                         f"plazos vencidos: {fila.get('plazos_excedidos', 0)}")
+        for fila in resumen["historial"]:
+            st.write(f"Historial · {fila['operacion']}: {fila['total']} ops, p95 ≤ {fila['p95_s']}s")
+        for dia, coste in sorted(resumen["coste_usd_por_dia"].items()):
+            st.write(f"Gasto {dia}: ${coste:.4f}")
+        st.download_button("Exportar JSON", json.dumps(metricas.como_dict(), ensure_ascii=False, indent=2),
+                           file_name="metricas.json", mime="application/json")
+
 # --- Contenido Principal Basado en la Opción Seleccionada ---
 
 if opcion_seleccionada == "Generador de Contenido Completo":
     st.header(f"✍️ Generador de Contenido Completo")
     st.write("Genera ideas y estructuras para tus videos de reels, junto con copy y hooks.")
 
+    # Antes de gastar llamadas al modelo, se ofrece lo ya generado sobre temas parecidos.
+    if st.session_state['tema_input']:
+        similares = buscar_similares(st.session_state['tema_input'], k=3)
+        if similares:
+            def reutilizar_registro(registro):
+                st.session_state['script_generado'] = registro['script']
+                st.session_state['copy_hooks_generado'] = registro['copy_hooks']
+                st.session_state['analisis_generado'] = analizar_local(registro['script'])
+                st.session_state['tiempos_etapas'] = {}
+
+            with st.expander(f"♻️ Ya tienes {len(similares)} contenido(s) parecido(s) en el historial"):
+                for registro, parecido in similares:
+                    col1, col2 = st.columns([4, 1])
+                    col1.markdown(f"**{registro['tema']}** · {registro['fecha']} · {parecido:.0%} de similitud")
+                    col2.button("Reutilizar", key=f"reutilizar_{registro['id']}",
+                                on_click=reutilizar_registro, args=(registro,))
+
+    una_llamada = st.toggle(
+        "Una sola llamada (JSON estructurado)",
+        help="Pide script, copy/hooks y análisis en una única respuesta. Más rápido y barato, sin streaming."
+    )
+    num_variantes = st.number_input(
+        "Variantes del script", min_value=1, max_value=5, value=1, disabled=una_llamada,
+        help="Pide varias versiones en paralelo y se queda con la mejor puntuada (análisis local)."
+    )
+    nicho = st.selectbox("Nicho", [SIN_NICHO] + NICHOS, help="Agrupa el contenido guardado en la analítica del historial.")
+    guardar_al_terminar = st.checkbox("Guardar en el historial al terminar")
+
     if st.button("Generar Contenido"):
         if st.session_state['tema_input']:
-            with st.spinner(f'Generando contenido para "{st.session_state["tema_input"]}"...'):
-                st.session_state['script_generado'] = generar_script(
-                    st.session_state['tema_input'], "persuasivo", "enérgico", 30
-                )
-                st.session_state['copy_hooks_generado'] = generar_copy_hooks(
-                    st.session_state['tema_input'], [st.session_state['script_generado']]
-                )
+            registrar_accion("generar_contenido")
+            # La generación corre en segundo plano: la página no se bloquea y un rerun no la corta.
+            seguir_trabajo(cola.enviar({
+                "tema": st.session_state['tema_input'], **VALORES_POR_DEFECTO,
+                "una_llamada": una_llamada, "variantes": num_variantes,
+                "guardar_historial": guardar_al_terminar, "nicho": None if nicho == SIN_NICHO else nicho,
+            }))
         else:
             st.warning("¡Por favor, ingresa un tema antes de generar contenido!")
 
+    if st.session_state['trabajo_activo']:
+        progreso_trabajo()
+    if st.session_state.get('aviso_trabajo'):
+        nivel, mensaje = st.session_state.pop('aviso_trabajo')
+        getattr(st, nivel)(mensaje)
+
     if st.session_state['script_generado']:
+        # Los generadores devuelven los errores en el propio resultado; aquí se muestran.
+        if not script_valido(st.session_state['script_generado']):
+            st.error(st.session_state['script_generado'])
+        if not copy_hooks_valido(st.session_state['copy_hooks_generado']):
+            st.warning("No se pudieron generar copy/hooks válidos. Revisa tu clave API y límites de uso.")
         st.subheader("Script Generado:")
         st.markdown(st.session_state['script_generado']) 
 
+        if len(st.session_state['variantes_generado']) > 1:
+            with st.expander(f"Otras variantes ({len(st.session_state['variantes_generado']) - 1})"):
+                for variante in st.session_state['variantes_generado'][1:]:
+                    st.markdown(f"**Puntuación local: {variante.puntuacion:.0f}%** · _{variante.enfoque}_")
+                    st.markdown(variante.texto)
+                    st.markdown("---")
+
         st.markdown("---")
 
         st.subheader("Copy y Hooks Sugeridos para este Script:")
@@ -76,13 +253,30 @@ if opcion_seleccionada == "Generador de Contenido Completo":
         st.markdown("---")
 
         st.subheader("Análisis Rápido del Script:")
-        analizar_script(st.session_state['script_generado'])
+        if st.session_state['analisis_generado'] and origen_analisis(st.session_state['analisis_generado']) == ORIGEN_LOCAL:
+            # Contenido reutilizado del historial: solo hay la estimación heurística, no un análisis de Gemini.
+            st.caption("⚡ Estimación local (heurística, sin Gemini). Pulsa «Analizar a fondo» para el análisis completo.")
+            for seccion in st.session_state['analisis_generado']["secciones"]:
+                mostrar_seccion(seccion)
+            if st.button("Analizar a fondo con Gemini", key="analizar_reutilizado"):
+                analizar_script(st.session_state['script_generado'])
+        elif st.session_state['analisis_generado']:
+            mostrar_analisis(st.session_state['analisis_generado'])
+        else:
+            analizar_script(st.session_state['script_generado'])
+
+        if st.session_state['tiempos_etapas']:
+            st.caption(" · ".join(
+                f"{etapa}: {segundos:.1f}s" for etapa, segundos in st.session_state['tiempos_etapas'].items()
+            ))
 
         if st.button("💾 Guardar en Historial"):
             guardar_en_historial(
                 st.session_state['tema_input'], 
                 st.session_state['script_generado'], 
-                st.session_state['copy_hooks_generado']
+                st.session_state['copy_hooks_generado'],
+                analisis=st.session_state['analisis_generado'],
+                nicho=None if nicho == SIN_NICHO else nicho
             )
             st.success("¡Contenido guardado en el historial con éxito!")
 
@@ -95,11 +289,20 @@ elif opcion_seleccionada == "Analizador de Scripts":
         height=200,
         placeholder="Ej: Escena 1: Presenta el problema. Escena 2: Muestra la solución con un producto de IA..."
     )
+    duracion_analizador = st.number_input("Duración del reel (segundos)", min_value=5, max_value=180, value=30, step=5)
+
+    # Estimación local instantánea: se recalcula en cada cambio del texto, sin llamar a Gemini.
+    if script_input_analizador.strip():
+        with st.expander("⚡ Análisis instantáneo (local)", expanded=True):
+            for seccion in analizar_local(script_input_analizador, duracion_analizador)["secciones"]:
+                mostrar_seccion(seccion)
 
-    if st.button("Analizar Script"):
+    if st.button("Analizar a fondo con Gemini"):
         if script_input_analizador:
+            registrar_accion("analizar_script")
             with st.spinner('Analizando script...'):
                 analizar_script(script_input_analizador)
+            exportar_textfile()
         else:
             st.warning("Por favor, pega un script para analizar.")
 
@@ -107,50 +310,103 @@ elif opcion_seleccionada == "Historial de Contenido":
     st.header("📚 Historial de Contenido Generado")
     st.write("Aquí puedes revisar y reutilizar el contenido que has guardado.")
 
-    historial = cargar_historial()
+    REGISTROS_POR_PAGINA = 20
+
+    # La selección de registros a borrar se conserva al cambiar de página.
+    if 'seleccion_borrar' not in st.session_state:
+        st.session_state['seleccion_borrar'] = set()
+
+    def alternar_seleccion(id_registro):
+        if st.session_state[f"delete_checkbox_{id_registro}"]:
+            st.session_state['seleccion_borrar'].add(id_registro)
+        else:
+            st.session_state['seleccion_borrar'].discard(id_registro)
+
+    registros_pagina, total_registros = cargar_pagina_historial(1, REGISTROS_POR_PAGINA)
     
-    if historial:
+    if total_registros:
+        with st.expander("📊 Analítica de puntuaciones"):
+            agrupacion = st.radio("Agrupar por", ("nicho", "semana"), horizontal=True)
+            filas_analitica = resumen_analitica(agrupacion)
+            if filas_analitica:
+                st.dataframe([
+                    {agrupacion: fila["grupo"], "registros": fila["registros"],
+                     **{f"{dimension} (media)": round(datos["media"], 1) for dimension, datos in fila["dimensiones"].items()},
+                     **{f"{dimension} (p90)": datos["p90"] for dimension, datos in fila["dimensiones"].items()}}
+                    for fila in filas_analitica
+                ], hide_index=True)
+                nicho_tendencia = st.selectbox("Tendencia del gancho", ["Todos"] + NICHOS)
+                tendencia = tendencia_gancho(None if nicho_tendencia == "Todos" else nicho_tendencia)
+                if tendencia["semanas"]:
+                    st.line_chart({"Gancho (media semanal)": dict(zip(tendencia["semanas"], tendencia["medias"]))})
+                if tendencia["pendiente"] is not None:
+                    st.caption(f"Tendencia: {tendencia['pendiente']:+.1f} puntos por semana.")
+            else:
+                st.caption("Guarda contenido con su análisis para ver aquí sus puntuaciones por dimensión.")
+
+        consulta_historial = st.text_input(
+            "🔎 Buscar en el historial",
+            placeholder="Ej: Fórmula 1, #marketing, arepas",
+            help="Busca en tema, script, copy y hooks. No distingue mayúsculas ni tildes."
+        )
+        if consulta_historial.strip():
+            registros_mostrados = buscar_en_historial(consulta_historial, limit=50)
+            st.caption(f"{len(registros_mostrados)} resultado(s) para \"{consulta_historial}\".")
+        else:
+            total_paginas = max(1, -(-total_registros // REGISTROS_POR_PAGINA))
+            pagina_actual = st.number_input(
+                f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1, step=1
+            )
+            if pagina_actual != 1:
+                registros_pagina, total_registros = cargar_pagina_historial(pagina_actual, REGISTROS_POR_PAGINA)
+            registros_mostrados = registros_pagina
+            st.caption(f"{total_registros} registro(s) en total.")
+
         st.subheader("Selecciona los registros a borrar:")
-        registros_a_borrar = []
+        seleccion = st.session_state['seleccion_borrar']
+
+        for registro in registros_mostrados:
+            col1, col2 = st.columns([1, 5])
+            with col1:
+                st.checkbox(
+                    "", key=f"delete_checkbox_{registro['id']}", value=registro['id'] in seleccion,
+                    on_change=alternar_seleccion, args=(registro['id'],)
+                )
+            with col2:
+                with st.expander(f"**Tema:** {registro['tema']} (Generado: {registro['fecha']})"):
+                    # Mostrar el nuevo título para Shorts en el historial
+                    if 'titulo_shorts' in registro['copy_hooks']:
+                        st.info(f"**Título para Shorts:** {registro['copy_hooks']['titulo_shorts']}")
+                    
+                    st.subheader("Script Generado:")
+                    st.markdown(registro['script'])
+                    st.subheader("Copy y Hooks Sugeridos:")
+                    st.success(f"**Copy:** {registro['copy_hooks']['copy']}")
+                    st.markdown("**Hooks:**")
+                    for hook in registro['copy_hooks']['hooks']:
+                        st.info(f"- {hook}")
+        
+        st.markdown("---")
         
-        with st.form("form_eliminar_registros"):
-            for registro in reversed(historial):
-                col1, col2 = st.columns([1, 5])
-                with col1:
-                    if st.checkbox("", key=f"delete_checkbox_{registro['id']}"):
-                        registros_a_borrar.append(registro['id'])
-                with col2:
-                    with st.expander(f"**Tema:** {registro['tema']} (Generado: {registro['fecha']})"):
-                        # Mostrar el nuevo título para Shorts en el historial
-                        if 'titulo_shorts' in registro['copy_hooks']:
-                            st.info(f"**Título para Shorts:** {registro['copy_hooks']['titulo_shorts']}")
-                        
-                        st.subheader("Script Generado:")
-                        st.markdown(registro['script'])
-                        st.subheader("Copy y Hooks Sugeridos:")
-                        st.success(f"**Copy:** {registro['copy_hooks']['copy']}")
-                        st.markdown("**Hooks:**")
-                        for hook in registro['copy_hooks']['hooks']:
-                            st.info(f"- {hook}")
-            
-            st.markdown("---")
-            
-            col_b1, col_b2 = st.columns([1, 1])
-            with col_b1:
-                if st.form_submit_button("🗑️ Borrar Seleccionados"):
-                    if registros_a_borrar:
-                        borrar_registros_seleccionados(registros_a_borrar)
-                        st.success(f"Se eliminaron {len(registros_a_borrar)} registro(s) del historial.")
-                        st.rerun()
-                    else:
-                        st.warning("Por favor, selecciona al menos un registro para borrar.")
-            with col_b2:
-                if st.form_submit_button("🗑️ Borrar TODO el Historial"):
-                    limpiar_historial()
-                    st.session_state['script_generado'] = None
-                    st.session_state['copy_hooks_generado'] = None
-                    st.success("¡Historial borrado por completo!")
+        col_b1, col_b2 = st.columns([1, 1])
+        with col_b1:
+            if st.button(f"🗑️ Borrar Seleccionados ({len(seleccion)})"):
+                if seleccion:
+                    borrar_registros_seleccionados(sorted(seleccion))
+                    st.success(f"Se eliminaron {len(seleccion)} registro(s) del historial.")
+                    st.session_state['seleccion_borrar'] = set()
                     st.rerun()
+                else:
+                    st.warning("Por favor, selecciona al menos un registro para borrar.")
+        with col_b2:
+            if st.button("🗑️ Borrar TODO el Historial"):
+                limpiar_historial()
+                st.session_state['script_generado'] = None
+                st.session_state['copy_hooks_generado'] = None
+                st.session_state['analisis_generado'] = None
+                st.session_state['seleccion_borrar'] = set()
+                st.success("¡Historial borrado por completo!")
+                st.rerun()
 
     else:
         st.info("El historial está vacío. Genera y guarda algo de contenido primero.")
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+# --- Backends de modelo de lenguaje ---
+# Todos los backends exponen la misma interfaz que `genai.GenerativeModel`:
+#   generate_content(prompt, generation_config=None, stream=False)
+# y devuelven un objeto con `.text` y `.usage_metadata` (o, en streaming, un
+# iterable de fragmentos con `.text`). Así el resto del código no sabe qué
+# backend está usando.
+
+class BackendGemini:
+    """Backend real: delega en `google.generativeai.GenerativeModel`."""
+
+    admite_plazo = True
+
+    def __init__(self, modelo, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.nombre = modelo
+        self._modelo = genai.GenerativeModel(modelo)
+
+    def generate_content(self, prompt, generation_config=None, stream=False, plazo=None, **kwargs):
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        if plazo is not None:
+            kwargs["request_options"] = {"timeout": plazo}
+        return self._modelo.generate_content(prompt, stream=stream, **kwargs)
+
+class ErrorSimulado(Exception):
+    """Error transitorio inyectado por el backend local (se comporta como un 503)."""
+    code = 503
+
+class RespuestaLocal:
+    """Respuesta del backend local con la misma forma que la del SDK de Gemini."""
+
+    def __init__(self, texto, tokens_entrada, fragmentos=None):
+        self.text = texto
+        self._fragmentos = fragmentos
+        tokens_salida = max(1, len(texto) // 4)
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=tokens_entrada,
+            candidates_token_count=tokens_salida,
+            total_token_count=tokens_entrada + tokens_salida,
+        )
+
+    def __iter__(self):
+        for fragmento in self._fragmentos or [self.text]:
+            yield fragmento
+
+def _parsear_latencia(especificacion):
+    """
+    Convierte una especificación de latencia en una función que devuelve segundos:
+    "fija:0.5", "uniforme:0.2,1.5" o "lognormal:mu,sigma" (parámetros en segundos
+    de la normal subyacente, p. ej. "lognormal:-0.5,0.6" ≈ mediana 0.6s).
+    """
+    tipo, _, parametros = especificacion.partition(":")
+    valores = [float(v) for v in parametros.split(",") if v.strip()]
+    if tipo == "fija":
+        return lambda rng: valores[0] if valores else 0.0
+    if tipo == "uniforme":
+        return lambda rng: rng.uniform(valores[0], valores[1])
+    if tipo == "lognormal":
+        return lambda rng: rng.lognormvariate(valores[0], valores[1])
+    raise ValueError(f"Especificación de latencia no válida: {especificacion!r}")
+
+class FragmentoLocal:
+    def __init__(self, texto):
+        self.text = texto
+
+class BackendLocal:
+    """
+    Backend local determinista para pruebas de carga y CI sin red ni facturación.
+    Devuelve textos con el mismo formato que piden nuestros prompts (script,
+    "Título Shorts:/Copy:/Hooks:" y análisis numerado con "Puntuación: X%"), o
+    un JSON con la forma de `contenido_estructurado.ESQUEMA_CONTENIDO` cuando se
+    pide `response_mime_type` "application/json".
+    El contenido depende solo del prompt; la latencia, el troceado en streaming y
+    la tasa de fallos son configurables. En streaming, un fallo simulado llega a
+    mitad de la respuesta, como un corte de la conexión.
+    """
+
+    nombre = "local-stub"
+    admite_plazo = True
+
+    def __init__(self, latencia="fija:0", latencia_fragmento=0.0, tamano_fragmento=40,
+                 tasa_fallos=0.0, semilla=None):
+        self._latencia = _parsear_latencia(latencia)
+        self.latencia_fragmento = latencia_fragmento
+        self.tamano_fragmento = tamano_fragmento
+        self.tasa_fallos = tasa_fallos
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+
+    @classmethod
+    def desde_entorno(cls):
+        semilla = os.environ.get("LLM_STUB_SEMILLA")
+        return cls(
+            latencia=os.environ.get("LLM_STUB_LATENCIA", "fija:0"),
+            latencia_fragmento=float(os.environ.get("LLM_STUB_LATENCIA_FRAGMENTO", "0")),
+            tamano_fragmento=int(os.environ.get("LLM_STUB_TAMANO_FRAGMENTO", "40")),
+            tasa_fallos=float(os.environ.get("LLM_STUB_TASA_FALLOS", "0")),
+            semilla=int(semilla) if semilla else None,
+        )
+
+    def generate_content(self, prompt, generation_config=None, stream=False, plazo=None, **kwargs):
+        with self._lock:
+            self.llamadas += 1
+            espera = self._latencia(self._rng)
+            falla = self._rng.random() < self.tasa_fallos
+        if plazo is not None and espera > plazo:
+            time.sleep(plazo)
+            raise TimeoutError("Plazo vencido en el backend local.")
+        time.sleep(espera)
+        if falla and not stream:
+            raise ErrorSimulado("Error 503 simulado por el backend local.")
+
+        texto = self._responder(prompt, generation_config or {})
+        tokens_entrada = max(1, len(prompt) // 4)
+        if not stream:
+            return RespuestaLocal(texto, tokens_entrada)
+        fragmentos = [texto[i:i + self.tamano_fragmento] for i in range(0, len(texto), self.tamano_fragmento)]
+        return RespuestaLocal(texto, tokens_entrada, self._emitir(fragmentos, len(fragmentos) // 2 if falla else None))
+
+    def _emitir(self, fragmentos, fallar_en=None):
+        for i, fragmento in enumerate(fragmentos):
+            if i == fallar_en:
+                raise ErrorSimulado("Error 503 simulado por el backend local a mitad de la respuesta.")
+            if self.latencia_fragmento:
+                time.sleep(self.latencia_fragmento)
+            yield FragmentoLocal(fragmento)
+
+    # --- Generación de textos con el formato esperado ---
+    def _responder(self, prompt, generation_config):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        tema = self._extraer_tema(prompt)
+        if generation_config.get("response_mime_type") == "application/json":
+            return self._contenido_json(rng, tema)
+        if "Puntuación:" in prompt:
+            return self._analisis(rng)
+        if "Título Shorts:" in prompt:
+            return self._copy_hooks(rng, tema)
+        return self._script(rng, tema)
+
+    @staticmethod
+    def _extraer_tema(prompt):
+        match = re.search(r'Tema:\s*(.+)', prompt) or re.search(r'tema de "(.+?)"', prompt)
+        return match.group(1).strip() if match else "tu tema"
+
+    @staticmethod
+    def _script(rng, tema):
+        escenas = "\n".join(
+            f"Escena {i}: Muestra un dato clave sobre {tema} con texto en pantalla."
+            for i in range(1, rng.randint(3, 5) + 1)
+        )
+        return (
+            f"**Título:** {tema}: lo que nadie te cuenta\n\n"
+            f"**Gancho:**\n¿Sabías que el 90% falla con {tema}? Quédate hasta el final.\n\n"
+            f"**Desarrollo del Contenido:**\n{escenas}\n\n"
+            f"**Llamada a la Acción:**\nSíguenos y comenta qué parte te sorprendió más.\n\n"
+            f"**Elementos Visuales/Sonido:**\n- Cortes rápidos cada 2 segundos\n- Música en tendencia\n"
+        )
+
+    @staticmethod
+    def _copy_hooks(rng, tema):
+        etiqueta = re.sub(r"\W+", "", tema.title())[:20] or "Reels"
+        return (
+            f"Título Shorts: {tema[:50]} en 30 segundos #{etiqueta} #Tips #Viral\n\n"
+            f"Copy: 🚀 Todo lo que necesitas saber sobre {tema} en un solo reel. 👇 #{etiqueta} #reels\n\n"
+            f"Hooks:\n"
+            f"- ¿Todavía no sabes esto sobre {tema}?\n"
+            f"- El error número {rng.randint(1, 5)} que todos cometen\n"
+            f"- Esto cambiará cómo ves {tema}\n"
+        )
+
+    @staticmethod
+    def _analisis(rng):
+        def puntuacion():
+            return rng.randint(40, 95)
+        return (
+            f"1. Tono y Estilo: Cercano y enérgico. Puntuación: {puntuacion()}% Sugerencia: Añade una pregunta directa.\n"
+            f"2. Gancho (Hook): Capta la atención pronto. Puntuación: {puntuacion()}% Sugerencia: Acórtalo a 3 segundos.\n"
+            f"3. Desarrollo del Contenido: Progresión clara. Puntuación: {puntuacion()}% Sugerencia: Une las escenas 2 y 3.\n"
+            f"4. Llamada a la Acción (CTA - Call To Action): Correcta. Puntuación: {puntuacion()}% Sugerencia: Pide una acción concreta.\n"
+            f"5. Originalidad y Creatividad: Formato conocido. Puntuación: {puntuacion()}% Sugerencia: Prueba un giro inesperado.\n"
+            f"6. Claridad y Concisión: Fácil de seguir. Puntuación: {puntuacion()}% Sugerencia: Elimina relleno.\n"
+            f"7. Longitud y Ritmo: Adecuada para 30 segundos. Sugerencia: Corta cada 2 segundos.\n"
+            f"8. Resumen General y Conclusión Final: Buen potencial viral. ¡Adelante!\n"
+        )
+
+    @staticmethod
+    def _contenido_json(rng, tema):
+        from contenido_estructurado import DIMENSIONES_ANALISIS, SECCIONES_CON_PUNTUACION
+
+        etiqueta = re.sub(r"\W+", "", tema.title())[:20] or "Reels"
+        contenido = {
+            "script": {
+                "titulo": f"{tema}: lo que nadie te cuenta",
+                "gancho": f"¿Sabías que el 90% falla con {tema}? Quédate hasta el final.",
+                "escenas": [f"Muestra un dato clave sobre {tema} con texto en pantalla."
+                            for _ in range(rng.randint(3, 5))],
+                "llamada_accion": "Síguenos y comenta qué parte te sorprendió más.",
+                "elementos_visuales": ["Cortes rápidos cada 2 segundos", "Música en tendencia"],
+            },
+            "titulo_shorts": f"{tema[:50]} en 30 segundos #{etiqueta} #Tips #Viral",
+            "copy": f"🚀 Todo lo que necesitas saber sobre {tema} en un solo reel. 👇 #{etiqueta} #reels",
+            "hooks": [f"¿Todavía no sabes esto sobre {tema}?",
+                      f"El error número {rng.randint(1, 5)} que todos cometen",
+                      f"Esto cambiará cómo ves {tema}"],
+            "analisis": [
+                {"dimension": dimension, "descripcion": f"Valoración de {dimension.lower()}.",
+                 "puntuacion": rng.randint(40, 95) if dimension in SECCIONES_CON_PUNTUACION else None,
+                 "sugerencia": "Prueba una variante más directa."}
+                for dimension in DIMENSIONES_ANALISIS
+            ],
+        }
+        return json.dumps(contenido, ensure_ascii=False)
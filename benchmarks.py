@@ -0,0 +1,311 @@
+# benchmarks.py
+# Suite de benchmarks offline (backend local, sin red) para el pipeline de
+# generación, los parsers y el historial. Escribe los resultados en JSON para
+# comparar entre commits:
+#
+#   python benchmarks.py --salida bench.json
+#   python benchmarks.py --salida bench_nuevo.json --comparar bench.json
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+def _resumen_tiempos(tiempos):
+    return {
+        "n": len(tiempos),
+        "p50_s": _percentil(tiempos, 50),
+        "p95_s": _percentil(tiempos, 95),
+        "media_s": statistics.fmean(tiempos) if tiempos else None,
+    }
+
+def _memoria_pico(funcion):
+    """Pico de memoria Python (tracemalloc) de una ejecución de `funcion`, en MB."""
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return pico / (1024 * 1024)
+
+def _configurar_backend_local(latencia):
+    import cache_respuestas
+    import peticiones_gemini
+    from backends_llm import BackendLocal
+    from cliente_gemini import configurar_backend
+
+    # Se mide nuestro overhead: sin caché de respuestas y sin límites de tasa de Gemini.
+    cache_respuestas.cache.activa = False
+    peticiones_gemini.limitador_peticiones = peticiones_gemini.TokenBucket(1e9, 1e9)
+    peticiones_gemini.limitador_tokens = peticiones_gemini.TokenBucket(1e12, 1e12)
+    configurar_backend(BackendLocal(latencia=latencia, semilla=1234))
+
+# --- 1. Pipeline "Generar Contenido": serie vs. concurrente ---
+def bench_pipeline(repeticiones, latencia):
+    from analizador_scripts import obtener_analisis
+    from generadores import (generar_contenido_completo, generar_contenido_una_llamada, generar_copy_hooks,
+                             generar_script)
+
+    _configurar_backend_local(latencia)
+
+    def en_serie(tema):
+        script = generar_script(tema, "persuasivo", "enérgico", 30)
+        generar_copy_hooks(tema, [script])
+        obtener_analisis(script)
+
+    def concurrente(tema):
+        for _ in generar_contenido_completo(tema, "persuasivo", "enérgico", 30):
+            pass
+
+    def una_llamada(tema):
+        for _ in generar_contenido_una_llamada(tema, "persuasivo", "enérgico", 30):
+            pass
+
+    resultados = {"latencia_modelo": latencia}
+    for nombre, funcion in (("serie", en_serie), ("concurrente", concurrente), ("una_llamada", una_llamada)):
+        tiempos = []
+        for i in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion(f"tema de prueba {i}")
+            tiempos.append(time.perf_counter() - inicio)
+        resultados[nombre] = _resumen_tiempos(tiempos)
+        resultados[nombre]["memoria_pico_mb"] = _memoria_pico(lambda: funcion("tema memoria"))
+    return resultados
+
+# --- 2. Throughput de los parsers ---
+def _corpus_parsers(tamano):
+    """Respuestas realistas (del backend local) y malformadas para copy/hooks y análisis."""
+    from backends_llm import BackendLocal
+
+    rng = random.Random(42)
+    backend = BackendLocal()
+    copy_hooks, analisis = [], []
+    for i in range(tamano):
+        tema = f"tema {i} {rng.choice(['IA', 'Fórmula 1', 'arepas', 'mindset'])}"
+        texto_copy = backend._copy_hooks(rng, tema)
+        texto_analisis = backend._analisis(rng)
+        tipo = i % 5
+        if tipo == 1:  # truncado a mitad
+            texto_copy = texto_copy[: len(texto_copy) // 2]
+            texto_analisis = texto_analisis[: len(texto_analisis) // 2]
+        elif tipo == 2:  # cabeceras con markdown
+            texto_copy = texto_copy.replace("Copy:", "**Copy:**").replace("Hooks:", "**Hooks:**")
+            texto_analisis = texto_analisis.replace("Puntuación:", "**Puntuación:**")
+        elif tipo == 3:  # texto libre sin formato
+            texto_copy = " ".join(rng.choice(["hola", "reel", "viral", "#tips", "🚀"]) for _ in range(80))
+            texto_analisis = texto_copy
+        copy_hooks.append(texto_copy)
+        analisis.append(texto_analisis)
+    return copy_hooks, analisis
+
+def bench_parsers(tamano):
+    from analizador_local import analizar_local, puntuar_lote
+    from analizador_scripts import parsear_analisis
+    from backends_llm import BackendLocal
+    from generadores import parsear_copy_hooks
+
+    corpus_copy, corpus_analisis = _corpus_parsers(tamano)
+    resultados = {"tamano_corpus": tamano}
+    for nombre, parser, corpus in (
+        ("copy_hooks", parsear_copy_hooks, corpus_copy),
+        ("analisis", parsear_analisis, corpus_analisis),
+    ):
+        megas = sum(len(t.encode("utf-8")) for t in corpus) / (1024 * 1024)
+        inicio = time.perf_counter()
+        for texto in corpus:
+            parser(texto)
+        segundos = time.perf_counter() - inicio
+        resultados[nombre] = {
+            "segundos": segundos,
+            "respuestas_por_s": tamano / segundos,
+            "mb_por_s": megas / segundos,
+            "memoria_pico_mb": _memoria_pico(lambda: [parser(t) for t in corpus[:1000]]),
+        }
+
+    # Analizador local: un script suelto (cada tecla en el Analizador) y en bloque (historial).
+    scripts = [BackendLocal._script(random.Random(i), f"tema {i}") for i in range(tamano)]
+    tiempos = []
+    for script in scripts[:1000]:
+        inicio = time.perf_counter()
+        analizar_local(script)
+        tiempos.append(time.perf_counter() - inicio)
+    inicio = time.perf_counter()
+    puntuar_lote(scripts)
+    segundos = time.perf_counter() - inicio
+    resultados["analizador_local"] = {
+        "individual": _resumen_tiempos(tiempos),
+        "lote_scripts_por_s": tamano / segundos,
+    }
+    return resultados
+
+# --- 3. Historial (en un proceso y directorio aislados por tamaño) ---
+def _bench_historial_interno(tamano, operaciones):
+    """Se ejecuta en un subproceso con el directorio de trabajo en una carpeta temporal."""
+    import json as _json
+    import historial_manager as hm
+
+    registro = {"fecha": "2025-01-01 00:00:00", "tema": "tema", "script": "Escena 1: texto. " * 40,
+                "copy_hooks": {"copy": "copy #tag", "hooks": ["a", "b", "c"], "titulo_shorts": "t"}}
+    with open(hm.HISTORY_LOG, "w", encoding="utf-8") as f:
+        for i in range(1, tamano + 1):
+            f.write(_json.dumps({"op": "add", "registro": {"id": i, **registro}}, ensure_ascii=False) + "\n")
+    with open(hm.almacen.ruta_meta, "w", encoding="utf-8") as f:
+        _json.dump({"ultimo_id": tamano, "agregados": tamano, "borrados": 0, "generacion": 0}, f)
+
+    resultados = {"registros": tamano}
+
+    inicio = time.perf_counter()
+    hm.cargar_historial()
+    resultados["cargar_frio_s"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    hm.cargar_historial()
+    resultados["cargar_caliente_s"] = time.perf_counter() - inicio
+
+    tiempos = []
+    for i in range(operaciones):
+        inicio = time.perf_counter()
+        hm.guardar_en_historial(f"nuevo {i}", registro["script"], registro["copy_hooks"])
+        tiempos.append(time.perf_counter() - inicio)
+    resultados["guardar"] = _resumen_tiempos(tiempos)
+
+    tiempos = []
+    for i in range(operaciones):
+        inicio = time.perf_counter()
+        hm.borrar_registros_seleccionados([i + 1])
+        tiempos.append(time.perf_counter() - inicio)
+    resultados["borrar"] = _resumen_tiempos(tiempos)
+
+    inicio = time.perf_counter()
+    hm.cargar_pagina_historial(1, 20)
+    resultados["pagina_s"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    hm.buscar_similares("tema")
+    resultados["similares_frio_s"] = time.perf_counter() - inicio
+    tiempos = []
+    for i in range(operaciones):
+        inicio = time.perf_counter()
+        hm.buscar_similares(f"nuevo tema {i}")
+        tiempos.append(time.perf_counter() - inicio)
+    resultados["similares"] = _resumen_tiempos(tiempos)
+
+    hm.registros_en_memoria._reiniciar()
+    hm.registros_en_memoria._cursor = None
+    resultados["cargar_memoria_pico_mb"] = _memoria_pico(hm.cargar_historial)
+    return resultados
+
+def bench_historial(tamanos, operaciones):
+    resultados = []
+    for tamano in tamanos:
+        with tempfile.TemporaryDirectory() as directorio:
+            salida = subprocess.run(
+                [sys.executable, os.path.join(DIRECTORIO, "benchmarks.py"),
+                 "--interno-historial", str(tamano), "--operaciones", str(operaciones)],
+                cwd=directorio, capture_output=True, text=True,
+                env={**os.environ, "PYTHONPATH": DIRECTORIO},
+            )
+            if salida.returncode != 0:
+                resultados.append({"registros": tamano, "error": salida.stderr.strip().splitlines()[-1:]})
+            else:
+                resultados.append(json.loads(salida.stdout))
+    return resultados
+
+# --- 4. Importación en frío ---
+def bench_importacion():
+    from cliente_gemini import medir_arranque
+
+    return medir_arranque((
+        "generadores", "analizador_scripts", "historial_manager", "cache_respuestas",
+        "peticiones_gemini", "cliente_gemini", "backends_llm", "indice_busqueda",
+    ))
+
+# --- Comparación entre ejecuciones ---
+def _aplanar(datos, prefijo=""):
+    planos = {}
+    if isinstance(datos, dict):
+        for clave, valor in datos.items():
+            planos.update(_aplanar(valor, f"{prefijo}{clave}."))
+    elif isinstance(datos, list):
+        for i, valor in enumerate(datos):
+            clave = valor.get("registros", valor.get("modulo", i)) if isinstance(valor, dict) else i
+            planos.update(_aplanar(valor, f"{prefijo}{clave}."))
+    elif isinstance(datos, (int, float)) and not isinstance(datos, bool):
+        planos[prefijo.rstrip(".")] = datos
+    return planos
+
+def comparar(actual, anterior, umbral=0.10):
+    """Imprime las métricas que cambian más de `umbral` (10%) respecto a la ejecución anterior."""
+    nuevos = _aplanar(actual["resultados"])
+    viejos = _aplanar(anterior["resultados"])
+    print(f"\nComparación con {anterior.get('commit', '?')}:")
+    for clave in sorted(nuevos):
+        if clave in viejos and viejos[clave]:
+            cambio = (nuevos[clave] - viejos[clave]) / viejos[clave]
+            if abs(cambio) >= umbral:
+                print(f"  {clave}: {viejos[clave]:.4g} -> {nuevos[clave]:.4g} ({cambio:+.0%})")
+
+def _commit_actual():
+    salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORIO, capture_output=True, text=True)
+    return salida.stdout.strip() or None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline del generador de contenido.")
+    parser.add_argument("--salida", default="bench_resultados.json")
+    parser.add_argument("--comparar", help="JSON de una ejecución anterior para comparar.")
+    parser.add_argument("--repeticiones", type=int, default=20, help="Repeticiones del pipeline.")
+    parser.add_argument("--latencia", default="fija:0.05", help="Latencia del backend local (ver backends_llm).")
+    parser.add_argument("--corpus", type=int, default=20000, help="Respuestas por parser.")
+    parser.add_argument("--tamanos", default="1000,10000,100000", help="Tamaños del historial.")
+    parser.add_argument("--operaciones", type=int, default=50, help="Guardados/borrados por tamaño.")
+    parser.add_argument("--interno-historial", type=int, help=argparse.SUPPRESS)
+    argumentos = parser.parse_args(argv)
+
+    if argumentos.interno_historial is not None:
+        print(json.dumps(_bench_historial_interno(argumentos.interno_historial, argumentos.operaciones)))
+        return
+
+    resultados = {}
+    for nombre, funcion in (
+        ("importacion", bench_importacion),
+        ("pipeline", lambda: bench_pipeline(argumentos.repeticiones, argumentos.latencia)),
+        ("parsers", lambda: bench_parsers(argumentos.corpus)),
+        ("historial", lambda: bench_historial([int(t) for t in argumentos.tamanos.split(",")], argumentos.operaciones)),
+    ):
+        print(f"Ejecutando benchmark: {nombre}...")
+        resultados[nombre] = funcion()
+
+    informe = {
+        "commit": _commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "resultados": resultados,
+    }
+    with open(argumentos.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {argumentos.salida}")
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, "r", encoding="utf-8") as f:
+            comparar(informe, json.load(f))
+
+if __name__ == "__main__":
+    main()
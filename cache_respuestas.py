@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# --- Configuración de la caché de respuestas ---
+CACHE_DIR = os.environ.get("CACHE_GEMINI_DIR", ".cache_gemini")
+CACHE_MAX_ENTRADAS_MEMORIA = int(os.environ.get("CACHE_GEMINI_MEMORIA", "256"))
+CACHE_MAX_MB_DISCO = float(os.environ.get("CACHE_GEMINI_MAX_MB", "50"))
+CACHE_TTL_HORAS = float(os.environ.get("CACHE_GEMINI_TTL_HORAS", "168"))
+# Con CACHE_GEMINI_ACTIVA=0 todas las llamadas van al modelo (útil en pruebas de carga).
+CACHE_ACTIVA = os.environ.get("CACHE_GEMINI_ACTIVA", "1") != "0"
+
+def es_determinista(generation_config):
+    """
+    Solo se cachean las llamadas con temperatura 0 (p. ej. el análisis): con otra
+    temperatura, pedir otra vez lo mismo (regenerar un script) debe dar otro texto.
+    """
+    return (generation_config or {}).get("temperature") == 0
+
+def clave_cache(modelo, prompt, generation_config=None):
+    """
+    Calcula la clave de contenido (SHA-256) de una petición al modelo.
+    Dos peticiones con el mismo modelo, prompt y configuración comparten clave.
+    """
+    material = json.dumps(
+        {"modelo": modelo, "prompt": prompt, "config": generation_config or {}},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+class CacheRespuestas:
+    """
+    Caché de dos niveles para respuestas de texto del modelo:
+    un LRU en memoria del proceso y un directorio en disco con expiración por
+    TTL y un tamaño máximo (se eliminan primero los archivos más antiguos).
+    El tamaño en disco se lleva en memoria: el directorio se recorre una sola vez,
+    en la primera escritura, así que los archivos que escriban otros procesos
+    después no cuentan hasta el siguiente arranque.
+    """
+
+    def __init__(self, directorio=CACHE_DIR, max_entradas=CACHE_MAX_ENTRADAS_MEMORIA,
+                 max_mb=CACHE_MAX_MB_DISCO, ttl_horas=CACHE_TTL_HORAS):
+        self.directorio = directorio
+        self.max_entradas = max_entradas
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl_segundos = ttl_horas * 3600
+        self.activa = CACHE_ACTIVA
+        self._memoria = OrderedDict()
+        # Entradas en disco {clave: (creado, bytes)} de la más antigua a la más nueva;
+        # None hasta que se recorre el directorio.
+        self._disco = None
+        self._bytes_disco = 0
+        self._lock = threading.Lock()
+        self.estadisticas = {"aciertos_memoria": 0, "aciertos_disco": 0, "fallos": 0, "escrituras": 0}
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def obtener(self, clave):
+        """Devuelve el texto cacheado para la clave o None si no existe o expiró."""
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                creado, valor = entrada
+                if time.time() - creado <= self.ttl_segundos:
+                    self._memoria.move_to_end(clave)
+                    self.estadisticas["aciertos_memoria"] += 1
+                    return valor
+                del self._memoria[clave]
+
+        entrada = self._leer_disco(clave)
+        with self._lock:
+            if entrada is None:
+                self.estadisticas["fallos"] += 1
+                return None
+            creado, valor = entrada
+            self.estadisticas["aciertos_disco"] += 1
+            # Con la fecha original: subir a memoria no alarga el TTL.
+            self._guardar_memoria(clave, valor, creado)
+        return valor
+
+    def guardar(self, clave, valor):
+        """Guarda el texto en ambos niveles de la caché."""
+        ahora = time.time()
+        with self._lock:
+            self._guardar_memoria(clave, valor, ahora)
+            self.estadisticas["escrituras"] += 1
+        self._escribir_disco(clave, valor, ahora)
+
+    def limpiar(self):
+        """Vacía la caché en memoria y en disco."""
+        with self._lock:
+            self._memoria.clear()
+            self._disco = None
+            self._bytes_disco = 0
+        if os.path.isdir(self.directorio):
+            for nombre in os.listdir(self.directorio):
+                if nombre.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.directorio, nombre))
+                    except OSError:
+                        pass
+
+    def _guardar_memoria(self, clave, valor, creado):
+        self._memoria[clave] = (creado, valor)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    def _leer_disco(self, clave):
+        """Devuelve (creado, valor) de la entrada en disco, o None si no existe o expiró."""
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            creado = datos.get("creado") or os.path.getmtime(ruta)
+            if time.time() - creado > self.ttl_segundos:
+                self._borrar_disco([clave])
+                return None
+            return creado, datos.get("valor")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _escribir_disco(self, clave, valor, creado):
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            ruta = self._ruta(clave)
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({"creado": creado, "valor": valor}, f, ensure_ascii=False)
+            tamano = os.path.getsize(temporal)
+            os.replace(temporal, ruta)
+        except OSError:
+            # La caché en disco es una optimización: si falla, seguimos sin ella.
+            return
+        with self._lock:
+            self._contar_disco()
+            if clave in self._disco:
+                self._bytes_disco -= self._disco.pop(clave)[1]
+            self._disco[clave] = (creado, tamano)
+            self._bytes_disco += tamano
+            victimas = self._desalojar_disco(creado)
+        self._borrar_disco(victimas)
+
+    def _contar_disco(self):
+        """Recorre el directorio la primera vez para saber qué hay ya en disco (con el lock)."""
+        if self._disco is not None:
+            return
+        entradas = []
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            nombres = []
+        for nombre in nombres:
+            if not nombre.endswith(".json"):
+                continue
+            try:
+                info = os.stat(os.path.join(self.directorio, nombre))
+            except OSError:
+                continue
+            entradas.append((info.st_mtime, nombre[:-len(".json")], info.st_size))
+        self._disco = OrderedDict((clave, (creado, tamano)) for creado, clave, tamano in sorted(entradas))
+        self._bytes_disco = sum(tamano for _, tamano in self._disco.values())
+
+    def _desalojar_disco(self, ahora):
+        """
+        Saca de la cuenta las entradas expiradas y, si se supera el tamaño máximo,
+        las más antiguas (con el lock). Devuelve sus claves para borrarlas.
+        """
+        victimas = []
+        while self._disco:
+            clave, (creado, tamano) = next(iter(self._disco.items()))
+            if ahora - creado <= self.ttl_segundos and self._bytes_disco <= self.max_bytes:
+                break
+            del self._disco[clave]
+            self._bytes_disco -= tamano
+            victimas.append(clave)
+        return victimas
+
+    def _borrar_disco(self, claves):
+        for clave in claves:
+            with self._lock:
+                if self._disco is not None and clave in self._disco:
+                    self._bytes_disco -= self._disco.pop(clave)[1]
+            try:
+                os.remove(self._ruta(clave))
+            except OSError:
+                pass
+
+    def resumen(self):
+        """Devuelve una copia de los contadores de aciertos y fallos."""
+        with self._lock:
+            datos = dict(self.estadisticas)
+            datos["entradas_memoria"] = len(self._memoria)
+            datos["entradas_disco"] = len(self._disco) if self._disco is not None else None
+            datos["bytes_disco"] = self._bytes_disco if self._disco is not None else None
+        aciertos = datos["aciertos_memoria"] + datos["aciertos_disco"]
+        consultas = aciertos + datos["fallos"]
+        datos["tasa_aciertos"] = aciertos / consultas if consultas else 0.0
+        return datos
+
+cache = CacheRespuestas()
+
+def respuesta_cacheada(modelo, prompt, generation_config, generar):
+    """
+    Devuelve la respuesta cacheada para (modelo, prompt, generation_config).
+    Si no existe, llama a `generar()` y guarda el texto obtenido (solo si no está vacío).
+    Las llamadas no deterministas (ver `es_determinista`) van siempre al modelo.
+    """
+    if not cache.activa or not es_determinista(generation_config):
+        return generar()
+    clave = clave_cache(modelo, prompt, generation_config)
+    texto = cache.obtener(clave)
+    if texto is not None:
+        return texto
+    texto = generar()
+    if texto:
+        cache.guardar(clave, texto)
+    return texto
+
+def respuesta_cacheada_stream(modelo, prompt, generation_config, generar_stream):
+    """
+    Igual que `respuesta_cacheada`, pero para respuestas en streaming:
+    si hay acierto se devuelve el texto completo como único fragmento; si no,
+    se reenvían los fragmentos de `generar_stream()` y al terminar se guarda el total.
+    """
+    if not cache.activa or not es_determinista(generation_config):
+        yield from generar_stream()
+        return
+    clave = clave_cache(modelo, prompt, generation_config)
+    texto = cache.obtener(clave)
+    if texto is not None:
+        yield texto
+        return
+    partes = []
+    for fragmento in generar_stream():
+        partes.append(fragmento)
+        yield fragmento
+    texto = "".join(partes)
+    if texto:
+        cache.guardar(clave, texto)
+
+def estadisticas_cache():
+    """Devuelve los contadores de aciertos/fallos de la caché de respuestas."""
+    return cache.resumen()
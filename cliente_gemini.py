@@ -0,0 +1,122 @@
+import logging
+import os
+import sys
+import threading
+
+# --- Cliente compartido del modelo de lenguaje ---
+# El SDK (google.generativeai) es pesado de importar, así que no se importa hasta
+# la primera llamada a `obtener_cliente`. Hay una sola instancia del modelo por
+# proceso (bajo Streamlit, en su caché de recursos) y este módulo nunca pinta
+# nada en la interfaz al importarse.
+#
+# El backend se elige con LLM_BACKEND: "gemini" (por defecto) o "local", un stub
+# determinista sin red para pruebas de carga y CI (ver backends_llm.BackendLocal).
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL_NAME = os.environ.get("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+
+_cliente = None
+_error_cliente = None
+_lock = threading.Lock()
+
+def _crear_cliente():
+    """Crea el backend configurado. Lanza excepción si no es posible."""
+    from backends_llm import BackendGemini, BackendLocal
+
+    if LLM_BACKEND == "local":
+        return BackendLocal.desde_entorno()
+    if LLM_BACKEND != "gemini":
+        raise RuntimeError(f"LLM_BACKEND desconocido: {LLM_BACKEND!r} (usa 'gemini' o 'local').")
+
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY no encontrada. Revisa los secretos de Streamlit Cloud o tu archivo .env")
+    return BackendGemini(GEMINI_MODEL_NAME, api_key)
+
+def contexto_streamlit():
+    """Devuelve el contexto de ejecución de Streamlit si se está dentro de una página, si no None."""
+    if "streamlit" not in sys.modules:
+        return None
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    return get_script_run_ctx()
+
+def _crear_cliente_streamlit():
+    import streamlit as st
+
+    @st.cache_resource(show_spinner=False)
+    def cliente_cacheado(modelo):
+        return _crear_cliente()
+
+    return cliente_cacheado(GEMINI_MODEL_NAME)
+
+def obtener_cliente():
+    """
+    Devuelve el modelo de Gemini compartido, creándolo en la primera llamada.
+    Si no se puede crear devuelve None; el motivo queda en `error_cliente()`.
+    """
+    global _cliente, _error_cliente
+    if _cliente is not None:
+        return _cliente
+    with _lock:
+        if _cliente is None:
+            try:
+                if contexto_streamlit() is not None:
+                    _cliente = _crear_cliente_streamlit()
+                else:
+                    _cliente = _crear_cliente()
+                _error_cliente = None
+            except Exception as e:
+                _error_cliente = str(e)
+                logger.error("Error al configurar la API de Gemini o inicializar el modelo: %s", e)
+    return _cliente
+
+def configurar_backend(backend):
+    """
+    Sustituye el backend del proceso por `backend` (p. ej. un `BackendLocal` con una
+    configuración concreta en benchmarks). Con None se vuelve a crear según el entorno.
+    """
+    global _cliente, _error_cliente
+    with _lock:
+        _cliente = backend
+        _error_cliente = None
+
+def error_cliente():
+    """Motivo por el que no se pudo crear el cliente (o None si no hubo error)."""
+    return _error_cliente
+
+def medir_arranque(modulos=("generadores", "analizador_scripts", "historial_manager")):
+    """
+    Mide, en un intérprete limpio por módulo, cuánto tarda su importación en frío
+    y si arrastra el SDK de Gemini o Streamlit. Devuelve una lista de diccionarios.
+    """
+    import json
+    import subprocess
+
+    codigo = (
+        "import json, sys, time\n"
+        "inicio = time.perf_counter()\n"
+        "import {modulo}\n"
+        "print(json.dumps({{'modulo': '{modulo}', 'segundos': time.perf_counter() - inicio,"
+        " 'sdk_cargado': 'google.generativeai' in sys.modules,"
+        " 'streamlit_cargado': 'streamlit' in sys.modules}}))\n"
+    )
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    resultados = []
+    for modulo in modulos:
+        salida = subprocess.run(
+            [sys.executable, "-c", codigo.format(modulo=modulo)],
+            cwd=directorio, capture_output=True, text=True
+        )
+        if salida.returncode != 0:
+            resultados.append({"modulo": modulo, "error": salida.stderr.strip().splitlines()[-1:]})
+        else:
+            resultados.append(json.loads(salida.stdout))
+    return resultados
@@ -0,0 +1,374 @@
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# --- Cola de trabajos en segundo plano ---
+# La generación no se ejecuta en el hilo de la página: el botón envía un trabajo
+# a un pool de hilos del proceso y vuelve al instante. La página consulta el
+# estado de cada etapa mientras tanto, así que un rerun (tocar un widget) o
+# recargar el navegador no interrumpe la generación ni pierde el resultado.
+#
+# Cada trabajo se guarda como un JSON en TRABAJOS_DIR (temporal + rename
+# atómico) al cambiar de estado o terminar una etapa. TRABAJOS_DIR puede ser
+# compartido por varios procesos o réplicas: cada trabajo lleva su propietario
+# (host, pid e instancia) y un latido que el propietario renueva cada
+# TRABAJOS_LATIDO_S mientras el trabajo está activo. Un trabajo activo solo se
+# marca "interrumpido" (y se puede reintentar) cuando su propietario ya no
+# existe: el latido caducó o era un proceso de este host que ya terminó.
+
+TRABAJOS_DIR = os.environ.get("TRABAJOS_DIR", ".trabajos")
+TRABAJOS_WORKERS = int(os.environ.get("TRABAJOS_WORKERS", "2"))
+TRABAJOS_MAX = int(os.environ.get("TRABAJOS_MAX", "100"))
+TRABAJOS_LATIDO_S = float(os.environ.get("TRABAJOS_LATIDO_S", "10"))
+# Sin latido durante este tiempo, el propietario se da por muerto.
+TRABAJOS_CADUCIDAD_S = float(os.environ.get("TRABAJOS_CADUCIDAD_S", str(3 * TRABAJOS_LATIDO_S)))
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+COMPLETADO = "completado"
+ERROR = "error"
+CANCELADO = "cancelado"
+INTERRUMPIDO = "interrumpido"
+
+ID_TRABAJO_REGEX = re.compile(r"[0-9a-f]{12}")
+
+ESTADOS_ACTIVOS = (PENDIENTE, EN_CURSO)
+ESTADOS_REINTENTABLES = (ERROR, CANCELADO, INTERRUMPIDO)
+
+class TrabajoCancelado(Exception):
+    """El trabajo se canceló mientras se ejecutaba."""
+
+def ejecutar_contenido(parametros, al_etapa, al_fragmento_script, cancelado):
+    """
+    Ejecuta el pipeline de contenido de un trabajo. Avisa a `al_etapa` con cada
+    `ResultadoEtapa` y a `al_fragmento_script` con el script parcial en streaming.
+    Entre etapas comprueba `cancelado()`; si es True lanza `TrabajoCancelado`.
+    """
+    from generadores import generar_contenido_completo, generar_contenido_una_llamada, script_valido
+
+    argumentos = (parametros["tema"], parametros["objetivo"], parametros["estilo"], parametros["duracion"])
+    if parametros.get("una_llamada"):
+        etapas = generar_contenido_una_llamada(*argumentos)
+    else:
+        etapas = generar_contenido_completo(*argumentos, al_fragmento_script=al_fragmento_script,
+                                            variantes=parametros.get("variantes", 1))
+    resultados = {}
+    try:
+        for etapa in etapas:
+            if cancelado():
+                raise TrabajoCancelado()
+            valor = etapa.resultado
+            if etapa.etapa == "variantes":
+                valor = [variante._asdict() for variante in valor]
+            resultados[etapa.etapa] = valor
+            al_etapa(etapa.etapa, valor, etapa.segundos)
+    finally:
+        etapas.close()
+
+    if parametros.get("guardar_historial") and script_valido(resultados.get("script")):
+        from historial_manager import guardar_en_historial
+        guardar_en_historial(parametros["tema"], resultados["script"], resultados["copy_hooks"],
+                             resultados.get("analisis"), parametros.get("nicho"))
+
+EJECUTORES = {"contenido": ejecutar_contenido}
+
+class ColaTrabajos:
+    """
+    Trabajos en un pool de hilos con su estado persistido en disco. Los trabajos
+    se consultan por id desde cualquier sesión y sobreviven a los reruns de la página.
+    """
+
+    def __init__(self, directorio=TRABAJOS_DIR, workers=TRABAJOS_WORKERS, max_trabajos=TRABAJOS_MAX,
+                 latido=TRABAJOS_LATIDO_S, caducidad=TRABAJOS_CADUCIDAD_S):
+        self.directorio = directorio
+        self.max_trabajos = max_trabajos
+        self.latido = latido
+        self.caducidad = caducidad
+        self.propietario = {"host": socket.gethostname(), "pid": os.getpid(), "instancia": uuid.uuid4().hex}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="trabajo")
+        self._trabajos = {}
+        self._cancelar = {}
+        # mtime (ns) del archivo de cada trabajo ajeno la última vez que se leyó.
+        self._mtimes = {}
+        self._lock = threading.Lock()
+        self._sincronizar()
+        threading.Thread(target=self._latir, name="trabajos-latido", daemon=True).start()
+
+    # --- Persistencia ---
+    def _ruta(self, id_trabajo):
+        return os.path.join(self.directorio, f"{id_trabajo}.json")
+
+    def _leer(self, ruta):
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _sincronizar(self):
+        """
+        Incorpora los trabajos de otros procesos que hay en el directorio (nuevos o
+        cambiados desde la última lectura) y olvida los que ya no están. Los activos
+        de un propietario muerto se dan por interrumpidos.
+        """
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return
+        en_disco = set()
+        for nombre in nombres:
+            id_trabajo = nombre[:-len(".json")]
+            if not nombre.endswith(".json") or not ID_TRABAJO_REGEX.fullmatch(id_trabajo):
+                continue
+            en_disco.add(id_trabajo)
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is not None and self._en_ejecucion_aqui(trabajo):
+                continue
+            try:
+                mtime = os.stat(self._ruta(id_trabajo)).st_mtime_ns
+            except OSError:
+                continue
+            if trabajo is None or self._mtimes.get(id_trabajo) != mtime:
+                trabajo = self._leer(self._ruta(id_trabajo))
+                if trabajo is None:
+                    continue
+                self._mtimes[id_trabajo] = mtime
+            self._trabajos[id_trabajo] = self._revisar_ajeno(trabajo)
+        # Los que se leyeron del disco y ya no están los purgó otro proceso.
+        for id_trabajo in [i for i in self._mtimes if i not in en_disco]:
+            self._trabajos.pop(id_trabajo, None)
+            del self._mtimes[id_trabajo]
+
+    def _en_ejecucion_aqui(self, trabajo):
+        """Solo de los trabajos activos de este proceso es la copia en memoria la que manda."""
+        return trabajo["estado"] in ESTADOS_ACTIVOS and self._es_propio(trabajo)
+
+    def _releer_ajeno(self, id_trabajo):
+        """
+        Trabajo leído del disco, que manda sobre la copia en memoria: otra réplica
+        puede haberlo creado, reintentado o terminado. None si no está.
+        """
+        if not isinstance(id_trabajo, str) or not ID_TRABAJO_REGEX.fullmatch(id_trabajo):
+            return None
+        trabajo = self._leer(self._ruta(id_trabajo))
+        if trabajo is None:
+            return self._trabajos.get(id_trabajo)
+        self._trabajos[id_trabajo] = trabajo = self._revisar_ajeno(trabajo)
+        return trabajo
+
+    def _es_propio(self, trabajo):
+        return (trabajo.get("propietario") or {}).get("instancia") == self.propietario["instancia"]
+
+    def _propietario_vivo(self, trabajo):
+        """Indica si el proceso que ejecuta el trabajo sigue vivo (latido reciente y, en este host, su pid)."""
+        if self._es_propio(trabajo):
+            return True
+        if time.time() - trabajo.get("latido", 0) > self.caducidad:
+            return False
+        propietario = trabajo.get("propietario") or {}
+        if propietario.get("host") != self.propietario["host"]:
+            return True
+        try:
+            os.kill(propietario.get("pid"), 0)
+        except ProcessLookupError:
+            return False
+        except (OSError, TypeError):
+            pass
+        return True
+
+    def _revisar_ajeno(self, trabajo):
+        """Marca como interrumpido un trabajo activo cuyo propietario ya no existe."""
+        if trabajo["estado"] in ESTADOS_ACTIVOS and not self._propietario_vivo(trabajo):
+            trabajo["estado"] = INTERRUMPIDO
+            trabajo["error"] = "El proceso que ejecutaba el trabajo terminó antes de acabarlo."
+            trabajo["actualizado"] = time.time()
+            self._guardar(trabajo)
+        return trabajo
+
+    def _latir(self):
+        """Renueva el latido de los trabajos activos de este proceso."""
+        while True:
+            time.sleep(self.latido)
+            with self._lock:
+                for trabajo in self._trabajos.values():
+                    if trabajo["estado"] in ESTADOS_ACTIVOS and self._es_propio(trabajo):
+                        trabajo["latido"] = time.time()
+                        self._guardar(trabajo)
+
+    def _guardar(self, trabajo):
+        """Escribe el trabajo en disco. Si falla, el trabajo sigue en memoria."""
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            ruta = self._ruta(trabajo["id"])
+            temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({k: v for k, v in trabajo.items() if k != "script_parcial"}, f, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            logger.warning("No se pudo guardar el trabajo %s: %s", trabajo["id"], e)
+
+    def _purgar(self):
+        """Elimina los trabajos terminados más antiguos por encima de `max_trabajos`."""
+        terminados = sorted(
+            (t for t in self._trabajos.values() if t["estado"] not in ESTADOS_ACTIVOS),
+            key=lambda t: t["creado"]
+        )
+        for trabajo in terminados[:max(0, len(self._trabajos) - self.max_trabajos)]:
+            del self._trabajos[trabajo["id"]]
+            self._cancelar.pop(trabajo["id"], None)
+            self._mtimes.pop(trabajo["id"], None)
+            try:
+                os.remove(self._ruta(trabajo["id"]))
+            except OSError:
+                pass
+
+    # --- Ejecución ---
+    def _actualizar(self, id_trabajo, persistir=True, **cambios):
+        with self._lock:
+            trabajo = self._trabajos[id_trabajo]
+            trabajo.update(cambios)
+            trabajo["actualizado"] = time.time()
+            if persistir:
+                self._guardar(trabajo)
+
+    def _ejecutar(self, id_trabajo):
+        with self._lock:
+            cancelar = self._cancelar[id_trabajo]
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None or cancelar.is_set():
+                return
+            tipo, parametros = trabajo["tipo"], dict(trabajo["parametros"])
+            trabajo.update(estado=EN_CURSO, iniciado=time.time(), actualizado=time.time())
+            self._guardar(trabajo)
+        inicio = time.perf_counter()
+
+        def al_etapa(etapa, resultado, segundos):
+            with self._lock:
+                trabajo = self._trabajos[id_trabajo]
+                trabajo["resultados"][etapa] = resultado
+                trabajo["etapas"][etapa] = round(segundos, 3)
+                trabajo["script_parcial"] = ""
+                trabajo["actualizado"] = time.time()
+                self._guardar(trabajo)
+
+        def al_fragmento_script(texto):
+            # Cortar el streaming es la forma más rápida de atender una cancelación.
+            if cancelar.is_set():
+                raise TrabajoCancelado()
+            # El texto parcial solo vive en memoria: se descarta al terminar la etapa.
+            self._actualizar(id_trabajo, persistir=False, script_parcial=texto)
+
+        try:
+            EJECUTORES[tipo](parametros, al_etapa, al_fragmento_script, cancelar.is_set)
+        except TrabajoCancelado:
+            estado, error = CANCELADO, None
+        except Exception as e:
+            logger.exception("Falló el trabajo %s", id_trabajo)
+            estado, error = ERROR, str(e)
+        else:
+            estado, error = (CANCELADO, None) if cancelar.is_set() else (COMPLETADO, None)
+        with self._lock:
+            trabajo = self._trabajos[id_trabajo]
+            trabajo["etapas"]["total"] = round(time.perf_counter() - inicio, 3)
+        self._actualizar(id_trabajo, estado=estado, error=error, terminado=time.time())
+        metricas.incrementar("trabajos_total", tipo=tipo, estado=estado)
+
+    def _lanzar(self, id_trabajo):
+        # `_cancelar[id_trabajo]` ya existe: se crea con el lock, al encolar el trabajo.
+        self._pool.submit(self._ejecutar, id_trabajo)
+
+    # --- API pública ---
+    def enviar(self, parametros, tipo="contenido"):
+        """Encola un trabajo y devuelve su id sin esperar a que se ejecute."""
+        if tipo not in EJECUTORES:
+            raise ValueError(f"Tipo de trabajo desconocido: {tipo!r}")
+        ahora = time.time()
+        trabajo = {
+            "id": uuid.uuid4().hex[:12],
+            "tipo": tipo,
+            "parametros": dict(parametros),
+            "estado": PENDIENTE,
+            "etapas": {},
+            "resultados": {},
+            "error": None,
+            "intentos": 1,
+            "creado": ahora,
+            "actualizado": ahora,
+            "propietario": self.propietario,
+            "latido": ahora,
+        }
+        with self._lock:
+            self._trabajos[trabajo["id"]] = trabajo
+            self._cancelar[trabajo["id"]] = threading.Event()
+            self._guardar(trabajo)
+            self._purgar()
+        self._lanzar(trabajo["id"])
+        return trabajo["id"]
+
+    def obtener(self, id_trabajo):
+        """
+        Copia del estado actual del trabajo, o None si no existe. Salvo los que
+        este proceso está ejecutando, los trabajos se leen del disco compartido.
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None or not self._en_ejecucion_aqui(trabajo):
+                trabajo = self._releer_ajeno(id_trabajo)
+            return json.loads(json.dumps(trabajo)) if trabajo is not None else None
+
+    def listar(self, limite=20):
+        """
+        Los `limite` trabajos más recientes (resumen sin resultados), del más nuevo
+        al más antiguo, incluidos los que otros procesos dejaron en el directorio.
+        """
+        with self._lock:
+            self._sincronizar()
+            trabajos = sorted(self._trabajos.values(), key=lambda t: t["creado"], reverse=True)[:limite]
+            return [{k: v for k, v in t.items() if k not in ("resultados", "script_parcial")} for t in trabajos]
+
+    def cancelar(self, id_trabajo):
+        """
+        Pide cancelar un trabajo pendiente o en curso. Los pendientes no llegan a
+        empezar; los que están en curso cortan el streaming del script o paran al
+        terminar la etapa actual.
+        Devuelve False si el trabajo no existe, ya había terminado o lo ejecuta otro proceso.
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None or trabajo["estado"] not in ESTADOS_ACTIVOS or not self._es_propio(trabajo):
+                return False
+            self._cancelar[id_trabajo].set()
+            if trabajo["estado"] == PENDIENTE:
+                trabajo.update(estado=CANCELADO, actualizado=time.time())
+                self._guardar(trabajo)
+                metricas.incrementar("trabajos_total", tipo=trabajo["tipo"], estado=CANCELADO)
+        return True
+
+    def reintentar(self, id_trabajo):
+        """Vuelve a encolar un trabajo fallido, cancelado o interrumpido con los mismos parámetros."""
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None or not self._en_ejecucion_aqui(trabajo):
+                # Otro proceso puede haberlo reintentado ya: manda lo que hay en disco.
+                trabajo = self._releer_ajeno(id_trabajo)
+            if trabajo is None or trabajo["estado"] not in ESTADOS_REINTENTABLES:
+                return False
+            trabajo.update(estado=PENDIENTE, etapas={}, resultados={}, error=None,
+                           intentos=trabajo["intentos"] + 1, actualizado=time.time(),
+                           propietario=self.propietario, latido=time.time())
+            self._cancelar[id_trabajo] = threading.Event()
+            self._guardar(trabajo)
+        self._lanzar(id_trabajo)
+        return True
+
+cola = ColaTrabajos()
@@ -0,0 +1,232 @@
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from analizador_scripts import ORDERED_SECTION_TITLES, SECCIONES_CON_PUNTUACION
+
+# --- Generación estructurada en una sola llamada ---
+# Script, copy/hooks y análisis se piden juntos con `response_mime_type` JSON y
+# un esquema. La respuesta se valida en dataclasses y se convierte a los mismos
+# formatos que el pipeline de tres llamadas (texto del script, diccionario de
+# copy/hooks y análisis con secciones), así que la UI y el historial no cambian.
+
+DIMENSIONES_ANALISIS = [titulo.split(". ", 1)[1] for titulo in ORDERED_SECTION_TITLES]
+
+_TEXTO = {"type": "STRING"}
+_LISTA_TEXTOS = {"type": "ARRAY", "items": _TEXTO}
+
+ESQUEMA_CONTENIDO = {
+    "type": "OBJECT",
+    "properties": {
+        "script": {
+            "type": "OBJECT",
+            "properties": {
+                "titulo": _TEXTO,
+                "gancho": _TEXTO,
+                "escenas": _LISTA_TEXTOS,
+                "llamada_accion": _TEXTO,
+                "elementos_visuales": _LISTA_TEXTOS,
+            },
+            "required": ["titulo", "gancho", "escenas", "llamada_accion", "elementos_visuales"],
+        },
+        "titulo_shorts": _TEXTO,
+        "copy": _TEXTO,
+        "hooks": _LISTA_TEXTOS,
+        "analisis": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "dimension": {"type": "STRING", "enum": DIMENSIONES_ANALISIS},
+                    "descripcion": _TEXTO,
+                    "puntuacion": {"type": "INTEGER", "nullable": True},
+                    "sugerencia": _TEXTO,
+                },
+                "required": ["dimension", "descripcion"],
+            },
+        },
+    },
+    "required": ["script", "titulo_shorts", "copy", "hooks", "analisis"],
+}
+
+CONFIG_ESTRUCTURADA = {
+    "max_output_tokens": 2048,
+    "temperature": 0.7,
+    "response_mime_type": "application/json",
+    "response_schema": ESQUEMA_CONTENIDO,
+}
+
+class RespuestaEstructuradaInvalida(ValueError):
+    """La respuesta JSON del modelo no cumple el esquema esperado."""
+
+def _texto(datos, clave):
+    valor = datos.get(clave)
+    if not isinstance(valor, str) or not valor.strip():
+        raise RespuestaEstructuradaInvalida(f"Falta el campo de texto '{clave}'.")
+    return valor.strip()
+
+def _lista_textos(datos, clave, minimo=1):
+    valores = datos.get(clave)
+    if not isinstance(valores, list):
+        raise RespuestaEstructuradaInvalida(f"El campo '{clave}' debe ser una lista.")
+    textos = [v.strip() for v in valores if isinstance(v, str) and v.strip()]
+    if len(textos) < minimo:
+        raise RespuestaEstructuradaInvalida(f"El campo '{clave}' necesita al menos {minimo} elemento(s).")
+    return textos
+
+@dataclass
+class ScriptReel:
+    titulo: str
+    gancho: str
+    escenas: List[str]
+    llamada_accion: str
+    elementos_visuales: List[str]
+
+    @classmethod
+    def desde_dict(cls, datos):
+        if not isinstance(datos, dict):
+            raise RespuestaEstructuradaInvalida("El campo 'script' debe ser un objeto.")
+        return cls(
+            titulo=_texto(datos, "titulo"),
+            gancho=_texto(datos, "gancho"),
+            escenas=_lista_textos(datos, "escenas"),
+            llamada_accion=_texto(datos, "llamada_accion"),
+            elementos_visuales=_lista_textos(datos, "elementos_visuales", minimo=0),
+        )
+
+    def como_texto(self):
+        """El script con el mismo formato markdown que pide `construir_prompt_script`."""
+        escenas = "\n".join(
+            escena if escena.lower().startswith("escena") else f"Escena {i}: {escena}"
+            for i, escena in enumerate(self.escenas, 1)
+        )
+        visuales = "\n".join(f"- {elemento}" for elemento in self.elementos_visuales)
+        return (
+            f"**Título:** {self.titulo}\n\n"
+            f"**Gancho:**\n{self.gancho}\n\n"
+            f"**Desarrollo del Contenido:**\n{escenas}\n\n"
+            f"**Llamada a la Acción:**\n{self.llamada_accion}\n\n"
+            f"**Elementos Visuales/Sonido:**\n{visuales}\n"
+        )
+
+@dataclass
+class PuntuacionDimension:
+    dimension: str
+    descripcion: str
+    puntuacion: Optional[int] = None
+    sugerencia: str = ""
+
+    @classmethod
+    def desde_dict(cls, datos):
+        if not isinstance(datos, dict) or datos.get("dimension") not in DIMENSIONES_ANALISIS:
+            raise RespuestaEstructuradaInvalida(f"Dimensión de análisis desconocida: {datos!r:.80}")
+        puntuacion = datos.get("puntuacion")
+        if datos["dimension"] in SECCIONES_CON_PUNTUACION:
+            if isinstance(puntuacion, bool) or not isinstance(puntuacion, (int, float)):
+                raise RespuestaEstructuradaInvalida(f"Falta la puntuación de '{datos['dimension']}'.")
+            puntuacion = min(100, max(0, int(puntuacion)))
+        else:
+            puntuacion = None
+        sugerencia = datos.get("sugerencia")
+        return cls(
+            dimension=datos["dimension"],
+            descripcion=_texto(datos, "descripcion"),
+            puntuacion=puntuacion,
+            sugerencia=sugerencia.strip() if isinstance(sugerencia, str) else "",
+        )
+
+    def como_seccion(self):
+        """Sección con el mismo formato que `analizador_scripts.parsear_seccion`."""
+        return {
+            "titulo": self.dimension,
+            "descripcion": self.descripcion,
+            "puntuacion": self.puntuacion,
+            "sugerencia": self.sugerencia,
+        }
+
+@dataclass
+class ContenidoReel:
+    script: ScriptReel
+    titulo_shorts: str
+    copy: str
+    hooks: List[str]
+    analisis: List[PuntuacionDimension] = field(default_factory=list)
+
+    @classmethod
+    def desde_json(cls, texto):
+        """Valida la respuesta JSON del modelo. Lanza `RespuestaEstructuradaInvalida` si no encaja."""
+        try:
+            datos = json.loads(texto)
+        except (TypeError, json.JSONDecodeError) as e:
+            raise RespuestaEstructuradaInvalida(f"La respuesta no es JSON válido: {e}") from e
+        if not isinstance(datos, dict):
+            raise RespuestaEstructuradaInvalida("La respuesta debe ser un objeto JSON.")
+
+        analisis = datos.get("analisis")
+        if not isinstance(analisis, list):
+            raise RespuestaEstructuradaInvalida("El campo 'analisis' debe ser una lista.")
+        # Una entrada por dimensión, en el orden de ORDERED_SECTION_TITLES.
+        por_dimension = {}
+        for entrada in analisis:
+            puntuacion = PuntuacionDimension.desde_dict(entrada)
+            por_dimension.setdefault(puntuacion.dimension, puntuacion)
+        faltan = [d for d in DIMENSIONES_ANALISIS if d not in por_dimension]
+        if faltan:
+            raise RespuestaEstructuradaInvalida(f"Faltan dimensiones del análisis: {', '.join(faltan)}")
+
+        return cls(
+            script=ScriptReel.desde_dict(datos.get("script")),
+            titulo_shorts=_texto(datos, "titulo_shorts"),
+            copy=_texto(datos, "copy"),
+            hooks=_lista_textos(datos, "hooks"),
+            analisis=[por_dimension[d] for d in DIMENSIONES_ANALISIS],
+        )
+
+    def copy_hooks(self):
+        """Diccionario con el formato de `generadores.generar_copy_hooks`."""
+        return {"copy": self.copy, "hooks": list(self.hooks), "titulo_shorts": self.titulo_shorts}
+
+    def texto_analisis(self):
+        """El análisis en el formato numerado de texto que pide `construir_prompt_analisis`."""
+        lineas = []
+        for titulo, puntuacion in zip(ORDERED_SECTION_TITLES, self.analisis):
+            linea = f"{titulo}: {puntuacion.descripcion}"
+            if puntuacion.puntuacion is not None:
+                linea += f" Puntuación: {puntuacion.puntuacion}%"
+            if puntuacion.sugerencia:
+                linea += f" Sugerencia: {puntuacion.sugerencia}"
+            lineas.append(linea)
+        return "\n".join(lineas)
+
+    def resultado_analisis(self):
+        """Diccionario con el formato de `analizador_scripts.obtener_analisis`."""
+        return {
+            "texto": self.texto_analisis(),
+            "secciones": [puntuacion.como_seccion() for puntuacion in self.analisis],
+            "error": None,
+        }
+
+def construir_prompt_estructurado(tema, objetivo, estilo, duracion):
+    """
+    Construye el prompt que pide script, copy/hooks y análisis en un único JSON.
+    """
+    dimensiones = "\n".join(f"    - {dimension}" for dimension in DIMENSIONES_ANALISIS)
+    con_puntuacion = ", ".join(SECCIONES_CON_PUNTUACION)
+    prompt_text = f"""
+    Eres un experto creador de contenido y analista de reels para redes sociales (TikTok, Instagram Reels, YouTube Shorts).
+    Genera en una sola respuesta JSON el script de un reel, su copy y hooks, y un análisis crítico del propio script.
+
+    Tema: {tema}
+    Objetivo: {objetivo}
+    Estilo/Tono: {estilo}
+    Duración aproximada: {duracion} segundos
+
+    - script: título, gancho (3-5 primeros segundos), escenas (una por elemento), llamada a la acción y elementos visuales/sonido.
+    - titulo_shorts: título para YouTube Shorts de máximo 95 caracteres con dos hashtags del tema y un hashtag viral.
+    - copy: copy persuasivo y conciso con emojis y hashtags.
+    - hooks: 3 preguntas o frases cortas que inciten a ver el reel.
+    - analisis: una entrada por cada dimensión, con descripción y una sugerencia concreta de mejora:
+{dimensiones}
+      Las dimensiones {con_puntuacion} llevan una puntuación entera de 0 a 100; el resto, puntuacion null.
+    """
+    return prompt_text
@@ -0,0 +1,223 @@
+import csv
+import json
+import os
+import re
+import sys
+import threading
+
+# --- Formatos de intercambio del historial ---
+# Exportar e importar el historial registro a registro, sin tener nunca el
+# archivo entero en memoria:
+#   - "jsonl": un registro por línea;
+#   - "csv": una fila por registro; los hooks y los campos extra van como JSON;
+#   - "parquet": columnas de texto, escritas y leídas por lotes (requiere pyarrow);
+#   - "json": solo importación, el array del archivo antiguo historial_contenido.json.
+
+FORMATOS_EXPORTACION = ("jsonl", "csv", "parquet")
+FORMATOS_IMPORTACION = ("jsonl", "csv", "parquet", "json")
+CAMPOS_CSV = ["id", "fecha", "tema", "script", "titulo_shorts", "copy", "hooks", "extra"]
+CAMPOS_BASE = {"id", "fecha", "tema", "script", "copy_hooks"}
+TAMANO_LOTE = 1000
+TAMANO_BLOQUE_JSON = 1024 * 1024
+# Un objeto que no se puede decodificar tras leer esto se da por dañado (la memoria sigue acotada).
+TAMANO_MAX_OBJETO_JSON = 64 * 1024 * 1024
+SEPARADORES_JSON = re.compile(r"[ \t\r\n,]*")
+
+class RegistroInvalido(ValueError):
+    """Un registro importado no tiene la forma de un registro del historial."""
+
+def detectar_formato(ruta, formato=None, formatos=FORMATOS_IMPORTACION):
+    """Formato explícito o, si no se da, deducido de la extensión del archivo."""
+    formato = (formato or os.path.splitext(ruta)[1].lstrip(".")).lower()
+    if formato not in formatos:
+        raise ValueError(f"Formato no soportado: {formato!r} (usa {', '.join(formatos)}).")
+    return formato
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("El formato Parquet necesita pyarrow (pip install pyarrow).") from None
+    return pyarrow
+
+def validar_registro(registro):
+    """
+    Devuelve el registro normalizado (tema, script, copy_hooks y fecha) o lanza
+    `RegistroInvalido`. Los campos extra se conservan.
+    """
+    if not isinstance(registro, dict):
+        raise RegistroInvalido("El registro no es un objeto.")
+    copy_hooks = registro.get("copy_hooks")
+    if not isinstance(registro.get("tema"), str) or not isinstance(registro.get("script"), str):
+        raise RegistroInvalido("Faltan 'tema' o 'script'.")
+    if not isinstance(copy_hooks, dict) or not isinstance(copy_hooks.get("hooks", []), list):
+        raise RegistroInvalido("'copy_hooks' debe ser un objeto con una lista de 'hooks'.")
+    return {
+        **registro,
+        "fecha": str(registro.get("fecha") or ""),
+        "copy_hooks": {
+            "copy": str(copy_hooks.get("copy") or ""),
+            "hooks": [str(hook) for hook in copy_hooks.get("hooks", [])],
+            "titulo_shorts": str(copy_hooks.get("titulo_shorts") or ""),
+        },
+    }
+
+# --- Registro <-> fila plana (CSV y Parquet) ---
+def registro_a_fila(registro):
+    copy_hooks = registro.get("copy_hooks") or {}
+    extra = {k: v for k, v in registro.items() if k not in CAMPOS_BASE}
+    return {
+        "id": registro.get("id"),
+        "fecha": registro.get("fecha", ""),
+        "tema": registro.get("tema", ""),
+        "script": registro.get("script", ""),
+        "titulo_shorts": copy_hooks.get("titulo_shorts", ""),
+        "copy": copy_hooks.get("copy", ""),
+        "hooks": json.dumps(copy_hooks.get("hooks", []), ensure_ascii=False),
+        "extra": json.dumps(extra, ensure_ascii=False) if extra else "",
+    }
+
+def fila_a_registro(fila):
+    try:
+        hooks = json.loads(fila.get("hooks") or "[]")
+        extra = json.loads(fila["extra"]) if fila.get("extra") else {}
+    except ValueError as e:
+        raise RegistroInvalido(f"JSON no válido en la fila: {e}") from e
+    id_registro = fila.get("id")
+    return {
+        **extra,
+        "id": int(id_registro) if str(id_registro or "").isdigit() else None,
+        "fecha": fila.get("fecha") or "",
+        "tema": fila.get("tema"),
+        "script": fila.get("script"),
+        "copy_hooks": {"copy": fila.get("copy") or "", "hooks": hooks, "titulo_shorts": fila.get("titulo_shorts") or ""},
+    }
+
+# --- Escritura ---
+def _escribir_jsonl(registros, f):
+    total = 0
+    for registro in registros:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        total += 1
+    return total
+
+def _escribir_csv(registros, f):
+    escritor = csv.DictWriter(f, fieldnames=CAMPOS_CSV)
+    escritor.writeheader()
+    total = 0
+    for registro in registros:
+        escritor.writerow(registro_a_fila(registro))
+        total += 1
+    return total
+
+def _escribir_parquet(registros, ruta):
+    pa = _pyarrow()
+    esquema = pa.schema([("id", pa.int64())] + [(campo, pa.string()) for campo in CAMPOS_CSV[1:]])
+    total = 0
+    with pa.parquet.ParquetWriter(ruta, esquema) as escritor:
+        lote = []
+        for registro in registros:
+            lote.append(registro_a_fila(registro))
+            if len(lote) == TAMANO_LOTE:
+                escritor.write_table(pa.Table.from_pylist(lote, schema=esquema))
+                total += len(lote)
+                lote = []
+        if lote:
+            escritor.write_table(pa.Table.from_pylist(lote, schema=esquema))
+            total += len(lote)
+    return total
+
+def escribir_registros(registros, ruta, formato=None):
+    """
+    Escribe los registros (un iterable, consumido de uno en uno) en `ruta`.
+    Se escribe en un temporal que se renombra al final, así que una exportación
+    interrumpida no deja un archivo a medias. Devuelve cuántos registros se escribieron.
+    """
+    formato = detectar_formato(ruta, formato, FORMATOS_EXPORTACION)
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if formato == "parquet":
+            total = _escribir_parquet(registros, temporal)
+        else:
+            with open(temporal, "w", encoding="utf-8", newline="") as f:
+                total = (_escribir_csv if formato == "csv" else _escribir_jsonl)(registros, f)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return total
+
+# --- Lectura ---
+# Los lectores devuelven un registro por entrada, o la excepción `RegistroInvalido`
+# (sin lanzarla) si esa entrada está dañada, para poder contarla y seguir.
+def _leer_jsonl(ruta):
+    with open(ruta, "r", encoding="utf-8", errors="replace") as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            try:
+                datos = json.loads(linea)
+            except ValueError as e:
+                yield RegistroInvalido(f"Línea JSON no válida: {e}")
+                continue
+            yield datos
+
+def _leer_csv(ruta):
+    # Los scripts largos superan el límite por defecto de 128 KB por campo.
+    csv.field_size_limit(min(sys.maxsize, 2 ** 31 - 1))
+    with open(ruta, "r", encoding="utf-8", errors="replace", newline="") as f:
+        for fila in csv.DictReader(f):
+            try:
+                yield fila_a_registro(fila)
+            except RegistroInvalido as e:
+                yield e
+
+def _leer_parquet(ruta):
+    pa = _pyarrow()
+    archivo = pa.parquet.ParquetFile(ruta)
+    for lote in archivo.iter_batches(batch_size=TAMANO_LOTE):
+        for fila in lote.to_pylist():
+            try:
+                yield fila_a_registro(fila)
+            except RegistroInvalido as e:
+                yield e
+
+def _leer_json(ruta):
+    """
+    Recorre un array JSON objeto a objeto, leyendo el archivo por bloques. Se
+    decodifica sobre un índice que avanza por el bloque; el buffer solo se copia
+    al leer el bloque siguiente.
+    """
+    decodificador = json.JSONDecoder()
+    with open(ruta, "r", encoding="utf-8", errors="replace") as f:
+        buffer = f.read(TAMANO_BLOQUE_JSON).lstrip()
+        if not buffer.startswith("["):
+            yield RegistroInvalido("El archivo JSON debe contener una lista de registros.")
+            return
+        posicion = 1
+        fin = False
+        while True:
+            posicion = SEPARADORES_JSON.match(buffer, posicion).end()
+            if buffer.startswith("]", posicion):
+                return
+            try:
+                objeto, posicion_fin = decodificador.raw_decode(buffer, posicion)
+            except ValueError as e:
+                if fin or len(buffer) - posicion > TAMANO_MAX_OBJETO_JSON:
+                    if posicion < len(buffer):
+                        yield RegistroInvalido(f"JSON truncado o dañado: {e}")
+                    return
+                bloque = f.read(TAMANO_BLOQUE_JSON)
+                fin = not bloque
+                buffer = buffer[posicion:] + bloque
+                posicion = 0
+                continue
+            posicion = posicion_fin
+            yield objeto
+
+LECTORES = {"jsonl": _leer_jsonl, "csv": _leer_csv, "parquet": _leer_parquet, "json": _leer_json}
+
+def leer_registros(ruta, formato=None):
+    """Recorre los registros de un archivo exportado, de uno en uno (ver `LECTORES`)."""
+    return LECTORES[detectar_formato(ruta, formato)](ruta)
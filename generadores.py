@@ -1,33 +1,34 @@
-import google.generativeai as genai
-import os
-import streamlit as st
-from dotenv import load_dotenv
+import logging
 import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from cache_respuestas import respuesta_cacheada, respuesta_cacheada_stream
+from cliente_gemini import obtener_cliente
+from metricas import metricas, registrar_parseo
+from peticiones_gemini import llamar_modelo
+from presupuesto_tokens import preparar_prompt
+from analizador_scripts import obtener_analisis
+from contenido_estructurado import (ContenidoReel, RespuestaEstructuradaInvalida, CONFIG_ESTRUCTURADA,
+                                    construir_prompt_estructurado)
 
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-# --- Configuración de la API de Google Gemini ---
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY") 
-GEMINI_MODEL_NAME = "gemini-2.0-flash"
+# Estas funciones no pintan nada en la interfaz: los errores se devuelven en el
+# propio resultado (ver `script_valido` y `copy_hooks_valido`) y se mandan al log,
+# y es quien llama (la página, el modo por lotes o servidor_api) quien los muestra.
 
-client = None
-if not GEMINI_API_KEY:
-    st.error("Error: GEMINI_API_KEY no encontrada. Revisa los secretos de Streamlit Cloud o tu archivo .env")
-else:
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        client = genai.GenerativeModel(GEMINI_MODEL_NAME)
-    except Exception as e:
-        st.error(f"Error al configurar la API de Gemini o inicializar el modelo: {e}")
-        client = None
+CONFIG_SCRIPT = {"max_output_tokens": 500, "temperature": 0.7}
 
-def generar_script(tema, objetivo, estilo, duracion):
+# Valores de las peticiones que no los indican (modo por lotes, servidor_api y la página).
+VALORES_POR_DEFECTO = {"objetivo": "persuasivo", "estilo": "enérgico", "duracion": 30}
+
+def construir_prompt_script(tema, objetivo, estilo, duracion, enfoque=None):
     """
-    Genera un script completo para un reel (con título, hook, desarrollo y CTA).
+    Construye el prompt de generación de script para un reel.
+    `enfoque` (opcional) fija el ángulo creativo; se usa para pedir variantes distintas.
     """
-    if client is None:
-        return "No se puede generar script: Modelo de IA no inicializado."
-
     prompt_text = f"""
     Eres un experto creador de contenido para redes sociales (TikTok, Instagram Reels, YouTube Shorts).
     Tu tarea es generar un script detallado y creativo para un reel, basado en la siguiente información:
@@ -65,28 +66,106 @@ def generar_script(tema, objetivo, estilo, duracion):
     [Lista de ideas visuales/sonido]
     ---
     """
+    if enfoque:
+        prompt_text += f"\n    Enfoque creativo obligatorio para esta versión: {enfoque}\n"
+    return prompt_text
+
+# Textos que devuelve `generar_script` cuando no hay script (se muestran tal cual en la UI).
+MENSAJES_ERROR_SCRIPT = (
+    "No se puede generar script:",
+    "No se pudo generar el script.",
+    "Error inesperado al generar script:",
+)
+
+def script_valido(texto):
+    """Indica si el texto devuelto por `generar_script` es un script y no un mensaje de error."""
+    return bool(texto) and not texto.startswith(MENSAJES_ERROR_SCRIPT)
+
+class ScriptInterrumpido(Exception):
+    """
+    El streaming del script falló después de entregar fragmentos: el texto parcial
+    no es un script y hay que descartarlo. El mensaje es el error que se muestra.
+    """
+
+def generar_script(tema, objetivo, estilo, duracion):
+    """
+    Genera un script completo para un reel (con título, hook, desarrollo y CTA).
+    """
+    client = obtener_cliente()
+    if client is None:
+        return "No se puede generar script: Modelo de IA no inicializado."
+
+    prompt_text = construir_prompt_script(tema, objetivo, estilo, duracion)
+    generation_config = CONFIG_SCRIPT
     try:
-        response = client.generate_content(prompt_text,
-                                           generation_config={"max_output_tokens": 500, "temperature": 0.7})
+        texto = respuesta_cacheada(
+            client.nombre, prompt_text, generation_config,
+            lambda: llamar_modelo(client, prompt_text, generation_config, funcion="generar_script").text
+        )
         
-        if response.text:
-            return response.text
+        if texto:
+            return texto
         else:
             return "No se pudo generar el script. La respuesta de la IA estaba vacía o incompleta."
 
     except Exception as e:
-        st.error(f"Ocurrió un error inesperado al generar el script con Gemini: {e}")
+        logger.error("Error inesperado al generar el script con Gemini: %s", e)
         return f"Error inesperado al generar script: {e}"
 
-def generar_copy_hooks(tema, script_generado):
-    """Genera un copy, hooks y un título para YouTube Shorts usando Google Gemini."""
+def generar_script_stream(tema, objetivo, estilo, duracion, enfoque=None):
+    """
+    Versión en streaming de `generar_script`: devuelve los fragmentos de texto
+    a medida que llegan de Gemini (o el texto completo de golpe si estaba en caché).
+    Si la respuesta se corta después del primer fragmento lanza `ScriptInterrumpido`
+    en lugar de añadir el mensaje de error a un script a medias.
+    """
+    client = obtener_cliente()
     if client is None:
-        st.error("No se puede generar copy/hooks: Modelo de IA no inicializado. Revisa tu clave API y logs.")
-        return {"copy": "Error: Modelo de IA no inicializado.", "hooks": [], "titulo_shorts": ""}
+        yield "No se puede generar script: Modelo de IA no inicializado."
+        return
+
+    prompt_text = construir_prompt_script(tema, objetivo, estilo, duracion, enfoque)
+    generation_config = CONFIG_SCRIPT
+    recibido = False
+    try:
+        fragmentos = respuesta_cacheada_stream(
+            client.nombre, prompt_text, generation_config,
+            lambda: (chunk.text for chunk in llamar_modelo(
+                client, prompt_text, generation_config, stream=True, funcion="generar_script"))
+        )
+        for fragmento in fragmentos:
+            if fragmento:
+                recibido = True
+                yield fragmento
+        if not recibido:
+            yield "No se pudo generar el script. La respuesta de la IA estaba vacía o incompleta."
+
+    except Exception as e:
+        logger.error("Error inesperado al generar el script con Gemini: %s", e)
+        if recibido:
+            raise ScriptInterrumpido(f"Error inesperado al generar script: {e}") from e
+        yield f"Error inesperado al generar script: {e}"
 
-    script_texto = "\n".join(script_generado)
+TITULO_SHORTS_REGEX = re.compile(r'Título Shorts:(.*?)(?=Copy:)', re.DOTALL | re.IGNORECASE)
+COPY_REGEX = re.compile(r'Copy:(.*?)(?=Hooks:)', re.DOTALL | re.IGNORECASE)
+HOOKS_REGEX = re.compile(r'Hooks:(.*)', re.DOTALL | re.IGNORECASE)
+HOOK_ITEM_REGEX = re.compile(r'^\s*[-*]\s*(.*)', re.MULTILINE)
+HOOKS_NO_PARSEADOS = "No se pudo parsear, aquí está el texto completo."
+# Comienzo del copy que devuelve `generar_copy_hooks` cuando no hay copy/hooks.
+MENSAJES_ERROR_COPY = ("Error: Modelo de IA no inicializado.", "No se pudo generar copy/hooks/título.",
+                       "Error al generar copy/hooks/título:")
 
-    prompt = f"""
+def copy_hooks_valido(copy_hooks):
+    """Indica si el resultado de `generar_copy_hooks` es contenido y no un mensaje de error."""
+    return bool(copy_hooks) and not copy_hooks.get("copy", "").startswith(MENSAJES_ERROR_COPY)
+
+def construir_prompt_copy_hooks(tema, script_generado):
+    """
+    Construye el prompt de copy, hooks y título para Shorts a partir del script,
+    compactado y ajustado al presupuesto de tokens (ver presupuesto_tokens.py).
+    """
+    def plantilla(script_texto):
+        return f"""
     Eres un experto en marketing digital y creación de contenido para redes sociales.
     Genera un copy persuasivo, 3 hooks (ganchos) y un título para YouTube Shorts.
     El contenido debe ser sobre el tema de "{tema}" y **basado en el siguiente script**:
@@ -109,38 +188,281 @@ def generar_copy_hooks(tema, script_generado):
     - [Hook 2]
     - [Hook 3]
     """
+
+    return preparar_prompt(plantilla, "\n".join(script_generado), "generar_copy_hooks")
+
+def parsear_copy_hooks(full_text):
+    """
+    Extrae título para Shorts, copy y hooks de la respuesta de Gemini.
+    Si no se reconoce ninguna sección, devuelve el texto completo como copy.
+    """
+    copy_text = ""
+    hooks_list = []
+    titulo_shorts_text = ""
+
+    titulo_shorts_match = TITULO_SHORTS_REGEX.search(full_text)
+    if titulo_shorts_match:
+        titulo_shorts_text = titulo_shorts_match.group(1).strip()
+    
+    copy_match = COPY_REGEX.search(full_text)
+    if copy_match:
+        copy_text = copy_match.group(1).strip()
+
+    hooks_match = HOOKS_REGEX.search(full_text)
+    if hooks_match:
+        hooks_section = hooks_match.group(1)
+        hooks_list = HOOK_ITEM_REGEX.findall(hooks_section)
+    
+    if not copy_text and not hooks_list and not titulo_shorts_text and full_text:
+        return {"copy": full_text, "hooks": [HOOKS_NO_PARSEADOS], "titulo_shorts": ""}
+
+    return {"copy": copy_text, "hooks": hooks_list, "titulo_shorts": titulo_shorts_text}
+
+def generar_copy_hooks(tema, script_generado):
+    """Genera un copy, hooks y un título para YouTube Shorts usando Google Gemini."""
+    client = obtener_cliente()
+    if client is None:
+        logger.error("No se puede generar copy/hooks: modelo de IA no inicializado.")
+        return {"copy": "Error: Modelo de IA no inicializado.", "hooks": [], "titulo_shorts": ""}
+
     try:
-        response = client.generate_content(prompt)
+        prompt = construir_prompt_copy_hooks(tema, script_generado)
+        full_text = respuesta_cacheada(
+            client.nombre, prompt, None,
+            lambda: llamar_modelo(client, prompt, funcion="generar_copy_hooks").text
+        )
         
-        if response.text:
-            st.success("¡Contenido complementario generado por Gemini con éxito!")
-            full_text = response.text
-            
-            copy_text = ""
-            hooks_list = []
-            titulo_shorts_text = ""
-
-            titulo_shorts_match = re.search(r'Título Shorts:(.*?)(?=Copy:)', full_text, re.DOTALL | re.IGNORECASE)
-            if titulo_shorts_match:
-                titulo_shorts_text = titulo_shorts_match.group(1).strip()
-            
-            copy_match = re.search(r'Copy:(.*?)(?=Hooks:)', full_text, re.DOTALL | re.IGNORECASE)
-            if copy_match:
-                copy_text = copy_match.group(1).strip()
-
-            hooks_match = re.search(r'Hooks:(.*)', full_text, re.DOTALL | re.IGNORECASE)
-            if hooks_match:
-                hooks_section = hooks_match.group(1)
-                hooks_list = re.findall(r'^\s*[-*]\s*(.*)', hooks_section, re.MULTILINE)
-            
-            if not copy_text and not hooks_list and not titulo_shorts_text and full_text:
-                return {"copy": full_text, "hooks": ["No se pudo parsear, aquí está el texto completo."], "titulo_shorts": ""}
-
-            return {"copy": copy_text, "hooks": hooks_list, "titulo_shorts": titulo_shorts_text}
+        if full_text:
+            copy_hooks = parsear_copy_hooks(full_text)
+            registrar_parseo("generar_copy_hooks", copy_hooks["hooks"] != [HOOKS_NO_PARSEADOS])
+            return copy_hooks
         else:
-            st.warning("Gemini no devolvió un copy/hooks/título válidos. Posiblemente un error interno de la API o contenido bloqueado.")
+            logger.warning("Gemini no devolvió copy/hooks/título (respuesta vacía o contenido bloqueado).")
             return {"copy": "No se pudo generar copy/hooks/título.", "hooks": [], "titulo_shorts": ""}
 
     except Exception as e:
-        st.error(f"Error al generar copy/hooks/título: {e}. Revisa tu clave API y límites de uso.")
+        logger.error("Error al generar copy/hooks/título: %s", e)
         return {"copy": f"Error al generar copy/hooks/título: {e}", "hooks": [], "titulo_shorts": ""}
+
+# --- Variantes del script ---
+# Ángulos creativos con los que se piden las variantes, para que den scripts distintos.
+ENFOQUES_VARIANTE = (
+    "abre con una pregunta provocadora",
+    "abre con un dato sorprendente y concreto",
+    "cuéntalo como una historia personal en primera persona",
+    "estructúralo como una lista rápida de consejos",
+    "plantéalo como mito contra realidad",
+)
+
+Variante = namedtuple("Variante", ["texto", "puntuacion", "enfoque", "segundos"])
+
+def _generar_variante(tema, objetivo, estilo, duracion, enfoque, cancelar):
+    """
+    Genera una variante en streaming y devuelve (texto, segundos). Devuelve None si
+    se activa `cancelar` (deja de leer) o si la variante falla, aunque sea a medias.
+    """
+    inicio = time.perf_counter()
+    partes = []
+    fragmentos = generar_script_stream(tema, objetivo, estilo, duracion, enfoque)
+    try:
+        for fragmento in fragmentos:
+            if cancelar.is_set():
+                return None
+            partes.append(fragmento)
+    except ScriptInterrumpido:
+        return None
+    finally:
+        # Cerrar el generador cierra también el stream de la respuesta en curso.
+        fragmentos.close()
+    texto = "".join(partes)
+    if not script_valido(texto):
+        return None
+    return texto, time.perf_counter() - inicio
+
+def generar_variantes_script(tema, objetivo, estilo, duracion, n=3, suficientes=None, umbral=60):
+    """
+    Pide `n` variantes del script en paralelo (cada una con un enfoque distinto),
+    las puntúa con el analizador local y las devuelve como `Variante` de mejor a peor.
+    En cuanto hay `suficientes` variantes válidas con puntuación >= `umbral`
+    (por defecto, la mayoría de `n`) se cancelan las que faltan.
+    """
+    from analizador_local import puntuar_lote
+
+    n = max(1, min(n, len(ENFOQUES_VARIANTE)))
+    suficientes = n // 2 + 1 if suficientes is None else suficientes
+    cancelar = threading.Event()
+    variantes = []
+    buenas = 0
+    pool = ThreadPoolExecutor(max_workers=n)
+    try:
+        pendientes = {
+            pool.submit(_generar_variante, tema, objetivo, estilo, duracion, enfoque, cancelar): enfoque
+            for enfoque in ENFOQUES_VARIANTE[:n]
+        }
+        while pendientes and buenas < suficientes:
+            terminados, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                enfoque = pendientes.pop(futuro)
+                resultado = futuro.result()
+                if resultado is None:
+                    continue
+                texto, segundos = resultado
+                puntuacion = float(puntuar_lote([texto])[0][0].mean())
+                variantes.append(Variante(texto, puntuacion, enfoque, segundos))
+                if puntuacion >= umbral:
+                    buenas += 1
+        if pendientes:
+            metricas.incrementar("variantes_canceladas_total", len(pendientes))
+    finally:
+        cancelar.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    variantes.sort(key=lambda v: v.puntuacion, reverse=True)
+    return variantes
+
+# --- Pipeline de generación concurrente ---
+ResultadoEtapa = namedtuple("ResultadoEtapa", ["etapa", "resultado", "segundos"])
+
+def ejecutar_grafo(etapas, max_workers=4):
+    """
+    Ejecuta un pequeño grafo de dependencias en un pool de hilos.
+
+    `etapas` es un diccionario {nombre: (dependencias, funcion)}; cada función recibe
+    un diccionario con los resultados de sus dependencias. Las etapas independientes
+    se lanzan en paralelo y se devuelve un `ResultadoEtapa` en cuanto cada una termina.
+    """
+    resultados = {}
+    pendientes = dict(etapas)
+    en_curso = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pendientes or en_curso:
+            for nombre, (dependencias, funcion) in list(pendientes.items()):
+                if all(dep in resultados for dep in dependencias):
+                    entradas = {dep: resultados[dep] for dep in dependencias}
+                    inicio = time.perf_counter()
+                    futuro = pool.submit(funcion, entradas)
+                    en_curso[futuro] = (nombre, inicio)
+                    del pendientes[nombre]
+
+            if not en_curso:
+                raise ValueError(f"Dependencias imposibles de resolver en el pipeline: {list(pendientes)}")
+
+            terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                nombre, inicio = en_curso.pop(futuro)
+                resultados[nombre] = futuro.result()
+                yield ResultadoEtapa(nombre, resultados[nombre], time.perf_counter() - inicio)
+
+def _script_en_streaming(tema, objetivo, estilo, duracion, al_fragmento):
+    """
+    Acumula el script en streaming avisando a `al_fragmento` con el texto parcial.
+    Si el streaming se corta, el texto parcial se descarta y se devuelve el error.
+    """
+    texto = ""
+    try:
+        for fragmento in generar_script_stream(tema, objetivo, estilo, duracion):
+            texto += fragmento
+            al_fragmento(texto)
+    except ScriptInterrumpido as e:
+        return str(e)
+    return texto
+
+def _copy_hooks_de(tema, script):
+    # Sin script válido no se gasta una llamada en el copy de un mensaje de error.
+    if not script_valido(script):
+        return {"copy": "No se pudo generar copy/hooks/título.", "hooks": [], "titulo_shorts": ""}
+    return generar_copy_hooks(tema, [script])
+
+def _analisis_de(script):
+    if not script_valido(script):
+        return {"texto": "", "secciones": [], "error": "No hay script que analizar."}
+    return obtener_analisis(script)
+
+def _mejor_variante(variantes):
+    if not variantes:
+        return "No se pudo generar el script. Ninguna variante fue válida."
+    return variantes[0].texto
+
+def generar_contenido_completo(tema, objetivo, estilo, duracion, al_fragmento_script=None, variantes=1,
+                               previos=None):
+    """
+    Genera script, copy/hooks y análisis como un grafo de etapas.
+    El copy/hooks y el análisis dependen solo del script, así que se ejecutan en paralelo
+    (y, si no hay script válido, devuelven un error sin llamar al modelo).
+    Es un generador: devuelve cada `ResultadoEtapa` en cuanto está listo.
+    Si se pasa `al_fragmento_script`, el script se pide en streaming y la función
+    recibe el texto parcial acumulado a medida que llega.
+    Con `variantes` > 1 se añade la etapa "variantes" (ver `generar_variantes_script`)
+    y el script es la mejor de ellas; en ese caso no se usa `al_fragmento_script`.
+    `previos` ({etapa: resultado}) son etapas ya completadas, p. ej. al reanudar un
+    lote: se devuelven tal cual y solo se ejecutan las que faltan.
+    """
+    etapas = {}
+    if variantes > 1:
+        etapas["variantes"] = ([], lambda _: generar_variantes_script(tema, objetivo, estilo, duracion, variantes))
+        etapa_script = (["variantes"], lambda r: _mejor_variante(r["variantes"]))
+    elif al_fragmento_script is None:
+        etapa_script = ([], lambda _: generar_script(tema, objetivo, estilo, duracion))
+    else:
+        etapa_script = ([], lambda _: _script_en_streaming(tema, objetivo, estilo, duracion, al_fragmento_script))
+
+    etapas.update({
+        "script": etapa_script,
+        "copy_hooks": (["script"], lambda r: _copy_hooks_de(tema, r["script"])),
+        "analisis": (["script"], lambda r: _analisis_de(r["script"])),
+    })
+    previos = previos or {}
+    if "script" in previos and "variantes" not in previos:
+        etapas.pop("variantes", None)
+    for nombre, resultado in previos.items():
+        etapas[nombre] = ([], lambda _, resultado=resultado: resultado)
+    yield from ejecutar_grafo(etapas, max_workers=2)
+
+# --- Generación estructurada en una sola llamada ---
+def obtener_contenido_estructurado(tema, objetivo, estilo, duracion):
+    """
+    Pide script, copy/hooks y análisis en una única respuesta JSON y la devuelve
+    validada como `ContenidoReel`. Si la configuración es determinista (ver
+    `cache_respuestas.es_determinista`), solo se guardan en caché respuestas válidas.
+    Lanza `RespuestaEstructuradaInvalida` o el error de la API si no es posible.
+    """
+    client = obtener_cliente()
+    if client is None:
+        raise RuntimeError("Modelo de IA no inicializado.")
+
+    prompt_text = construir_prompt_estructurado(tema, objetivo, estilo, duracion)
+
+    def generar():
+        texto = llamar_modelo(client, prompt_text, CONFIG_ESTRUCTURADA, funcion="generar_contenido").text
+        ContenidoReel.desde_json(texto)
+        return texto
+
+    try:
+        texto = respuesta_cacheada(client.nombre, prompt_text, CONFIG_ESTRUCTURADA, generar)
+        contenido = ContenidoReel.desde_json(texto)
+    except RespuestaEstructuradaInvalida:
+        registrar_parseo("generar_contenido", False)
+        raise
+    registrar_parseo("generar_contenido", True)
+    return contenido
+
+def generar_contenido_una_llamada(tema, objetivo, estilo, duracion):
+    """
+    Alternativa a `generar_contenido_completo` con una sola llamada al modelo.
+    Devuelve los mismos `ResultadoEtapa` (script, copy_hooks, analisis) y con los
+    mismos formatos. Si la respuesta no es válida, recurre al pipeline de tres llamadas.
+    """
+    inicio = time.perf_counter()
+    try:
+        contenido = obtener_contenido_estructurado(tema, objetivo, estilo, duracion)
+    except Exception as e:
+        logger.warning("La generación en una sola llamada falló (%s); se usa el modo de tres llamadas.", e)
+        metricas.incrementar("respaldo_una_llamada_total")
+        yield from generar_contenido_completo(tema, objetivo, estilo, duracion)
+        return
+
+    segundos = time.perf_counter() - inicio
+    yield ResultadoEtapa("script", contenido.script.como_texto(), segundos)
+    yield ResultadoEtapa("copy_hooks", contenido.copy_hooks(), segundos)
+    yield ResultadoEtapa("analisis", contenido.resultado_analisis(), segundos)
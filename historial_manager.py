@@ -1,43 +1,75 @@
-import json
-import os
+import csv
+import hashlib
+import sqlite3
+import time
 from datetime import datetime
+from almacen_historial import AlmacenHistorial, IndicePaginas, RegistrosEnMemoria
+from analitica_historial import AnaliticaHistorial
+from analizador_scripts import origen_analisis, puntuaciones_analisis
+from formatos_historial import TAMANO_LOTE, RegistroInvalido, escribir_registros, leer_registros, validar_registro
+from indice_busqueda import IndiceInvertido, normalizar
+from indice_similitud import IndiceSimilitud
+from metricas import medir
 
+# Archivo JSON de versiones anteriores: se migra una sola vez al log JSONL.
 HISTORY_FILE = "historial_contenido.json"
+HISTORY_LOG = "historial_contenido.jsonl"
 
-def guardar_en_historial(tema, script, copy_hooks):
+almacen = AlmacenHistorial(HISTORY_LOG, ruta_legado=HISTORY_FILE)
+indice = IndiceInvertido(almacen)
+registros_en_memoria = RegistrosEnMemoria(almacen)
+paginas = IndicePaginas(almacen)
+similitud = IndiceSimilitud(almacen)
+analitica = AnaliticaHistorial(almacen)
+
+VISTAS = [indice, registros_en_memoria, paginas, similitud, analitica]
+
+def _actualizar_vistas():
+    """Aplica los últimos cambios del log a las vistas ya construidas en memoria."""
+    for vista in VISTAS:
+        if vista.inicializada:
+            vista.sincronizar()
+
+def guardar_en_historial(tema, script, copy_hooks, analisis=None, nicho=None):
     """
-    Guarda un nuevo registro de contenido generado en un archivo JSON.
+    Guarda un nuevo registro de contenido generado en el historial.
+    Si se pasa el `analisis` del script (de `obtener_analisis` o `analizar_local`),
+    se guardan sus puntuaciones por dimensión y su origen ("origen_puntuaciones");
+    la analítica solo agrega las del modelo. `nicho` agrupa el registro en la analítica.
     """
-    historial = cargar_historial()
-    
-    # Asignar un ID único al nuevo registro
-    nuevo_id = max([r['id'] for r in historial]) + 1 if historial else 1
-    
     nuevo_registro = {
-        "id": nuevo_id,
         "fecha": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "tema": tema,
         "script": script,
         "copy_hooks": copy_hooks
     }
-    
-    historial.append(nuevo_registro)
-    
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(historial, f, ensure_ascii=False, indent=4)
+    puntuaciones = puntuaciones_analisis(analisis)
+    if puntuaciones:
+        nuevo_registro["puntuaciones"] = puntuaciones
+        nuevo_registro["origen_puntuaciones"] = origen_analisis(analisis)
+    if nicho:
+        nuevo_registro["nicho"] = nicho
+    with medir("historial", operacion="guardar"):
+        registro = almacen.agregar(nuevo_registro)
+        _actualizar_vistas()
+    return registro
 
 def cargar_historial():
     """
-    Carga el historial de contenido desde el archivo JSON.
-    Si el archivo no existe, devuelve una lista vacía.
+    Carga el historial de contenido.
+    Si todavía no hay historial, devuelve una lista vacía.
+    La copia en memoria solo relee del disco las operaciones nuevas del log.
     """
-    if os.path.exists(HISTORY_FILE):
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return []
-    return []
+    with medir("historial", operacion="cargar"):
+        return registros_en_memoria.lista()
+
+def cargar_pagina_historial(pagina, tamano=20):
+    """
+    Devuelve (registros, total) de una página del historial, de más reciente a más antiguo.
+    Solo se leen del disco los registros de esa página.
+    """
+    with medir("historial", operacion="pagina"):
+        return paginas.pagina(pagina, tamano)
 
 def borrar_registros_seleccionados(ids_a_borrar):
     """
@@ -45,18 +77,153 @@ def borrar_registros_seleccionados(ids_a_borrar):
     """
     if not ids_a_borrar:
         return
-        
-    historial = cargar_historial()
-    
-    # Creamos un nuevo historial que no contenga los IDs a borrar
-    nuevo_historial = [registro for registro in historial if registro['id'] not in ids_a_borrar]
-    
-    with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-        json.dump(nuevo_historial, f, ensure_ascii=False, indent=4)
+
+    with medir("historial", operacion="borrar"):
+        almacen.borrar(ids_a_borrar)
+        _actualizar_vistas()
 
 def limpiar_historial():
     """
     Borra todos los registros del historial.
     """
-    if os.path.exists(HISTORY_FILE):
-        os.remove(HISTORY_FILE)
+    with medir("historial", operacion="limpiar"):
+        almacen.limpiar()
+        _actualizar_vistas()
+
+def buscar_en_historial(query, limit=20):
+    """
+    Busca registros del historial por palabras clave (tema, script, copy, hooks).
+    No distingue mayúsculas ni tildes; devuelve como máximo `limit` registros.
+    """
+    with medir("historial", operacion="buscar"):
+        return indice.buscar(query, limit)
+
+def buscar_similares(tema, script="", k=5, umbral=0.3):
+    """
+    Devuelve hasta `k` pares (registro, similitud) del historial parecidos al tema
+    (y al script, si se da), para reutilizarlos en vez de volver a generar.
+    """
+    with medir("historial", operacion="similares"):
+        return similitud.similares(tema, script, k, umbral)
+
+def resumen_analitica(agrupacion="nicho", percentiles=(50, 90)):
+    """
+    Media y percentiles de cada dimensión del análisis por nicho, por semana o por
+    (nicho, semana), a partir de los agregados incrementales del historial.
+    """
+    with medir("historial", operacion="analitica"):
+        return analitica.resumen(agrupacion, percentiles)
+
+def tendencia_gancho(nicho=None):
+    """Media semanal de la puntuación del gancho y su pendiente (puntos por semana)."""
+    with medir("historial", operacion="analitica"):
+        return analitica.tendencia_gancho(nicho)
+
+def puntuar_historial_local():
+    """
+    Puntúa en bloque todos los scripts del historial con el analizador local.
+    Devuelve (ids, puntuaciones) con una fila por registro y una columna por
+    dimensión de `SECCIONES_CON_PUNTUACION`.
+    """
+    from analizador_local import puntuar_lote
+
+    registros = cargar_historial()
+    with medir("historial", operacion="puntuar_local"):
+        puntuaciones, _ = puntuar_lote([registro.get("script", "") for registro in registros])
+    return [registro["id"] for registro in registros], puntuaciones
+
+def _clave_duplicado(registro):
+    """Huella de 64 bits (con signo, cabe en un INTEGER de SQLite) de (tema normalizado, script)."""
+    material = f"{normalizar(registro['tema']).strip()}\0{registro['script'].strip()}".encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(material, digest_size=8).digest(), "big", signed=True)
+
+class HuellasEnDisco:
+    """
+    Conjunto de huellas de 64 bits en una base SQLite temporal en disco (se borra
+    al cerrarla). Su memoria queda acotada por la caché de páginas, sea cual sea
+    el tamaño del historial y de lo importado.
+    """
+
+    def __init__(self, claves=()):
+        self._db = sqlite3.connect("")
+        for pragma in ("journal_mode=OFF", "synchronous=OFF", "cache_size=-8192"):
+            self._db.execute(f"PRAGMA {pragma}")
+        self._db.execute("CREATE TABLE huellas (clave INTEGER PRIMARY KEY)")
+        self._db.executemany("INSERT OR IGNORE INTO huellas VALUES (?)", ((clave,) for clave in claves))
+
+    def agregar(self, clave):
+        """Añade la huella; devuelve False si ya estaba."""
+        return self._db.execute("INSERT OR IGNORE INTO huellas VALUES (?)", (clave,)).rowcount == 1
+
+    def cerrar(self):
+        self._db.close()
+
+def exportar_historial(ruta, formato=None):
+    """
+    Exporta los registros vivos del historial a `ruta` (JSONL, CSV o Parquet;
+    por defecto según la extensión), leyendo el log registro a registro.
+    Devuelve {"registros", "segundos", "registros_por_segundo"}.
+    """
+    inicio = time.perf_counter()
+    with medir("historial", operacion="exportar"):
+        total = escribir_registros(almacen.iterar_registros(), ruta, formato)
+    segundos = time.perf_counter() - inicio
+    return {"registros": total, "segundos": segundos, "registros_por_segundo": total / segundos if segundos else 0.0}
+
+def importar_historial(ruta, formato=None, deduplicar=True, ruta_mapa_ids=None):
+    """
+    Importa registros desde `ruta` (JSONL, CSV, Parquet o el JSON antiguo) por
+    lotes de `TAMANO_LOTE`, con memoria acotada. Cada registro recibe un id nuevo
+    del historial; con `ruta_mapa_ids` se escribe un CSV id_original,id_nuevo.
+    Con `deduplicar` se saltan los registros con el mismo tema y script que uno
+    ya existente o ya importado (las huellas vistas van a disco, ver `HuellasEnDisco`).
+    Las entradas dañadas se cuentan y se saltan.
+    Devuelve {"leidos", "importados", "duplicados", "invalidos", "segundos", "registros_por_segundo"}.
+    """
+    inicio = time.perf_counter()
+    informe = {"leidos": 0, "importados": 0, "duplicados": 0, "invalidos": 0}
+    vistos = HuellasEnDisco(_clave_duplicado(registro) for registro in almacen.iterar_registros()) if deduplicar else None
+    mapa = open(ruta_mapa_ids, "w", encoding="utf-8", newline="") if ruta_mapa_ids else None
+    escritor_mapa = csv.writer(mapa) if mapa else None
+    if escritor_mapa:
+        escritor_mapa.writerow(["id_original", "id_nuevo"])
+
+    def volcar(lote):
+        guardados = almacen.agregar_lote(registro for _, registro in lote)
+        informe["importados"] += len(guardados)
+        if escritor_mapa:
+            escritor_mapa.writerows((id_original, registro["id"]) for (id_original, _), registro in zip(lote, guardados))
+
+    try:
+        with medir("historial", operacion="importar"):
+            lote = []
+            for entrada in leer_registros(ruta, formato):
+                informe["leidos"] += 1
+                try:
+                    if isinstance(entrada, RegistroInvalido):
+                        raise entrada
+                    registro = validar_registro(entrada)
+                except RegistroInvalido:
+                    informe["invalidos"] += 1
+                    continue
+                if vistos is not None and not vistos.agregar(_clave_duplicado(registro)):
+                    informe["duplicados"] += 1
+                    continue
+                if not registro["fecha"]:
+                    registro["fecha"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                lote.append((registro.pop("id", None), registro))
+                if len(lote) == TAMANO_LOTE:
+                    volcar(lote)
+                    lote = []
+            if lote:
+                volcar(lote)
+            _actualizar_vistas()
+    finally:
+        if mapa:
+            mapa.close()
+        if vistos is not None:
+            vistos.cerrar()
+    segundos = time.perf_counter() - inicio
+    informe["segundos"] = segundos
+    informe["registros_por_segundo"] = informe["leidos"] / segundos if segundos else 0.0
+    return informe
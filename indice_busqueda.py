@@ -0,0 +1,122 @@
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter
+from almacen_historial import VistaHistorial
+
+# --- Índice invertido de búsqueda sobre el historial ---
+
+TOKEN_REGEX = re.compile(r"#?\w+")
+# Bloques Unicode de marcas diacríticas combinables (lo que queda de las tildes tras NFKD).
+DIACRITICOS_REGEX = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+STOPWORDS = {
+    "a", "al", "con", "de", "del", "el", "en", "es", "la", "las", "lo", "los",
+    "o", "para", "por", "que", "se", "su", "sus", "tu", "tus", "un", "una", "y",
+}
+
+# Peso de cada campo del registro al puntuar una coincidencia.
+PESOS_CAMPOS = {"tema": 3, "titulo_shorts": 2, "copy": 1, "hooks": 1, "script": 1}
+
+def normalizar(texto):
+    """Pasa a minúsculas y elimina tildes/diacríticos (Fórmula -> formula, niño -> nino)."""
+    texto = texto.lower()
+    if texto.isascii():
+        return texto
+    return DIACRITICOS_REGEX.sub("", unicodedata.normalize("NFKD", texto))
+
+def tokenizar(texto):
+    """
+    Tokeniza texto en español sin tildes. Los hashtags se indexan dos veces:
+    con la almohadilla (#formula1) y sin ella (formula1).
+    """
+    tokens = []
+    for token in TOKEN_REGEX.findall(normalizar(texto or "")):
+        if token.startswith("#"):
+            if len(token) > 1:
+                tokens.append(token)
+                tokens.append(token[1:])
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+def _campos_registro(registro):
+    copy_hooks = registro.get("copy_hooks") or {}
+    script = registro.get("script")
+    return {
+        "tema": registro.get("tema") or "",
+        "script": script if isinstance(script, str) else "\n".join(script or []),
+        "copy": copy_hooks.get("copy") or "",
+        "hooks": "\n".join(copy_hooks.get("hooks") or []),
+        "titulo_shorts": copy_hooks.get("titulo_shorts") or "",
+    }
+
+class IndiceInvertido(VistaHistorial):
+    """
+    Índice invertido token -> {id: peso} sobre los registros del historial.
+    Se actualiza de forma incremental leyendo solo las operaciones nuevas del log.
+    """
+
+    def __init__(self, almacen):
+        super().__init__(almacen)
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.postings = {}
+        self.tokens_por_id = {}
+        self.registros = {}
+
+    def _al_agregar(self, registro, posicion):
+        pesos = Counter()
+        for campo, texto in _campos_registro(registro).items():
+            for token in tokenizar(texto):
+                pesos[token] += PESOS_CAMPOS[campo]
+
+        id_registro = registro["id"]
+        self._al_borrar([id_registro])
+        for token, peso in pesos.items():
+            self.postings.setdefault(token, {})[id_registro] = peso
+        self.tokens_por_id[id_registro] = list(pesos)
+        self.registros[id_registro] = registro
+
+    def _al_borrar(self, ids):
+        for id_registro in ids:
+            for token in self.tokens_por_id.pop(id_registro, ()):
+                postings = self.postings.get(token)
+                if postings is not None:
+                    postings.pop(id_registro, None)
+                    if not postings:
+                        del self.postings[token]
+            self.registros.pop(id_registro, None)
+
+    def buscar(self, consulta, limite=20):
+        """
+        Devuelve los registros que contienen todos los términos de la consulta,
+        ordenados por relevancia (peso del campo * idf) y, a igualdad, por más recientes.
+        """
+        self.sincronizar()
+        terminos = list(dict.fromkeys(tokenizar(consulta)))
+        if not terminos:
+            return []
+
+        with self._lock_vista:
+            listas = [self.postings.get(termino) for termino in terminos]
+            if not all(listas):
+                return []
+            # Se intersecta empezando por la lista más corta.
+            listas.sort(key=len)
+            candidatos = set(listas[0])
+            for postings in listas[1:]:
+                candidatos.intersection_update(postings)
+                if not candidatos:
+                    return []
+
+            total = max(len(self.registros), 1)
+            idfs = [math.log(1 + total / len(postings)) for postings in listas]
+            puntuados = (
+                (sum(postings[id_registro] * idf for postings, idf in zip(listas, idfs)), id_registro)
+                for id_registro in candidatos
+            )
+            mejores = heapq.nlargest(limite, puntuados)
+            return [self.registros[id_registro] for _, id_registro in mejores]
@@ -0,0 +1,195 @@
+import re
+import zlib
+
+import numpy as np
+
+from almacen_historial import VistaHistorial
+from indice_busqueda import _campos_registro, normalizar, tokenizar
+
+# --- Índice de similitud (MinHash) sobre el historial ---
+# Cada registro se resume en dos firmas MinHash de `PERMUTACIONES` enteros: una
+# del tema (palabras + trigramas de caracteres, para que "afiliado" y
+# "afiliados" se parezcan) y otra del script (pares de palabras consecutivas).
+# La proporción de posiciones iguales entre dos firmas estima la similitud de
+# Jaccard de sus conjuntos, así que una consulta es una comparación vectorizada
+# contra la matriz (n_registros, PERMUTACIONES) sin bucles en Python.
+
+PERMUTACIONES = 64
+PESO_TEMA = 0.7
+VACIO = np.uint32(0xFFFFFFFF)
+
+_rng = np.random.default_rng(20240611)
+# Hash multiply-shift: ((a * x + b) mod 2^64) >> 32, con `a` impar.
+_A = _rng.integers(1, 2 ** 63, PERMUTACIONES, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, PERMUTACIONES, dtype=np.uint64)
+
+PALABRA_REGEX = re.compile(r"\w+")
+
+# Hash de cada palabra ya vista: el vocabulario del historial es pequeño y se repite mucho.
+_hashes_palabras = {}
+
+def _hashes(palabras):
+    cache = _hashes_palabras
+    if len(cache) > 500_000:
+        cache.clear()
+    hashes = []
+    for palabra in palabras:
+        h = cache.get(palabra)
+        if h is None:
+            h = cache[palabra] = zlib.crc32(palabra.encode("utf-8"))
+        hashes.append(h)
+    return np.array(hashes, dtype=np.uint64)
+
+def _caracteristicas_tema(tema):
+    """Hashes de las palabras del tema y de sus trigramas de caracteres."""
+    tokens = tokenizar(tema)
+    trigramas = [token[i:i + 3] for token in tokens for i in range(max(len(token) - 2, 1))]
+    return _hashes(tokens + trigramas)
+
+def _caracteristicas_script(script):
+    """Hashes de los pares de palabras consecutivas del script (calculados con NumPy)."""
+    palabras = _hashes(PALABRA_REGEX.findall(normalizar(script or "")))
+    return palabras[:-1] * np.uint64(0x9E3779B97F4A7C15) + palabras[1:]
+
+# Máximo de características que se procesan de una vez (64 x 2^18 uint64 = 128 MB).
+_BLOQUE_CARACTERISTICAS = 2 ** 18
+
+def firmas_minhash(conjuntos):
+    """
+    Firmas MinHash (len(conjuntos), PERMUTACIONES) uint32 de una lista de arrays
+    de hashes de características, calculadas en bloque. Un array vacío da una
+    firma VACIO. Las características repetidas no alteran la firma.
+    """
+    firmas = np.full((len(conjuntos), PERMUTACIONES), VACIO, dtype=np.uint32)
+    no_vacios = [i for i, conjunto in enumerate(conjuntos) if len(conjunto)]
+    inicio = 0
+    while inicio < len(no_vacios):
+        # Grupo de conjuntos consecutivos que caben en un bloque (al menos uno).
+        fin, total = inicio, 0
+        while fin < len(no_vacios) and (fin == inicio or total + len(conjuntos[no_vacios[fin]]) <= _BLOQUE_CARACTERISTICAS):
+            total += len(conjuntos[no_vacios[fin]])
+            fin += 1
+        grupo = no_vacios[inicio:fin]
+        x = np.concatenate([conjuntos[i] for i in grupo])
+        limites = np.cumsum([0] + [len(conjuntos[i]) for i in grupo[:-1]])
+        hashes = (_A[:, None] * x[None, :] + _B[:, None]) >> np.uint64(32)
+        firmas[grupo] = np.minimum.reduceat(hashes, limites, axis=1).T.astype(np.uint32)
+        inicio = fin
+    return firmas
+
+def firmas_registro(tema, script):
+    """Firmas (tema, script) de un registro o de una consulta."""
+    firmas = firmas_minhash([_caracteristicas_tema(tema), _caracteristicas_script(script)])
+    return firmas[0], firmas[1]
+
+class IndiceSimilitud(VistaHistorial):
+    """
+    Firmas MinHash de tema y script de cada registro del historial, en matrices
+    NumPy que crecen por duplicación. Los borrados marcan la fila como muerta;
+    cuando hay más filas muertas que vivas la matriz se compacta.
+    """
+
+    def __init__(self, almacen):
+        super().__init__(almacen)
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.fila_por_id = {}
+        self._pendientes = []
+        self._n = 0
+        self._muertas = 0
+        self._reservar(1024)
+
+    def _reservar(self, capacidad):
+        self._firmas_tema = np.full((capacidad, PERMUTACIONES), VACIO, dtype=np.uint32)
+        self._firmas_script = np.full((capacidad, PERMUTACIONES), VACIO, dtype=np.uint32)
+        self._posiciones = np.zeros((capacidad, 2), dtype=np.int64)
+        self._vivas = np.zeros(capacidad, dtype=bool)
+
+    def _crecer(self):
+        n, capacidad = self._n, len(self._vivas)
+        anteriores = (self._firmas_tema, self._firmas_script, self._posiciones, self._vivas)
+        self._reservar(capacidad * 2)
+        for nueva, anterior in zip((self._firmas_tema, self._firmas_script, self._posiciones, self._vivas), anteriores):
+            nueva[:n] = anterior[:n]
+
+    def _firmar_pendientes(self):
+        """Calcula en bloque las firmas de las filas añadidas desde la última consulta."""
+        if not self._pendientes:
+            return
+        filas = [fila for fila, _, _ in self._pendientes]
+        self._firmas_tema[filas] = firmas_minhash([_caracteristicas_tema(tema) for _, tema, _ in self._pendientes])
+        self._firmas_script[filas] = firmas_minhash([_caracteristicas_script(script) for _, _, script in self._pendientes])
+        self._pendientes = []
+
+    def _compactar(self):
+        self._firmar_pendientes()
+        vivas = np.flatnonzero(self._vivas[:self._n])
+        ids_por_fila = {fila: id_registro for id_registro, fila in self.fila_por_id.items()}
+        self._firmas_tema[:len(vivas)] = self._firmas_tema[vivas]
+        self._firmas_script[:len(vivas)] = self._firmas_script[vivas]
+        self._posiciones[:len(vivas)] = self._posiciones[vivas]
+        self._vivas[:len(vivas)] = True
+        self._vivas[len(vivas):] = False
+        self.fila_por_id = {ids_por_fila[fila]: nueva for nueva, fila in enumerate(vivas)}
+        self._n = len(vivas)
+        self._muertas = 0
+
+    def _al_agregar(self, registro, posicion):
+        self._al_borrar([registro["id"]])
+        if self._n == len(self._vivas):
+            self._crecer()
+        campos = _campos_registro(registro)
+        fila = self._n
+        # Las firmas se calculan en bloque en la siguiente consulta (ver `_firmar_pendientes`).
+        self._pendientes.append((fila, campos["tema"], campos["script"]))
+        self._posiciones[fila] = posicion
+        self._vivas[fila] = True
+        self.fila_por_id[registro["id"]] = fila
+        self._n += 1
+
+    def _al_borrar(self, ids):
+        for id_registro in ids:
+            fila = self.fila_por_id.pop(id_registro, None)
+            if fila is not None:
+                self._vivas[fila] = False
+                self._muertas += 1
+        if self._muertas > 1024 and self._muertas > self._n // 2:
+            self._compactar()
+
+    def _puntuar(self, firma_tema, firma_script):
+        self._firmar_pendientes()
+        n = self._n
+        similitud = np.count_nonzero(self._firmas_tema[:n] == firma_tema, axis=1) / PERMUTACIONES
+        if firma_script[0] != VACIO:
+            similitud_script = np.count_nonzero(self._firmas_script[:n] == firma_script, axis=1) / PERMUTACIONES
+            similitud = PESO_TEMA * similitud + (1 - PESO_TEMA) * similitud_script
+        return np.where(self._vivas[:n], similitud, -1.0)
+
+    def similares(self, tema, script="", k=5, umbral=0.3):
+        """
+        Devuelve hasta `k` pares (registro, similitud 0-1) del historial más
+        parecidos al tema (y al script, si se da), de mayor a menor similitud.
+        """
+        firma_tema, firma_script = firmas_registro(tema, script)
+        if firma_tema[0] == VACIO:
+            return []
+        for _ in range(3):
+            self.sincronizar()
+            with self._lock_vista:
+                similitud = self._puntuar(firma_tema, firma_script)
+                if k < len(similitud):
+                    candidatas = np.argpartition(-similitud, k)[:k]
+                else:
+                    candidatas = np.arange(len(similitud))
+                candidatas = candidatas[similitud[candidatas] >= umbral]
+                candidatas = candidatas[np.argsort(-similitud[candidatas], kind="stable")]
+                posiciones = [tuple(p) for p in self._posiciones[candidatas].tolist()]
+                puntuaciones = similitud[candidatas].tolist()
+            registros = self.almacen.leer_registros(posiciones)
+            if registros is not None:
+                return list(zip(registros, puntuaciones))
+            # El log cambió de generación mientras leíamos: se fuerza la resincronización.
+            with self._lock_vista:
+                self._cursor = None
+        return []
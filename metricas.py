@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import date
+
+# --- Métricas de operación ---
+# Contadores e histogramas en memoria, etiquetados por función, para las
+# llamadas al modelo y las operaciones del historial. Registrar un valor es un
+# incremento bajo un lock (sin E/S), así que el coste en el camino caliente es
+# de microsegundos. Se exportan como JSON o en formato textfile de Prometheus.
+
+# Límites (en segundos) de los buckets de latencia.
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Precio por millón de tokens (USD), configurable según el modelo contratado.
+PRECIO_ENTRADA_MTOK = float(os.environ.get("GEMINI_PRECIO_ENTRADA_MTOK", "0.10"))
+PRECIO_SALIDA_MTOK = float(os.environ.get("GEMINI_PRECIO_SALIDA_MTOK", "0.40"))
+
+METRICAS_TEXTFILE = os.environ.get("METRICAS_TEXTFILE")
+
+class Histograma:
+    """Histograma acumulativo con buckets fijos (compatible con Prometheus)."""
+
+    def __init__(self, limites=BUCKETS_LATENCIA):
+        self.limites = limites
+        self.cuentas = [0] * (len(limites) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.cuentas[bisect_left(self.limites, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+    def percentil(self, p):
+        """Percentil aproximado: límite superior del bucket que lo contiene."""
+        if not self.total:
+            return None
+        objetivo = p / 100 * self.total
+        acumulado = 0
+        for limite, cuenta in zip(self.limites + (float("inf"),), self.cuentas):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return limite
+        return float("inf")
+
+class RegistroMetricas:
+    """Almacén thread-safe de contadores {(nombre, etiquetas): valor} e histogramas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.contadores = {}
+        self.histogramas = {}
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            histograma = self.histogramas.get(clave)
+            if histograma is None:
+                histograma = self.histogramas[clave] = Histograma()
+            histograma.observar(valor)
+
+    def reiniciar(self):
+        with self._lock:
+            self.contadores.clear()
+            self.histogramas.clear()
+
+    # --- Exportación ---
+    def como_dict(self):
+        with self._lock:
+            contadores = [
+                {"nombre": nombre, "etiquetas": dict(etiquetas), "valor": valor}
+                for (nombre, etiquetas), valor in sorted(self.contadores.items())
+            ]
+            histogramas = [
+                {"nombre": nombre, "etiquetas": dict(etiquetas), "total": h.total, "suma": h.suma,
+                 "p50": h.percentil(50), "p95": h.percentil(95), "p99": h.percentil(99)}
+                for (nombre, etiquetas), h in sorted(self.histogramas.items())
+            ]
+        return {"contadores": contadores, "histogramas": histogramas}
+
+    def como_prometheus(self):
+        """Formato de exposición de Prometheus, con una línea # TYPE por métrica."""
+        lineas = []
+
+        def escapar(valor):
+            return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        def formatear(etiquetas, extra=()):
+            pares = list(etiquetas) + list(extra)
+            if not pares:
+                return ""
+            return "{" + ",".join(f'{clave}="{escapar(valor)}"' for clave, valor in pares) + "}"
+
+        def tipo(nombre, anterior, clase):
+            # Las series de una métrica salen seguidas (están ordenadas): el TYPE va antes de la primera.
+            if nombre != anterior:
+                lineas.append(f"# TYPE reels_{nombre} {clase}")
+            return nombre
+
+        with self._lock:
+            anterior = None
+            for (nombre, etiquetas), valor in sorted(self.contadores.items()):
+                anterior = tipo(nombre, anterior, "counter")
+                lineas.append(f"reels_{nombre}{formatear(etiquetas)} {valor}")
+            anterior = None
+            for (nombre, etiquetas), h in sorted(self.histogramas.items()):
+                anterior = tipo(nombre, anterior, "histogram")
+                acumulado = 0
+                for limite, cuenta in zip(h.limites, h.cuentas):
+                    acumulado += cuenta
+                    lineas.append(f"reels_{nombre}_bucket{formatear(etiquetas, [('le', limite)])} {acumulado}")
+                lineas.append(f"reels_{nombre}_bucket{formatear(etiquetas, [('le', '+Inf')])} {h.total}")
+                lineas.append(f"reels_{nombre}_sum{formatear(etiquetas)} {h.suma}")
+                lineas.append(f"reels_{nombre}_count{formatear(etiquetas)} {h.total}")
+        return "\n".join(lineas) + "\n"
+
+metricas = RegistroMetricas()
+
+# --- Hooks de instrumentación ---
+def registrar_llamada_modelo(funcion, segundos, respuesta=None, error=None):
+    """
+    Registra una llamada al modelo: latencia, tokens de entrada/salida
+    (`response.usage_metadata`) y coste estimado del día.
+    """
+    estado = "error" if error is not None else "ok"
+    metricas.incrementar("llamadas_modelo_total", funcion=funcion, estado=estado)
+    metricas.observar("latencia_modelo_segundos", segundos, funcion=funcion)
+
+    uso = getattr(respuesta, "usage_metadata", None) if respuesta is not None else None
+    if uso is not None:
+        entrada = getattr(uso, "prompt_token_count", 0) or 0
+        salida = getattr(uso, "candidates_token_count", 0) or 0
+        metricas.incrementar("tokens_entrada_total", entrada, funcion=funcion)
+        metricas.incrementar("tokens_salida_total", salida, funcion=funcion)
+        coste = (entrada * PRECIO_ENTRADA_MTOK + salida * PRECIO_SALIDA_MTOK) / 1_000_000
+        metricas.incrementar("coste_usd_total", coste, dia=date.today().isoformat())
+
+def registrar_parseo(funcion, correcto):
+    """Registra el resultado de parsear una respuesta del modelo."""
+    metricas.incrementar("parseos_total", funcion=funcion, estado="ok" if correcto else "fallo")
+
+def registrar_accion(accion):
+    """Cuenta una acción del usuario (p. ej. 'generar_contenido') para relacionarla con sus llamadas."""
+    metricas.incrementar("acciones_total", accion=accion)
+
+@contextmanager
+def medir(nombre, **etiquetas):
+    """Mide la duración del bloque y la registra como histograma `<nombre>_segundos`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas.observar(f"{nombre}_segundos", time.perf_counter() - inicio, **etiquetas)
+
+def resumen_por_funcion():
+    """
+    Resumen listo para mostrar: llamadas, errores, p95, tokens, fallos de
+    parseo, coberturas y plazos vencidos por función, operaciones del
+    historial, acciones del usuario y coste acumulado por día.
+    """
+    datos = metricas.como_dict()
+    filas = {}
+    for contador in datos["contadores"]:
+        funcion = contador["etiquetas"].get("funcion")
+        if funcion is None:
+            continue
+        fila = filas.setdefault(funcion, {"funcion": funcion, "llamadas": 0, "errores": 0,
+                                          "tokens_entrada": 0, "tokens_salida": 0,
+                                          "parseos": 0, "fallos_parseo": 0, "p95_s": None})
+        estado = contador["etiquetas"].get("estado")
+        if contador["nombre"] == "llamadas_modelo_total":
+            fila["llamadas"] += contador["valor"]
+            if estado == "error":
+                fila["errores"] += contador["valor"]
+        elif contador["nombre"] == "tokens_entrada_total":
+            fila["tokens_entrada"] += contador["valor"]
+        elif contador["nombre"] == "tokens_salida_total":
+            fila["tokens_salida"] += contador["valor"]
+        elif contador["nombre"] == "parseos_total":
+            fila["parseos"] += contador["valor"]
+            if estado == "fallo":
+                fila["fallos_parseo"] += contador["valor"]
+    for contador in datos["contadores"]:
+        fila = filas.get(contador["etiquetas"].get("funcion"))
+        if fila is not None and contador["nombre"] in ("coberturas_total", "coberturas_ganadas_total",
+                                                         "plazos_excedidos_total"):
+            clave = contador["nombre"][:-len("_total")]
+            fila[clave] = fila.get(clave, 0) + contador["valor"]
+
+    historial = []
+    for histograma in datos["histogramas"]:
+        funcion = histograma["etiquetas"].get("funcion")
+        if histograma["nombre"] == "latencia_modelo_segundos" and funcion in filas:
+            filas[funcion]["p95_s"] = histograma["p95"]
+        elif histograma["nombre"] == "ahorro_cobertura_segundos" and funcion in filas:
+            filas[funcion]["ahorro_cobertura_s"] = histograma["suma"]
+        elif histograma["nombre"] == "historial_segundos":
+            historial.append({"operacion": histograma["etiquetas"].get("operacion"),
+                              "total": histograma["total"], "p95_s": histograma["p95"]})
+
+    coste_por_dia = {
+        c["etiquetas"]["dia"]: c["valor"] for c in datos["contadores"] if c["nombre"] == "coste_usd_total"
+    }
+    acciones = {
+        c["etiquetas"]["accion"]: c["valor"] for c in datos["contadores"] if c["nombre"] == "acciones_total"
+    }
+    return {"funciones": list(filas.values()), "historial": historial,
+            "coste_usd_por_dia": coste_por_dia, "acciones": acciones}
+
+def exportar_textfile(ruta=None):
+    """
+    Escribe las métricas en formato Prometheus (para el textfile collector de
+    node_exporter) con rename atómico. Sin ruta se usa METRICAS_TEXTFILE.
+    """
+    ruta = ruta or METRICAS_TEXTFILE
+    if not ruta:
+        return None
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(metricas.como_prometheus())
+    os.replace(temporal, ruta)
+    return ruta
+
+def exportar_json(ruta):
+    """Escribe las métricas como JSON."""
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(metricas.como_dict(), f, ensure_ascii=False, indent=2)
+    return ruta
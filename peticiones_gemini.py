@@ -0,0 +1,422 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from metricas import metricas, registrar_llamada_modelo
+from presupuesto_tokens import contar_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Capa común de peticiones a Gemini ---
+# Todas las llamadas al modelo pasan por `llamar_modelo`, que aplica:
+#   1. un limitador de tasa por token bucket, común a todo el proceso
+#      (peticiones/minuto y tokens/minuto);
+#   2. reintentos con backoff exponencial y jitter ante errores transitorios (429, 5xx);
+#   3. un circuit breaker que falla rápido mientras Gemini no responde bien;
+#   4. métricas de latencia, tokens y coste por función (ver metricas.py);
+#   5. un plazo máximo por etapa y, opcionalmente, peticiones de cobertura
+#      ("hedged requests"): si la respuesta tarda más que el percentil habitual
+#      se lanza un duplicado y se usa la primera que llegue.
+
+GEMINI_RPM = float(os.environ.get("GEMINI_RPM", "60"))
+GEMINI_TPM = float(os.environ.get("GEMINI_TPM", "1000000"))
+GEMINI_REINTENTOS = int(os.environ.get("GEMINI_REINTENTOS", "4"))
+GEMINI_BACKOFF_BASE = float(os.environ.get("GEMINI_BACKOFF_BASE", "1.0"))
+GEMINI_BACKOFF_MAX = float(os.environ.get("GEMINI_BACKOFF_MAX", "30"))
+GEMINI_ESPERA_MAX_LIMITE = float(os.environ.get("GEMINI_ESPERA_MAX_LIMITE", "60"))
+GEMINI_CIRCUITO_FALLOS = int(os.environ.get("GEMINI_CIRCUITO_FALLOS", "5"))
+GEMINI_CIRCUITO_ESPERA = float(os.environ.get("GEMINI_CIRCUITO_ESPERA", "30"))
+
+# Plazo (segundos) de cada llamada, reintentos incluidos, por función. GEMINI_PLAZOS
+# permite cambiarlos ("generar_script=30,analizar_script=40"); GEMINI_PLAZO_S es el resto.
+GEMINI_PLAZO_S = float(os.environ.get("GEMINI_PLAZO_S", "60"))
+PLAZOS_POR_FUNCION = {"generar_script": 45, "generar_copy_hooks": 30, "analizar_script": 45, "generar_contenido": 60}
+PLAZOS_POR_FUNCION.update({
+    funcion.strip(): float(segundos)
+    for funcion, _, segundos in (par.partition("=") for par in os.environ.get("GEMINI_PLAZOS", "").split(",") if "=" in par)
+})
+# El plazo de la etapa no cuenta la espera en la cola del pool de llamadas; el
+# plazo total (espera incluida) es este múltiplo suyo.
+GEMINI_PLAZO_TOTAL_FACTOR = float(os.environ.get("GEMINI_PLAZO_TOTAL_FACTOR", "2"))
+
+# Cobertura: desactivada por defecto. Se lanza un duplicado cuando la llamada supera
+# el percentil GEMINI_COBERTURA_PERCENTIL de las últimas latencias de esa función,
+# con un máximo de GEMINI_COBERTURA_PRESUPUESTO coberturas por llamada (5%).
+GEMINI_COBERTURA = os.environ.get("GEMINI_COBERTURA", "0") == "1"
+GEMINI_COBERTURA_PERCENTIL = float(os.environ.get("GEMINI_COBERTURA_PERCENTIL", "95"))
+GEMINI_COBERTURA_PRESUPUESTO = float(os.environ.get("GEMINI_COBERTURA_PRESUPUESTO", "0.05"))
+GEMINI_COBERTURA_MUESTRAS = int(os.environ.get("GEMINI_COBERTURA_MUESTRAS", "20"))
+
+# Hilos del pool de llamadas: como mínimo tantos como llamadas concurrentes
+# (servidor_api usa SERVIDOR_HILOS=64) y el doble si se usan coberturas.
+GEMINI_HILOS = int(os.environ.get("GEMINI_HILOS", "128"))
+
+CODIGOS_REINTENTABLES = {408, 429, 500, 502, 503, 504}
+ERRORES_REINTENTABLES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway", "Aborted", "Unknown",
+    "ConnectionError", "Timeout", "TimeoutError",
+}
+
+class CircuitoAbierto(Exception):
+    """Gemini ha fallado repetidamente y se rechazan llamadas hasta que se recupere."""
+
+class LimiteDeTasaExcedido(Exception):
+    """No se pudo obtener cupo del limitador dentro del tiempo máximo de espera."""
+
+class PlazoExcedido(TimeoutError):
+    """La llamada no terminó dentro del plazo de su etapa."""
+
+class EsperaPoolExcedida(PlazoExcedido):
+    """La llamada no llegó a empezar antes del plazo total: el pool de llamadas estaba lleno."""
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: `capacidad` unidades que se rellenan a `por_segundo`.
+    `adquirir` bloquea hasta que hay cupo (o hasta `espera_max` segundos).
+    """
+
+    def __init__(self, capacidad, por_segundo):
+        self.capacidad = capacidad
+        self.por_segundo = por_segundo
+        self._disponible = capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self._disponible = min(self.capacidad, self._disponible + (ahora - self._ultimo) * self.por_segundo)
+        self._ultimo = ahora
+
+    def adquirir(self, cantidad=1, espera_max=None):
+        # Una petición mayor que el bucket completo nunca cabría: se limita a la capacidad.
+        cantidad = min(cantidad, self.capacidad)
+        limite = None if espera_max is None else time.monotonic() + espera_max
+        while True:
+            with self._lock:
+                self._rellenar()
+                if self._disponible >= cantidad:
+                    self._disponible -= cantidad
+                    return
+                espera = (cantidad - self._disponible) / self.por_segundo
+            if limite is not None and time.monotonic() + espera > limite:
+                raise LimiteDeTasaExcedido("Límite de peticiones a Gemini alcanzado. Inténtalo de nuevo en unos segundos.")
+            time.sleep(espera)
+
+class CircuitBreaker:
+    """
+    Circuit breaker clásico: tras `max_fallos` fallos seguidos se abre durante
+    `espera` segundos; después deja pasar una llamada de prueba (semiabierto) y
+    se cierra si esa llamada sale bien.
+    """
+
+    def __init__(self, max_fallos, espera):
+        self.max_fallos = max_fallos
+        self.espera = espera
+        self.estado = "cerrado"
+        self._fallos = 0
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+        self._lock = threading.Lock()
+
+    def permitir(self):
+        """Deja pasar la llamada o lanza `CircuitoAbierto`. Devuelve True si es la llamada de prueba."""
+        with self._lock:
+            if self.estado == "abierto":
+                if time.monotonic() - self._abierto_desde < self.espera:
+                    raise CircuitoAbierto("Gemini no está disponible temporalmente. Inténtalo de nuevo en unos segundos.")
+                self.estado = "semiabierto"
+            if self.estado == "semiabierto":
+                # Solo una llamada de prueba a la vez.
+                if self._prueba_en_curso:
+                    raise CircuitoAbierto("Gemini se está recuperando. Inténtalo de nuevo en unos segundos.")
+                self._prueba_en_curso = True
+                return True
+            return False
+
+    def liberar(self, prueba):
+        """
+        Cierra una llamada que no dice nada de la salud de Gemini (p. ej. un error
+        del cliente): el estado no cambia y, si era la prueba, otra llamada puede serlo.
+        """
+        if prueba:
+            with self._lock:
+                self._prueba_en_curso = False
+
+    def registrar_exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._prueba_en_curso = False
+            self.estado = "cerrado"
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            self._prueba_en_curso = False
+            if self.estado == "semiabierto" or self._fallos >= self.max_fallos:
+                if self.estado != "abierto":
+                    logger.warning("Gemini: circuito abierto tras %d fallos seguidos.", self._fallos)
+                self.estado = "abierto"
+                self._abierto_desde = time.monotonic()
+
+class EstimadorLatencia:
+    """Ventana de las últimas latencias correctas por función, para fijar cuándo cubrir."""
+
+    def __init__(self, tamano=200):
+        self.tamano = tamano
+        self._latencias = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, funcion, segundos):
+        with self._lock:
+            self._latencias.setdefault(funcion, deque(maxlen=self.tamano)).append(segundos)
+
+    def percentil(self, funcion, p, minimo_muestras=GEMINI_COBERTURA_MUESTRAS):
+        """Percentil `p` de las latencias recientes, o None si aún hay pocas muestras."""
+        with self._lock:
+            latencias = sorted(self._latencias.get(funcion, ()))
+        if len(latencias) < minimo_muestras:
+            return None
+        return latencias[min(len(latencias) - 1, int(p / 100 * len(latencias)))]
+
+class PresupuestoCobertura:
+    """Limita las coberturas a una proporción de las llamadas (ventana que decae cada 1000 llamadas)."""
+
+    def __init__(self, proporcion):
+        self.proporcion = proporcion
+        self._llamadas = 0
+        self._coberturas = 0
+        self._lock = threading.Lock()
+
+    def registrar_llamada(self):
+        with self._lock:
+            self._llamadas += 1
+            if self._llamadas >= 1000:
+                self._llamadas //= 2
+                self._coberturas //= 2
+
+    def permitir(self):
+        with self._lock:
+            if self._coberturas + 1 > self.proporcion * self._llamadas:
+                return False
+            self._coberturas += 1
+            return True
+
+limitador_peticiones = TokenBucket(max(GEMINI_RPM / 6, 1), GEMINI_RPM / 60)
+limitador_tokens = TokenBucket(max(GEMINI_TPM / 6, 1), GEMINI_TPM / 60)
+circuito = CircuitBreaker(GEMINI_CIRCUITO_FALLOS, GEMINI_CIRCUITO_ESPERA)
+estimador_latencia = EstimadorLatencia()
+presupuesto_cobertura = PresupuestoCobertura(GEMINI_COBERTURA_PRESUPUESTO)
+
+# Las llamadas se hacen en este pool para poder abandonarlas al vencer el plazo
+# sin bloquear el hilo de la página (el hilo del pool termina por su cuenta).
+# El tiempo que una llamada espera en la cola del pool no cuenta para su plazo:
+# con el pool lleno, vencerían llamadas que ni siquiera llegaron a Gemini y el
+# circuito las contaría como fallos suyos. Sí cuenta para el plazo total: si
+# vence antes de que la llamada empiece, se saca de la cola y se lanza
+# `EsperaPoolExcedida`, que tampoco cuenta para el circuito.
+_pool_llamadas = ThreadPoolExecutor(max_workers=GEMINI_HILOS, thread_name_prefix="gemini")
+
+def estimar_tokens(prompt, generation_config=None):
+    """Estimación local de tokens de una llamada (prompt + salida máxima), ver `contar_tokens`."""
+    salida = (generation_config or {}).get("max_output_tokens", 1024)
+    return contar_tokens(prompt) + salida
+
+def es_reintentable(error):
+    """Decide si un error de la API es transitorio (cuota, sobrecarga, 5xx, timeouts)."""
+    codigo = getattr(error, "code", None)
+    if isinstance(codigo, int) and codigo in CODIGOS_REINTENTABLES:
+        return True
+    return any(clase.__name__ in ERRORES_REINTENTABLES for clase in type(error).__mro__)
+
+def _espera_backoff(intento):
+    """Backoff exponencial con 'full jitter': uniforme entre 0 y base * 2^intento (con tope)."""
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** intento))
+
+def _medir_stream(respuesta, funcion, inicio, limite):
+    """
+    Recorre el stream y registra la llamada al terminar, cuando ya hay `usage_metadata`.
+    Entre fragmentos comprueba el plazo de la etapa.
+    """
+    try:
+        for fragmento in respuesta:
+            if time.monotonic() > limite:
+                raise PlazoExcedido(f"Gemini no terminó de responder en el plazo ({funcion}).")
+            yield fragmento
+    except Exception as e:
+        registrar_llamada_modelo(funcion, time.perf_counter() - inicio, error=e)
+        raise
+    registrar_llamada_modelo(funcion, time.perf_counter() - inicio, respuesta)
+
+def _cupo_inmediato(prompt, generation_config):
+    """Reserva cupo en los limitadores solo si lo hay ya (para no retrasar una cobertura)."""
+    try:
+        limitador_peticiones.adquirir(1, espera_max=0)
+        limitador_tokens.adquirir(estimar_tokens(prompt, generation_config), espera_max=0)
+    except LimiteDeTasaExcedido:
+        return False
+    return True
+
+def _registrar_principal(funcion, inicio):
+    """Alimenta el estimador con la latencia de la petición original (sin sesgo por las coberturas)."""
+    def al_terminar(futuro):
+        if not futuro.cancelled() and futuro.exception() is None:
+            estimador_latencia.registrar(funcion, time.perf_counter() - inicio)
+    return al_terminar
+
+def _registrar_ahorro(funcion, fin_cobertura):
+    """Cuando termina la original tras ganar la cobertura, registra cuánto tiempo se ahorró."""
+    def al_terminar(futuro):
+        metricas.observar("ahorro_cobertura_segundos", time.perf_counter() - fin_cobertura, funcion=funcion)
+    return al_terminar
+
+def _enviar(client, prompt, kwargs, restante, empezada=None, total=None):
+    """
+    Envía una llamada al pool. El backend recibe como plazo los `restante` segundos
+    contados desde que la llamada empieza a ejecutarse, no desde que entra en la cola,
+    sin pasar del instante `total` (time.monotonic) si se da.
+    """
+    def ejecutar():
+        if empezada is not None:
+            empezada.set()
+        argumentos = kwargs
+        if getattr(client, "admite_plazo", False):
+            # El backend corta la petición él mismo al vencer el plazo y libera su hilo.
+            plazo = restante if total is None else min(restante, max(0.0, total - time.monotonic()))
+            argumentos = {**kwargs, "plazo": plazo}
+        return client.generate_content(prompt, **argumentos)
+    return _pool_llamadas.submit(ejecutar)
+
+class LimiteLlamada:
+    """
+    Plazos de una llamada, reintentos incluidos, como instantes de time.monotonic:
+    `instante` es el de la etapa (se desplaza lo que la llamada espera en el pool) y
+    `total` el máximo absoluto, espera incluida.
+    """
+
+    def __init__(self, segundos, factor_total=GEMINI_PLAZO_TOTAL_FACTOR):
+        ahora = time.monotonic()
+        self.instante = ahora + segundos
+        self.total = ahora + segundos * max(1.0, factor_total)
+
+    def desplazar(self, segundos):
+        self.instante = min(self.instante + segundos, self.total)
+
+    def restante(self):
+        return max(0.0, self.instante - time.monotonic())
+
+def _intento(client, prompt, generation_config, kwargs, funcion, limite):
+    """
+    Un intento de llamada con plazo `limite` (un `LimiteLlamada`). Sin streaming y con
+    la cobertura activada, lanza un duplicado si la respuesta tarda más que el
+    percentil habitual y devuelve la primera respuesta correcta. El plazo de la
+    etapa se desplaza lo que la llamada esperó en la cola del pool; si vence el
+    plazo total antes de que empiece, se cancela y lanza `EsperaPoolExcedida`.
+    """
+    empezada = threading.Event()
+    encolada = time.monotonic()
+    principal = _enviar(client, prompt, kwargs, max(0.0, limite.instante - encolada), empezada, limite.total)
+    if not empezada.wait(timeout=max(0.0, limite.total - encolada)) and principal.cancel():
+        metricas.observar("espera_pool_segundos", time.monotonic() - encolada, funcion=funcion)
+        raise EsperaPoolExcedida(f"La llamada no llegó a empezar en el plazo: el pool de llamadas está lleno ({funcion}).")
+    # Si no se pudo cancelar es que acaba de empezar.
+    empezada.wait()
+    espera_cola = time.monotonic() - encolada
+    limite.desplazar(espera_cola)
+    if espera_cola > 0.01:
+        metricas.observar("espera_pool_segundos", espera_cola, funcion=funcion)
+    inicio = time.perf_counter()
+    pendientes = {principal}
+
+    umbral = None
+    if not kwargs.get("stream"):
+        # En streaming la llamada vuelve en cuanto empieza la respuesta: no sirve de referencia.
+        principal.add_done_callback(_registrar_principal(funcion, inicio))
+        presupuesto_cobertura.registrar_llamada()
+        if GEMINI_COBERTURA:
+            umbral = estimador_latencia.percentil(funcion, GEMINI_COBERTURA_PERCENTIL)
+    cobertura = None
+    if umbral is not None and time.monotonic() + umbral < limite.instante:
+        hechos, _ = wait(pendientes, timeout=umbral)
+        if not hechos and presupuesto_cobertura.permitir() and _cupo_inmediato(prompt, generation_config):
+            cobertura = _enviar(client, prompt, kwargs, limite.restante(), total=limite.total)
+            pendientes.add(cobertura)
+            metricas.incrementar("coberturas_total", funcion=funcion)
+
+    error = None
+    while pendientes:
+        hechos, pendientes = wait(pendientes, timeout=limite.restante(),
+                                  return_when=FIRST_COMPLETED)
+        if not hechos:
+            raise PlazoExcedido(f"Gemini no respondió en el plazo ({funcion}).")
+        for futuro in hechos:
+            if futuro.exception() is not None:
+                error = futuro.exception()
+                continue
+            if futuro is cobertura:
+                metricas.incrementar("coberturas_ganadas_total", funcion=funcion)
+                principal.add_done_callback(_registrar_ahorro(funcion, time.perf_counter()))
+            return futuro.result(), inicio
+    raise error
+
+def plazo_de(funcion):
+    """Plazo en segundos de las llamadas de una función (ver PLAZOS_POR_FUNCION)."""
+    return PLAZOS_POR_FUNCION.get(funcion, GEMINI_PLAZO_S)
+
+def llamar_modelo(client, prompt, generation_config=None, stream=False, funcion="otro", plazo=None):
+    """
+    Llama a `client.generate_content` respetando el limitador de tasa, reintentando
+    los errores transitorios y pasando por el circuit breaker. Devuelve la respuesta
+    del SDK (en streaming, un iterable de sus fragmentos); los errores no
+    reintentables (o agotados los reintentos) se propagan. `funcion` etiqueta las
+    métricas de la llamada (p. ej. "generar_script") y fija su plazo, que se puede
+    cambiar con `plazo` (segundos); si vence se lanza `PlazoExcedido`. La espera
+    en el pool de llamadas solo cuenta para el plazo total (GEMINI_PLAZO_TOTAL_FACTOR
+    veces ese plazo).
+    """
+    kwargs = {"stream": True} if stream else {}
+    if generation_config is not None:
+        kwargs["generation_config"] = generation_config
+    limite = LimiteLlamada(plazo if plazo is not None else plazo_de(funcion))
+
+    for intento in range(GEMINI_REINTENTOS + 1):
+        # El cupo se reserva antes de pasar por el circuito: si el limitador lanza
+        # después de `permitir()`, la llamada de prueba del estado semiabierto no
+        # registraría ni éxito ni fallo y el circuito no volvería a cerrarse.
+        espera_max = min(GEMINI_ESPERA_MAX_LIMITE, limite.restante())
+        limitador_peticiones.adquirir(1, espera_max=espera_max)
+        limitador_tokens.adquirir(estimar_tokens(prompt, generation_config), espera_max=espera_max)
+        prueba = circuito.permitir()
+        inicio = time.perf_counter()
+        try:
+            respuesta, inicio = _intento(client, prompt, generation_config, kwargs, funcion, limite)
+        except Exception as e:
+            registrar_llamada_modelo(funcion, time.perf_counter() - inicio, error=e)
+            if isinstance(e, PlazoExcedido):
+                metricas.incrementar("plazos_excedidos_total", funcion=funcion)
+            if isinstance(e, EsperaPoolExcedida):
+                # No llegó a Gemini (y el plazo total ya venció): ni circuito ni reintento.
+                circuito.liberar(prueba)
+                raise
+            if not es_reintentable(e):
+                # Errores del cliente (prompt inválido, clave incorrecta...) no dicen si
+                # Gemini está caído o no: el circuito se queda como estaba.
+                circuito.liberar(prueba)
+                raise
+            circuito.registrar_fallo()
+            espera = _espera_backoff(intento)
+            if intento == GEMINI_REINTENTOS or time.monotonic() + espera >= limite.instante:
+                raise
+            metricas.incrementar("reintentos_modelo_total", funcion=funcion)
+            logger.info("Gemini: error transitorio (%s); reintento %d en %.1fs.", e, intento + 1, espera)
+            time.sleep(espera)
+            continue
+        circuito.registrar_exito()
+        if stream:
+            return _medir_stream(respuesta, funcion, inicio, limite.instante)
+        registrar_llamada_modelo(funcion, time.perf_counter() - inicio, respuesta)
+        return respuesta
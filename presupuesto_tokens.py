@@ -0,0 +1,149 @@
+import logging
+import os
+import re
+
+from metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# --- Presupuesto de tokens de entrada ---
+# `generar_copy_hooks` y `analizar_script` mandan un script entero al modelo, y en
+# esas dos llamadas casi todo el coste y la latencia son tokens de entrada. Antes
+# de construir el prompt, el script se compacta:
+#   1. se quita la sección "Elementos Visuales/Sonido" (no aporta al copy ni al análisis);
+#   2. se quita la decoración markdown (negritas, encabezados, separadores, viñetas);
+#   3. si aún supera el presupuesto de la función, según PRESUPUESTO_TOKENS_POLITICA:
+#      "recortar" lo resume (título, gancho y CTA enteros; primera frase de cada
+#      escena) y, si no basta, lo corta por el medio; "rechazar" lanza
+#      `PresupuestoExcedido`.
+# Las instrucciones fijas se envían sin la sangría del código. Cada llamada
+# registra en el log y en la métrica tokens_ahorrados_total los tokens ahorrados.
+#
+# El caché de contexto de la API no se usa: el bloque fijo de instrucciones ronda
+# los 300-400 tokens y el mínimo que la API admite para cachear contenido es de
+# miles de tokens.
+
+PRESUPUESTO_TOKENS_POLITICA = os.environ.get("PRESUPUESTO_TOKENS_POLITICA", "recortar").lower()
+# Tokens máximos del script dentro del prompt, por función (0 = sin límite).
+PRESUPUESTOS_POR_FUNCION = {
+    "generar_copy_hooks": int(os.environ.get("PRESUPUESTO_TOKENS_COPY", "400")),
+    "analizar_script": int(os.environ.get("PRESUPUESTO_TOKENS_ANALISIS", "1500")),
+}
+MARCA_RECORTE = "[…]"
+
+TOKEN_REGEX = re.compile(r"\w+|[^\w\s]")
+NOMBRES_SECCION = r"(título|gancho|desarrollo del contenido|llamada a la acción|escena\s*\d+)"
+# La sección visual termina en el siguiente encabezado, con o sin markdown.
+SECCION_VISUAL_REGEX = re.compile(
+    r"^[ \t]*[#*_]*[ \t]*(?:\d+\.\s*)?(?:Ideas de )?Elementos Visuales[^\n]*\n?"
+    rf".*?(?=^[ \t]*(?:#|\*\*|---|{NOMBRES_SECCION}[^:\n]*:)|\Z)",
+    re.IGNORECASE | re.MULTILINE | re.DOTALL
+)
+DECORACION_REGEX = re.compile(r"\*\*|__|^[ \t]*#+[ \t]*|^[ \t]*(?:[-*_][ \t]*){3,}$|^[ \t]*[-*•][ \t]+", re.MULTILINE)
+SECCION_SCRIPT_REGEX = re.compile(rf"^{NOMBRES_SECCION}[^:\n]*:", re.IGNORECASE)
+FRASE_REGEX = re.compile(r"^.*?[.!?…](?=\s|$)")
+PARES_APERTURA = {")": "(", "]": "[", "}": "{", "»": "«", "”": "“"}
+
+class PresupuestoExcedido(ValueError):
+    """El script supera el presupuesto de tokens de la función y la política es "rechazar"."""
+
+def contar_tokens(texto):
+    """
+    Estimación local de tokens (sin llamar a la API): cada palabra cuenta un token
+    por cada 4 caracteres (mínimo 1) y cada signo de puntuación o emoji, uno.
+    """
+    return sum((len(pieza) + 3) // 4 for pieza in TOKEN_REGEX.findall(texto))
+
+def compactar_espacios(texto):
+    """Quita la sangría y los espacios finales de cada línea y deja como mucho una línea en blanco seguida."""
+    lineas = (linea.strip() for linea in texto.strip().splitlines())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lineas))
+
+def compactar_script(script):
+    """Script sin la sección de elementos visuales/sonido ni decoración markdown."""
+    script = SECCION_VISUAL_REGEX.sub("", script)
+    return compactar_espacios(DECORACION_REGEX.sub("", script))
+
+def _cerrar_pares(texto):
+    """Cierra los paréntesis, corchetes y comillas que `texto` dejó abiertos, en orden."""
+    cierres = {apertura: cierre for cierre, apertura in PARES_APERTURA.items()}
+    abiertos = []
+    for caracter in texto:
+        if caracter in cierres:
+            abiertos.append(caracter)
+        elif caracter in PARES_APERTURA and abiertos and abiertos[-1] == PARES_APERTURA[caracter]:
+            abiertos.pop()
+    return texto + "".join(cierres[apertura] for apertura in reversed(abiertos))
+
+def _primera_frase(linea):
+    """Primera frase de la línea; si el corte deja abierto un "[Escena N: …", se cierra."""
+    match = FRASE_REGEX.match(linea)
+    if not match or match.end() == len(linea.rstrip()):
+        return linea
+    return _cerrar_pares(match.group(0))
+
+def resumir_script(script):
+    """
+    Resumen extractivo de un script compactado: conserva título, gancho y CTA, y
+    del desarrollo solo la primera frase de cada escena.
+    """
+    resumen = []
+    en_desarrollo = False
+    for linea in script.splitlines():
+        seccion = SECCION_SCRIPT_REGEX.match(linea)
+        nombre = seccion.group(1).lower() if seccion else ""
+        if nombre.startswith("escena") or (en_desarrollo and not seccion):
+            linea = _primera_frase(linea)
+        elif seccion:
+            en_desarrollo = nombre.startswith("desarrollo")
+        resumen.append(linea)
+    return "\n".join(resumen)
+
+def recortar_a_tokens(texto, presupuesto):
+    """
+    Recorta el texto por el medio hasta que quepa en `presupuesto` tokens: se
+    quedan el principio (dos tercios) y el final (donde suele ir la CTA).
+    """
+    tokens = contar_tokens(texto)
+    if tokens <= presupuesto:
+        return texto
+    caracteres = len(texto) * presupuesto // tokens
+    while caracteres > 0:
+        # Se corta en saltos de línea para no dejar escenas ni palabras a medias.
+        cabeza = texto[:caracteres * 2 // 3].rsplit("\n", 1)[0]
+        cola = texto[len(texto) - caracteres // 3:].split("\n", 1)[-1] if caracteres >= 3 else ""
+        recortado = f"{cabeza.rstrip()}\n{MARCA_RECORTE}\n{cola.lstrip()}"
+        if contar_tokens(recortado) <= presupuesto:
+            return recortado.rstrip()
+        caracteres = caracteres * 9 // 10
+    return MARCA_RECORTE
+
+def ajustar_script(script, funcion):
+    """
+    Compacta el script y lo ajusta al presupuesto de `funcion` según la política
+    configurada. Lanza `PresupuestoExcedido` si no cabe y la política es "rechazar".
+    """
+    compacto = compactar_script(script)
+    presupuesto = PRESUPUESTOS_POR_FUNCION.get(funcion, 0)
+    if not presupuesto or contar_tokens(compacto) <= presupuesto:
+        return compacto
+    if PRESUPUESTO_TOKENS_POLITICA == "rechazar":
+        raise PresupuestoExcedido(
+            f"El script supera el presupuesto de entrada de {funcion} "
+            f"({contar_tokens(compacto)} tokens; máximo {presupuesto})."
+        )
+    return recortar_a_tokens(resumir_script(compacto), presupuesto)
+
+def preparar_prompt(construir, script, funcion):
+    """
+    Devuelve `construir(script)` con el script ajustado al presupuesto y las
+    instrucciones sin sangría, y registra cuántos tokens se ahorran frente al
+    prompt sin compactar.
+    """
+    prompt = compactar_espacios(construir(ajustar_script(script, funcion)))
+    tokens_original = contar_tokens(construir(script))
+    tokens_prompt = contar_tokens(prompt)
+    ahorro = max(0, tokens_original - tokens_prompt)
+    metricas.incrementar("tokens_ahorrados_total", ahorro, funcion=funcion)
+    logger.info("%s: prompt de ~%d tokens (~%d ahorrados de %d).", funcion, tokens_prompt, ahorro, tokens_original)
+    return prompt
@@ -0,0 +1,387 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+from analizador_scripts import obtener_analisis, obtener_analisis_stream
+from generadores import (copy_hooks_valido, generar_contenido_completo, generar_contenido_una_llamada,
+                         generar_copy_hooks, generar_script, generar_script_stream, script_valido,
+                         ScriptInterrumpido, VALORES_POR_DEFECTO)
+from historial_manager import (buscar_en_historial, buscar_similares, cargar_pagina_historial,
+                               guardar_en_historial, resumen_analitica)
+from metricas import metricas
+
+logger = logging.getLogger(__name__)
+
+# --- API HTTP sin interfaz ---
+# Servidor HTTP/1.1 mínimo sobre asyncio (solo biblioteca estándar) para llamar
+# a los generadores desde otros servicios. El bucle de eventos atiende las
+# conexiones; las llamadas al modelo (el SDK es síncrono) corren en un pool de
+# SERVIDOR_HILOS hilos, así que puede haber tantas en vuelo a la vez, siempre
+# dentro del limitador de tasa de peticiones_gemini.
+#
+# Las rutas POST reciben JSON y responden JSON; con "stream": true responden
+# NDJSON (una línea JSON por evento, con Transfer-Encoding: chunked) a medida
+# que llegan los fragmentos o terminan las etapas. Con LLM_BACKEND=local usa el
+# modelo de pruebas (ver backends_llm.BackendLocal).
+
+SERVIDOR_HOST = os.environ.get("SERVIDOR_HOST", "127.0.0.1")
+SERVIDOR_PUERTO = int(os.environ.get("SERVIDOR_PUERTO", "8080"))
+SERVIDOR_HILOS = int(os.environ.get("SERVIDOR_HILOS", "64"))
+SERVIDOR_MAX_CUERPO = int(os.environ.get("SERVIDOR_MAX_CUERPO", str(1024 * 1024)))
+SERVIDOR_TIMEOUT_LECTURA = float(os.environ.get("SERVIDOR_TIMEOUT_LECTURA", "30"))
+
+ESTADOS_HTTP = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+                413: "Payload Too Large", 500: "Internal Server Error"}
+
+Peticion = namedtuple("Peticion", ["metodo", "ruta", "consulta", "cabeceras", "cuerpo"])
+
+class ErrorPeticion(Exception):
+    """Error del cliente: se responde con `estado` y {"error": mensaje}."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+# --- Validación de parámetros ---
+def _json(peticion):
+    try:
+        datos = json.loads(peticion.cuerpo or b"{}")
+    except ValueError as e:
+        raise ErrorPeticion(400, f"El cuerpo no es JSON válido: {e}") from e
+    if not isinstance(datos, dict):
+        raise ErrorPeticion(400, "El cuerpo debe ser un objeto JSON.")
+    return datos
+
+def _texto(datos, clave):
+    valor = datos.get(clave)
+    if not isinstance(valor, str) or not valor.strip():
+        raise ErrorPeticion(400, f"Falta el campo de texto '{clave}'.")
+    return valor.strip()
+
+def _entero(datos, clave, defecto, minimo, maximo):
+    valor = datos.get(clave, defecto)
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        raise ErrorPeticion(400, f"'{clave}' debe ser un entero.") from None
+    if not minimo <= valor <= maximo:
+        raise ErrorPeticion(400, f"'{clave}' debe estar entre {minimo} y {maximo}.")
+    return valor
+
+def _parametros_contenido(datos):
+    return (
+        _texto(datos, "tema"),
+        str(datos.get("objetivo") or VALORES_POR_DEFECTO["objetivo"]),
+        str(datos.get("estilo") or VALORES_POR_DEFECTO["estilo"]),
+        _entero(datos, "duracion", VALORES_POR_DEFECTO["duracion"], 5, 180),
+    )
+
+# --- Puente entre el pool de hilos y asyncio ---
+async def en_hilo(funcion, *args):
+    """Ejecuta una función bloqueante en el pool del servidor."""
+    return await asyncio.get_running_loop().run_in_executor(None, funcion, *args)
+
+async def iterar_en_hilo(fabrica):
+    """
+    Recorre en el pool el generador bloqueante que devuelve `fabrica()` y entrega
+    sus elementos de forma asíncrona. Si el consumidor se detiene (p. ej. el
+    cliente cerró la conexión), el generador se cierra en su hilo.
+    """
+    loop = asyncio.get_running_loop()
+    cola = asyncio.Queue()
+    parar = threading.Event()
+    fin = object()
+
+    def productor():
+        generador = fabrica()
+        try:
+            for elemento in generador:
+                if parar.is_set():
+                    break
+                loop.call_soon_threadsafe(cola.put_nowait, (elemento, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(cola.put_nowait, (fin, e))
+        else:
+            loop.call_soon_threadsafe(cola.put_nowait, (fin, None))
+        finally:
+            generador.close()
+
+    tarea = loop.run_in_executor(None, productor)
+    try:
+        while True:
+            elemento, error = await cola.get()
+            if elemento is fin:
+                if error is not None:
+                    raise error
+                return
+            yield elemento
+    finally:
+        parar.set()
+        await asyncio.shield(tarea)
+
+# --- Rutas ---
+async def ruta_salud(peticion):
+    from cliente_gemini import error_cliente, obtener_cliente
+
+    cliente = await en_hilo(obtener_cliente)
+    return {"ok": cliente is not None, "backend": getattr(cliente, "nombre", None), "error": error_cliente()}
+
+async def ruta_script(peticion):
+    datos = _json(peticion)
+    argumentos = _parametros_contenido(datos)
+    if not datos.get("stream"):
+        script = await en_hilo(generar_script, *argumentos)
+        return {"script": script, "ok": script_valido(script)}
+
+    async def eventos():
+        partes = []
+        try:
+            async for fragmento in iterar_en_hilo(lambda: generar_script_stream(*argumentos)):
+                partes.append(fragmento)
+                yield {"fragmento": fragmento}
+        except ScriptInterrumpido as e:
+            # Los fragmentos ya enviados no forman un script: el evento final trae el error.
+            yield {"fin": True, "script": str(e), "ok": False}
+            return
+        script = "".join(partes)
+        yield {"fin": True, "script": script, "ok": script_valido(script)}
+    return eventos()
+
+async def ruta_copy_hooks(peticion):
+    datos = _json(peticion)
+    copy_hooks = await en_hilo(generar_copy_hooks, _texto(datos, "tema"), [_texto(datos, "script")])
+    return {"copy_hooks": copy_hooks, "ok": copy_hooks_valido(copy_hooks)}
+
+async def ruta_analisis(peticion):
+    datos = _json(peticion)
+    script = _texto(datos, "script")
+    if not datos.get("stream"):
+        analisis = await en_hilo(obtener_analisis, script)
+        return {"analisis": analisis, "ok": not analisis["error"]}
+
+    async def eventos():
+        async for tipo, dato in iterar_en_hilo(lambda: obtener_analisis_stream(script)):
+            if tipo == "seccion":
+                yield {"seccion": dato}
+            else:
+                yield {"fin": True, "analisis": dato, "ok": not dato["error"]}
+    return eventos()
+
+def _etapas_contenido(argumentos, una_llamada, variantes):
+    """Las etapas del pipeline como eventos serializables."""
+    if una_llamada:
+        etapas = generar_contenido_una_llamada(*argumentos)
+    else:
+        etapas = generar_contenido_completo(*argumentos, variantes=variantes)
+    for etapa in etapas:
+        resultado = etapa.resultado
+        if etapa.etapa == "variantes":
+            resultado = [variante._asdict() for variante in resultado]
+        yield {"etapa": etapa.etapa, "resultado": resultado, "segundos": round(etapa.segundos, 3)}
+
+async def ruta_contenido(peticion):
+    """
+    Script, copy/hooks y análisis de un tema. Con "guardar": true el resultado
+    válido se guarda en el historial (con su análisis y "nicho", si se da).
+    """
+    datos = _json(peticion)
+    argumentos = _parametros_contenido(datos)
+    una_llamada = bool(datos.get("una_llamada"))
+    variantes = _entero(datos, "variantes", 1, 1, 5)
+    nicho = datos.get("nicho") if isinstance(datos.get("nicho"), str) else None
+
+    async def eventos():
+        inicio = time.perf_counter()
+        resultados = {}
+        async for evento in iterar_en_hilo(lambda: _etapas_contenido(argumentos, una_llamada, variantes)):
+            resultados[evento["etapa"]] = evento["resultado"]
+            yield evento
+        ok = script_valido(resultados.get("script")) and not (resultados.get("analisis") or {}).get("error")
+        final = {"fin": True, "ok": ok, "segundos": round(time.perf_counter() - inicio, 3)}
+        if ok and datos.get("guardar"):
+            registro = await en_hilo(guardar_en_historial, argumentos[0], resultados["script"],
+                                     resultados["copy_hooks"], resultados.get("analisis"), nicho)
+            final["id_historial"] = registro["id"]
+        yield final
+
+    if datos.get("stream"):
+        return eventos()
+    respuesta = {"resultados": {}, "tiempos": {}}
+    async for evento in eventos():
+        if "etapa" in evento:
+            respuesta["resultados"][evento["etapa"]] = evento["resultado"]
+            respuesta["tiempos"][evento["etapa"]] = evento["segundos"]
+        else:
+            respuesta.update({k: v for k, v in evento.items() if k != "fin"})
+    return respuesta
+
+async def ruta_historial(peticion):
+    consulta = peticion.consulta
+    limite = _entero(consulta, "limite", 20, 1, 200)
+    if consulta.get("q", "").strip():
+        registros = await en_hilo(buscar_en_historial, consulta["q"], limite)
+        return {"registros": registros, "total": len(registros)}
+    pagina = _entero(consulta, "pagina", 1, 1, 10 ** 9)
+    registros, total = await en_hilo(cargar_pagina_historial, pagina, limite)
+    return {"registros": registros, "total": total}
+
+async def ruta_similares(peticion):
+    tema = _texto(peticion.consulta, "tema")
+    k = _entero(peticion.consulta, "k", 5, 1, 50)
+    similares = await en_hilo(buscar_similares, tema, "", k)
+    return {"similares": [{"registro": registro, "similitud": similitud} for registro, similitud in similares]}
+
+async def ruta_analitica(peticion):
+    agrupacion = peticion.consulta.get("agrupacion", "nicho")
+    if agrupacion not in ("nicho", "semana"):
+        raise ErrorPeticion(400, "'agrupacion' debe ser 'nicho' o 'semana'.")
+    return {"grupos": await en_hilo(resumen_analitica, agrupacion)}
+
+async def ruta_metricas(peticion):
+    return metricas.como_dict()
+
+RUTAS = {
+    ("GET", "/salud"): ruta_salud,
+    ("POST", "/script"): ruta_script,
+    ("POST", "/copy-hooks"): ruta_copy_hooks,
+    ("POST", "/analisis"): ruta_analisis,
+    ("POST", "/contenido"): ruta_contenido,
+    ("GET", "/historial"): ruta_historial,
+    ("GET", "/historial/similares"): ruta_similares,
+    ("GET", "/historial/analitica"): ruta_analitica,
+    ("GET", "/metricas"): ruta_metricas,
+}
+
+# --- HTTP ---
+async def _leer_peticion(reader):
+    """Lee una petición HTTP/1.1. Devuelve None si el cliente cerró la conexión."""
+    try:
+        cabecera = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), SERVIDOR_TIMEOUT_LECTURA)
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise ErrorPeticion(400, "Petición incompleta.") from e
+        return None
+    except asyncio.LimitOverrunError as e:
+        raise ErrorPeticion(400, "Cabeceras demasiado grandes.") from e
+    except asyncio.TimeoutError:
+        return None
+
+    lineas = cabecera.decode("latin-1").split("\r\n")
+    try:
+        metodo, objetivo, _ = lineas[0].split(" ", 2)
+    except ValueError:
+        raise ErrorPeticion(400, "Línea de petición no válida.") from None
+    cabeceras = {}
+    for linea in lineas[1:]:
+        nombre, separador, valor = linea.partition(":")
+        if separador:
+            cabeceras[nombre.strip().lower()] = valor.strip()
+    try:
+        longitud = int(cabeceras.get("content-length") or 0)
+    except ValueError:
+        raise ErrorPeticion(400, "Content-Length no válido.") from None
+    if longitud > SERVIDOR_MAX_CUERPO:
+        raise ErrorPeticion(413, f"El cuerpo supera {SERVIDOR_MAX_CUERPO} bytes.")
+    cuerpo = await reader.readexactly(longitud) if longitud else b""
+    url = urlsplit(objetivo)
+    consulta = {clave: valores[-1] for clave, valores in parse_qs(url.query).items()}
+    return Peticion(metodo.upper(), url.path.rstrip("/") or "/", consulta, cabeceras, cuerpo)
+
+def _cabecera(estado, cabeceras, mantener):
+    lineas = [f"HTTP/1.1 {estado} {ESTADOS_HTTP.get(estado, '')}"]
+    lineas += [f"{nombre}: {valor}" for nombre, valor in cabeceras.items()]
+    lineas.append(f"Connection: {'keep-alive' if mantener else 'close'}")
+    return ("\r\n".join(lineas) + "\r\n\r\n").encode("latin-1")
+
+async def _responder_json(writer, estado, datos, mantener):
+    cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+    writer.write(_cabecera(estado, {"Content-Type": "application/json; charset=utf-8",
+                                    "Content-Length": len(cuerpo)}, mantener))
+    writer.write(cuerpo)
+    await writer.drain()
+
+async def _responder_ndjson(writer, eventos, mantener):
+    """Envía cada evento como una línea JSON en su propio trozo (chunked)."""
+    writer.write(_cabecera(200, {"Content-Type": "application/x-ndjson; charset=utf-8",
+                                 "Transfer-Encoding": "chunked"}, mantener))
+    try:
+        async for evento in eventos:
+            linea = (json.dumps(evento, ensure_ascii=False) + "\n").encode("utf-8")
+            writer.write(b"%x\r\n%s\r\n" % (len(linea), linea))
+            await writer.drain()
+    except Exception as e:
+        # Las cabeceras ya salieron con 200: el error va como último evento.
+        logger.exception("Error en una respuesta en streaming")
+        linea = (json.dumps({"error": str(e)}, ensure_ascii=False) + "\n").encode("utf-8")
+        writer.write(b"%x\r\n%s\r\n" % (len(linea), linea))
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+async def _atender(peticion, writer, mantener):
+    """Despacha una petición y devuelve el código de estado enviado."""
+    manejador = RUTAS.get((peticion.metodo, peticion.ruta))
+    try:
+        if manejador is None:
+            if any(ruta == peticion.ruta for _, ruta in RUTAS):
+                raise ErrorPeticion(405, f"Método {peticion.metodo} no permitido en {peticion.ruta}.")
+            raise ErrorPeticion(404, f"Ruta desconocida: {peticion.ruta}")
+        resultado = await manejador(peticion)
+    except ErrorPeticion as e:
+        await _responder_json(writer, e.estado, {"error": str(e)}, mantener)
+        return e.estado
+    except Exception as e:
+        logger.exception("Error atendiendo %s %s", peticion.metodo, peticion.ruta)
+        await _responder_json(writer, 500, {"error": str(e)}, mantener)
+        return 500
+    if hasattr(resultado, "__aiter__"):
+        await _responder_ndjson(writer, resultado, mantener)
+    else:
+        await _responder_json(writer, 200, resultado, mantener)
+    return 200
+
+async def _conexion(reader, writer):
+    """Atiende las peticiones de una conexión (keep-alive) hasta que se cierra."""
+    try:
+        while True:
+            try:
+                peticion = await _leer_peticion(reader)
+            except ErrorPeticion as e:
+                await _responder_json(writer, e.estado, {"error": str(e)}, False)
+                break
+            if peticion is None:
+                break
+            mantener = peticion.cabeceras.get("connection", "").lower() != "close"
+            inicio = time.perf_counter()
+            estado = await _atender(peticion, writer, mantener)
+            ruta = peticion.ruta if (peticion.metodo, peticion.ruta) in RUTAS else "otra"
+            metricas.incrementar("api_peticiones_total", ruta=ruta, estado=str(estado))
+            metricas.observar("api_segundos", time.perf_counter() - inicio, ruta=ruta)
+            if not mantener:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def _servir(host, puerto):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=SERVIDOR_HILOS, thread_name_prefix="api")
+    )
+    servidor = await asyncio.start_server(_conexion, host, puerto)
+    direcciones = ", ".join(str(socket.getsockname()) for socket in servidor.sockets)
+    logger.info("API escuchando en %s", direcciones)
+    async with servidor:
+        await servidor.serve_forever()
+
+def servir(host=SERVIDOR_HOST, puerto=SERVIDOR_PUERTO):
+    """Arranca el servidor y bloquea hasta Ctrl+C."""
+    try:
+        asyncio.run(_servir(host, puerto))
+    except KeyboardInterrupt:
+        pass
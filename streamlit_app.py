@@ -1,4 +1,11 @@
 # app.py
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 def mostrar_menu_principal():
     print("\n--- Generador de Contenido para Reels ---")
@@ -52,5 +59,247 @@ def main():
         else:
             print("Opción no válida. Por favor, intenta de nuevo.")
 
+# --- Modo por lotes (no interactivo) ---
+# Lee temas de un CSV/JSONL, genera script + copy/hooks + análisis con un pool de
+# trabajadores y escribe cada resultado en un JSONL en cuanto termina. Solo importa
+# los generadores, no la interfaz de Streamlit (app.py).
+
+def leer_temas(ruta):
+    """
+    Lee las peticiones de un archivo .csv (con cabecera) o .jsonl.
+    Campos: tema (obligatorio), objetivo, estilo, duracion, nicho.
+    """
+    from generadores import VALORES_POR_DEFECTO
+
+    with open(ruta, "r", encoding="utf-8-sig", newline="") as f:
+        if ruta.lower().endswith(".csv"):
+            filas = list(csv.DictReader(f))
+        else:
+            filas = [json.loads(linea) for linea in f if linea.strip()]
+
+    peticiones = []
+    for fila in filas:
+        tema = (fila.get("tema") or "").strip()
+        if not tema:
+            continue
+        peticion = {clave: fila.get(clave) or valor for clave, valor in VALORES_POR_DEFECTO.items()}
+        peticion["tema"] = tema
+        peticion["duracion"] = int(peticion["duracion"])
+        if fila.get("nicho"):
+            peticion["nicho"] = fila["nicho"]
+        peticiones.append(peticion)
+    return peticiones
+
+def clave_peticion(peticion):
+    """Identificador estable de una petición, usado para reanudar lotes interrumpidos."""
+    material = json.dumps(
+        [peticion["tema"], peticion["objetivo"], peticion["estilo"], peticion["duracion"]],
+        ensure_ascii=False
+    )
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+def etapas_completadas(resultado):
+    """
+    Marca de cada etapa del resultado ({etapa: bool}): True si terminó bien. Al
+    reanudar un lote solo se repiten las etapas marcadas como False.
+    """
+    from generadores import copy_hooks_valido, script_valido
+
+    analisis = resultado.get("analisis") or {}
+    return {
+        "script": script_valido(resultado.get("script")),
+        "copy_hooks": copy_hooks_valido(resultado.get("copy_hooks")),
+        "analisis": bool(analisis) and not analisis.get("error"),
+    }
+
+def resultados_previos(ruta_salida):
+    """Último resultado de cada petición en una ejecución anterior, por clave."""
+    previos = {}
+    if not os.path.exists(ruta_salida):
+        return previos
+    with open(ruta_salida, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                resultado = json.loads(linea)
+            except ValueError:
+                continue  # línea cortada por una interrupción
+            # Los resultados de versiones anteriores no traen las marcas por etapa.
+            resultado.setdefault("etapas_ok", etapas_completadas(resultado))
+            previos[resultado["clave"]] = resultado
+    return previos
+
+def procesar_peticion(peticion, una_llamada=False, variantes=1, previo=None):
+    """
+    Ejecuta el pipeline completo para una petición y devuelve el resultado serializable.
+    Con el resultado `previo` de una ejecución anterior, reutiliza sus etapas
+    completadas y solo ejecuta las que fallaron.
+    """
+    from generadores import generar_contenido_completo, generar_contenido_una_llamada
+
+    inicio = time.perf_counter()
+    resultado = {"clave": clave_peticion(peticion), **peticion, "tiempos": {}}
+    argumentos = (peticion["tema"], peticion["objetivo"], peticion["estilo"], peticion["duracion"])
+    previos = {etapa: previo[etapa] for etapa, ok in previo["etapas_ok"].items() if ok} if previo else {}
+    if previos:
+        resultado["reutilizadas"] = sorted(previos)
+        if "script" in previos and "variantes" in previo:
+            resultado["variantes"] = previo["variantes"]
+        etapas = generar_contenido_completo(*argumentos, variantes=variantes, previos=previos)
+    elif una_llamada:
+        etapas = generar_contenido_una_llamada(*argumentos)
+    else:
+        etapas = generar_contenido_completo(*argumentos, variantes=variantes)
+    for etapa in etapas:
+        if etapa.etapa == "variantes":
+            resultado["variantes"] = [variante._asdict() for variante in etapa.resultado]
+        else:
+            resultado[etapa.etapa] = etapa.resultado
+        resultado["tiempos"][etapa.etapa] = round(etapa.segundos, 3)
+    resultado["tiempos"]["total"] = round(time.perf_counter() - inicio, 3)
+    resultado["etapas_ok"] = etapas_completadas(resultado)
+    resultado["ok"] = all(resultado["etapas_ok"].values())
+    return resultado
+
+def ejecutar_lote(ruta_entrada, ruta_salida, workers=4, guardar_historial=False, una_llamada=False, variantes=1):
+    """
+    Procesa todas las peticiones pendientes del archivo de entrada con como máximo
+    `workers` peticiones en vuelo. Es reanudable: se saltan las ya completadas en
+    `ruta_salida` y, de las que fallaron, solo se repiten las etapas que fallaron.
+    """
+    from metricas import exportar_textfile, registrar_accion
+
+    peticiones = leer_temas(ruta_entrada)
+    previos = resultados_previos(ruta_salida)
+    pendientes = [p for p in peticiones if not previos.get(clave_peticion(p), {}).get("ok")]
+    print(f"{len(peticiones)} temas leídos, {len(peticiones) - len(pendientes)} ya completados, "
+          f"{len(pendientes)} pendientes.")
+    if not pendientes:
+        return
+
+    if guardar_historial:
+        from historial_manager import guardar_en_historial
+
+    inicio = time.perf_counter()
+    correctos = fallidos = 0
+    cola = iter(pendientes)
+    with ThreadPoolExecutor(max_workers=workers) as pool, open(ruta_salida, "a", encoding="utf-8") as salida:
+        en_vuelo = set()
+        while True:
+            # Concurrencia acotada: nunca hay más de `workers` peticiones lanzadas.
+            while len(en_vuelo) < workers:
+                peticion = next(cola, None)
+                if peticion is None:
+                    break
+                registrar_accion("lote")
+                en_vuelo.add(pool.submit(procesar_peticion, peticion, una_llamada, variantes,
+                                         previos.get(clave_peticion(peticion))))
+            if not en_vuelo:
+                break
+
+            terminados, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    fallidos += 1
+                    print(f"  ✗ Error inesperado: {e}")
+                    continue
+
+                salida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+                salida.flush()
+                if resultado["ok"]:
+                    correctos += 1
+                    if guardar_historial:
+                        guardar_en_historial(resultado["tema"], resultado["script"], resultado["copy_hooks"],
+                                             resultado.get("analisis"), resultado.get("nicho"))
+                    print(f"  ✓ {resultado['tema']} ({resultado['tiempos']['total']:.1f}s)")
+                else:
+                    fallidos += 1
+                    fallidas = ", ".join(etapa for etapa, ok in resultado["etapas_ok"].items() if not ok)
+                    print(f"  ✗ {resultado['tema']} (falló: {fallidas})")
+
+    minutos = (time.perf_counter() - inicio) / 60
+    print(f"\nLote terminado: {correctos} correctos, {fallidos} fallidos en {minutos * 60:.1f}s "
+          f"({correctos / minutos if minutos else 0:.1f} items/min).")
+    ruta_metricas = exportar_textfile()
+    if ruta_metricas:
+        print(f"Métricas escritas en {ruta_metricas}")
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Generador de Contenido para Reels")
+    subcomandos = parser.add_subparsers(dest="comando")
+
+    lote = subcomandos.add_parser("lote", help="Genera contenido para una lista de temas (CSV o JSONL).")
+    lote.add_argument("entrada", help="Archivo .csv o .jsonl con los temas.")
+    lote.add_argument("--salida", default="resultados_lote.jsonl", help="Archivo JSONL de resultados.")
+    lote.add_argument("--workers", type=int, default=4, help="Peticiones en paralelo.")
+    lote.add_argument("--historial", action="store_true", help="Guardar también cada resultado en el historial.")
+    lote.add_argument("--una-llamada", action="store_true",
+                      help="Pedir script, copy/hooks y análisis en una sola respuesta JSON.")
+    lote.add_argument("--variantes", type=int, default=1,
+                      help="Variantes del script por tema; se usa la mejor puntuada.")
+
+    exportar = subcomandos.add_parser("exportar", help="Exporta el historial a JSONL, CSV o Parquet.")
+    exportar.add_argument("salida", help="Archivo de destino (.jsonl, .csv o .parquet).")
+    exportar.add_argument("--formato", choices=["jsonl", "csv", "parquet"], help="Formato (por defecto, según la extensión).")
+
+    importar = subcomandos.add_parser("importar", help="Importa registros al historial desde JSONL, CSV, Parquet o JSON.")
+    importar.add_argument("entrada", help="Archivo a importar (.jsonl, .csv, .parquet o el .json antiguo).")
+    importar.add_argument("--formato", choices=["jsonl", "csv", "parquet", "json"],
+                          help="Formato (por defecto, según la extensión).")
+    importar.add_argument("--sin-deduplicar", action="store_true",
+                          help="Importar también los registros con el mismo tema y script que uno existente.")
+    importar.add_argument("--mapa-ids", help="CSV donde escribir la correspondencia id_original,id_nuevo.")
+
+    servidor = subcomandos.add_parser("servidor", help="Arranca la API HTTP (JSON/NDJSON) de los generadores.")
+    servidor.add_argument("--host", help="Interfaz de escucha (por defecto SERVIDOR_HOST o 127.0.0.1).")
+    servidor.add_argument("--puerto", type=int, help="Puerto (por defecto SERVIDOR_PUERTO u 8080).")
+
+    subcomandos.add_parser("arranque", help="Mide el tiempo de importación en frío de los módulos.")
+    return parser.parse_args(argv)
+
+def transferir_historial(argumentos):
+    """Ejecuta los subcomandos `exportar` e `importar` e imprime el informe."""
+    from historial_manager import exportar_historial, importar_historial
+
+    if argumentos.comando == "exportar":
+        informe = exportar_historial(argumentos.salida, argumentos.formato)
+        print(f"{informe['registros']} registros exportados a {argumentos.salida} en {informe['segundos']:.1f}s "
+              f"({informe['registros_por_segundo']:.0f} registros/s).")
+        return
+    informe = importar_historial(argumentos.entrada, argumentos.formato, not argumentos.sin_deduplicar,
+                                 argumentos.mapa_ids)
+    print(f"{informe['leidos']} leídos, {informe['importados']} importados, {informe['duplicados']} duplicados, "
+          f"{informe['invalidos']} inválidos en {informe['segundos']:.1f}s "
+          f"({informe['registros_por_segundo']:.0f} registros/s).")
+
+def mostrar_arranque():
+    from cliente_gemini import medir_arranque
+
+    print("\n--- Tiempo de importación en frío ---")
+    for resultado in medir_arranque():
+        if "error" in resultado:
+            print(f"{resultado['modulo']}: error {resultado['error']}")
+            continue
+        print(f"{resultado['modulo']}: {resultado['segundos'] * 1000:.1f} ms "
+              f"(SDK cargado: {'sí' if resultado['sdk_cargado'] else 'no'}, "
+              f"Streamlit cargado: {'sí' if resultado['streamlit_cargado'] else 'no'})")
+
 if __name__ == "__main__":
-    main()
+    argumentos = parsear_argumentos()
+    if argumentos.comando == "lote":
+        ejecutar_lote(argumentos.entrada, argumentos.salida, argumentos.workers, argumentos.historial,
+                      argumentos.una_llamada, argumentos.variantes)
+    elif argumentos.comando in ("exportar", "importar"):
+        transferir_historial(argumentos)
+    elif argumentos.comando == "servidor":
+        import logging
+        import servidor_api
+
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        servidor_api.servir(argumentos.host or servidor_api.SERVIDOR_HOST,
+                            argumentos.puerto or servidor_api.SERVIDOR_PUERTO)
+    elif argumentos.comando == "arranque":
+        mostrar_arranque()
+    else:
+        main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Las pruebas corren sin red: el modelo es el stub determinista de backends_llm
+# y la caché de respuestas no se usa, para que cada llamada llegue al backend.
+os.environ.setdefault("LLM_BACKEND", "local")
+os.environ.setdefault("CACHE_GEMINI_ACTIVA", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
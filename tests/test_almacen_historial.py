@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from almacen_historial import AlmacenHistorial, IndicePaginas, RegistrosEnMemoria
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenHistorial(str(tmp_path / "historial.jsonl"))
+
+def registro(i):
+    return {"tema": f"tema {i}", "script": f"script {i}", "copy_hooks": {"copy": "", "hooks": [], "titulo_shorts": ""}}
+
+def lineas_log(almacen):
+    with open(almacen.ruta_log, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f]
+
+def test_agregar_asigna_ids_consecutivos(almacen):
+    ids = [almacen.agregar(registro(i))["id"] for i in range(3)]
+    ids += [r["id"] for r in almacen.agregar_lote([registro(3), registro(4)])]
+    assert ids == [1, 2, 3, 4, 5]
+    assert [r["tema"] for r in almacen.cargar()] == [f"tema {i}" for i in range(5)]
+
+def test_borrar_deja_un_tombstone(almacen):
+    for i in range(3):
+        almacen.agregar(registro(i))
+    almacen.borrar([2])
+    assert [r["id"] for r in almacen.cargar()] == [1, 3]
+    assert lineas_log(almacen)[-1] == {"op": "del", "ids": [2]}
+
+def test_compactar_quita_tombstones_y_no_reutiliza_ids(almacen):
+    for i in range(5):
+        almacen.agregar(registro(i))
+    almacen.borrar([1, 4, 5])
+    almacen.compactar()
+    assert lineas_log(almacen) == [{"op": "add", "registro": r} for r in almacen.cargar()]
+    assert [r["id"] for r in almacen.cargar()] == [2, 3]
+    assert almacen.agregar(registro(5))["id"] == 6
+    assert almacen._leer_meta()["borrados"] == 0
+
+def test_leer_cambios_es_incremental_y_se_reinicia_al_compactar(almacen):
+    almacen.agregar(registro(0))
+    operaciones, cursor, reinicio = almacen.leer_cambios()
+    assert reinicio and len(operaciones) == 1
+
+    almacen.agregar(registro(1))
+    operaciones, cursor, reinicio = almacen.leer_cambios(cursor)
+    assert not reinicio and [op["registro"]["id"] for _, op in operaciones] == [2]
+
+    almacen.borrar([1])
+    almacen.compactar()
+    operaciones, cursor, reinicio = almacen.leer_cambios(cursor)
+    assert reinicio and [op["registro"]["id"] for _, op in operaciones] == [2]
+
+def test_leer_cambios_quita_la_marca_de_una_compactacion_caida(almacen):
+    almacen.agregar(registro(0))
+    almacen._escribir_meta({**almacen._leer_meta(), "compactando": True})
+    operaciones, _, _ = almacen.leer_cambios()
+    assert len(operaciones) == 1
+    assert "compactando" not in almacen._leer_meta()
+
+def test_leer_registros_por_posicion(almacen):
+    for i in range(3):
+        almacen.agregar(registro(i))
+    operaciones, _, _ = almacen.leer_cambios()
+    posiciones = [posicion for posicion, _ in operaciones]
+    assert [r["id"] for r in almacen.leer_registros(posiciones[1:])] == [2, 3]
+
+def test_la_vista_en_memoria_sigue_al_log(almacen):
+    vista = RegistrosEnMemoria(almacen)
+    for i in range(4):
+        almacen.agregar(registro(i))
+    almacen.borrar([2])
+    vista.sincronizar()
+    assert [r["id"] for r in vista.lista()] == [1, 3, 4]
+    almacen.compactar()
+    almacen.agregar(registro(4))
+    vista.sincronizar()
+    assert [r["id"] for r in vista.lista()] == [1, 3, 4, 5]
+
+def test_una_linea_truncada_se_ignora_y_se_repara(almacen):
+    almacen.agregar(registro(0))
+    with open(almacen.ruta_log, "ab") as f:
+        f.write(b'{"op": "add", "registro": {"id": 2, "te')
+    assert [r["id"] for r in almacen.cargar()] == [1]
+    almacen.agregar(registro(1))
+    assert [r["id"] for r in almacen.cargar()] == [1, 2]
+    assert len(lineas_log(almacen)) == 2
+
+def test_iterar_registros_omite_los_borrados(almacen):
+    almacen.agregar_lote([registro(i) for i in range(5)])
+    almacen.borrar([1, 3])
+    assert [r["id"] for r in almacen.iterar_registros()] == [2, 4, 5]
+
+def test_paginas_de_mas_reciente_a_mas_antiguo(almacen):
+    paginas = IndicePaginas(almacen)
+    almacen.agregar_lote([registro(i) for i in range(7)])
+    assert paginas.total() == 7
+    registros, total = paginas.pagina(1, 3)
+    assert [r["id"] for r in registros] == [7, 6, 5] and total == 7
+    assert [r["id"] for r in paginas.pagina(3, 3)[0]] == [1]
+    assert paginas.pagina(4, 3) == ([], 7)
+    assert [r["id"] for r in paginas.pagina(1, 3, mas_recientes_primero=False)[0]] == [1, 2, 3]
+
+def test_paginas_tras_borrar_y_compactar(almacen):
+    paginas = IndicePaginas(almacen)
+    almacen.agregar_lote([registro(i) for i in range(5)])
+    paginas.sincronizar()
+    almacen.borrar([4, 5])
+    assert [r["id"] for r in paginas.pagina(1, 2)[0]] == [3, 2]
+    almacen.compactar()
+    almacen.agregar(registro(5))
+    registros, total = paginas.pagina(1, 2)
+    assert [r["id"] for r in registros] == [6, 3] and total == 4
+    assert registros[1]["tema"] == "tema 2"
+
+def test_paginas_se_resincronizan_si_el_log_cambia_al_leer(almacen, monkeypatch):
+    paginas = IndicePaginas(almacen)
+    almacen.agregar_lote([registro(i) for i in range(3)])
+    leer = almacen.leer_registros
+    lecturas = []
+
+    def leer_con_un_cambio(posiciones):
+        # La primera lectura encuentra el log de otra generación (p. ej. tras una compactación).
+        lecturas.append(posiciones)
+        return None if len(lecturas) == 1 else leer(posiciones)
+
+    monkeypatch.setattr(almacen, "leer_registros", leer_con_un_cambio)
+    assert [r["id"] for r in paginas.pagina(1, 2)[0]] == [3, 2]
+    assert len(lecturas) == 2
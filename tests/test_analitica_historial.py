@@ -0,0 +1,92 @@
+import math
+
+import numpy as np
+import pytest
+
+from almacen_historial import AlmacenHistorial
+from analitica_historial import (DIMENSION_GANCHO, DIMENSIONES, SIN_FECHA, SIN_NICHO, AnaliticaHistorial,
+                                 HistogramasPorGrupo, puntuaciones_registro, semana_de)
+from analizador_scripts import ORIGEN_LOCAL
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenHistorial(str(tmp_path / "historial.jsonl"))
+
+def registro(gancho, nicho=None, fecha="2024-03-04 10:00:00", **extra):
+    return {"tema": "t", "script": "s", "copy_hooks": {}, "fecha": fecha, "nicho": nicho,
+            "puntuaciones": {DIMENSION_GANCHO: gancho, DIMENSIONES[0]: 50}, **extra}
+
+def por_grupo(resumen):
+    return {fila["grupo"]: fila for fila in resumen}
+
+def test_semana_iso():
+    assert semana_de("2024-01-01 09:00:00") == "2024-W01"
+    assert semana_de("2024-12-30") == "2025-W01"
+    assert semana_de(None) == SIN_FECHA and semana_de("ayer") == SIN_FECHA
+
+def test_puntuaciones_del_modelo_acotadas():
+    puntuaciones = puntuaciones_registro({"puntuaciones": {DIMENSION_GANCHO: 130, DIMENSIONES[0]: -5}})
+    assert puntuaciones[DIMENSIONES.index(DIMENSION_GANCHO)] == 100 and puntuaciones[0] == 0
+    assert puntuaciones.count(-1) == len(DIMENSIONES) - 2
+    locales = {"puntuaciones": {DIMENSION_GANCHO: 80}, "origen_puntuaciones": ORIGEN_LOCAL}
+    assert puntuaciones_registro(locales) == [-1] * len(DIMENSIONES)
+
+def test_estadisticas_de_los_histogramas():
+    histogramas = HistogramasPorGrupo()
+    codigo = histogramas.codigo("a")
+    vacio = histogramas.codigo("b")
+    for valor in (10, 20, 30, 40):
+        histogramas.actualizar(codigo, np.array([valor] + [-1] * (len(DIMENSIONES) - 1)), 1)
+    histogramas.actualizar(codigo, np.array([40] + [-1] * (len(DIMENSIONES) - 1)), -1)
+    totales, medias, percentiles = histogramas.estadisticas([codigo, vacio], percentiles=(50, 100))
+    assert totales[0, 0] == 3 and medias[0, 0] == 20
+    assert percentiles[50][0, 0] == 20 and percentiles[100][0, 0] == 30
+    assert math.isnan(medias[1, 0]) and math.isnan(percentiles[50][1, 0])
+
+def test_resumen_por_nicho_y_semana(almacen):
+    analitica = AnaliticaHistorial(almacen)
+    almacen.agregar(registro(60, "Mindset"))
+    almacen.agregar(registro(80, "Mindset", fecha="2024-03-12 10:00:00"))
+    almacen.agregar(registro(40))
+    almacen.agregar(registro(90, "Mindset", origen_puntuaciones=ORIGEN_LOCAL))
+    nichos = por_grupo(analitica.resumen("nicho"))
+    assert set(nichos) == {"Mindset", SIN_NICHO}
+    gancho = nichos["Mindset"]["dimensiones"][DIMENSION_GANCHO]
+    assert gancho["n"] == 2 and gancho["media"] == 70 and gancho["p50"] == 60 and gancho["p90"] == 80
+    assert nichos["Mindset"]["registros"] == 2
+    semanas = por_grupo(analitica.resumen("semana"))
+    assert semanas["2024-W10"]["dimensiones"][DIMENSION_GANCHO]["media"] == 50
+    assert ("Mindset", "2024-W11") in por_grupo(analitica.resumen("nicho_semana"))
+
+def test_altas_y_bajas_incrementales_coinciden_con_recalcular(almacen):
+    analitica = AnaliticaHistorial(almacen)
+    ids = [almacen.agregar(registro(10 * i, "Mascotas"))["id"] for i in range(1, 6)]
+    analitica.resumen()
+    almacen.borrar(ids[:2])
+    almacen.agregar(registro(95, "Mascotas"))
+    incremental = analitica.resumen()
+    analitica.recalcular()
+    assert analitica.resumen() == incremental
+    assert incremental[0]["dimensiones"][DIMENSION_GANCHO]["n"] == 4
+
+def test_se_reconstruye_tras_compactar(almacen):
+    analitica = AnaliticaHistorial(almacen)
+    primero = almacen.agregar(registro(20, "Formula 1"))
+    almacen.agregar(registro(60, "Formula 1"))
+    analitica.resumen()
+    almacen.borrar([primero["id"]])
+    almacen.compactar()
+    fila, = analitica.resumen()
+    assert fila["dimensiones"][DIMENSION_GANCHO] == {"n": 1, "media": 60.0, "p50": 60, "p90": 60}
+
+def test_tendencia_del_gancho(almacen):
+    analitica = AnaliticaHistorial(almacen)
+    assert analitica.tendencia_gancho() == {"semanas": [], "medias": [], "pendiente": None}
+    for semana, gancho in enumerate((50, 60, 70)):
+        almacen.agregar(registro(gancho, "Mindset", fecha=f"2024-03-{4 + 7 * semana:02d}"))
+    almacen.agregar(registro(10, "Mascotas", fecha="2024-03-04"))
+    almacen.agregar(registro(99, "Mindset", fecha=None))
+    tendencia = analitica.tendencia_gancho("Mindset")
+    assert tendencia["semanas"] == ["2024-W10", "2024-W11", "2024-W12"]
+    assert tendencia["medias"] == [50, 60, 70] and tendencia["pendiente"] == pytest.approx(10)
+    assert analitica.tendencia_gancho()["medias"][0] == 30
@@ -0,0 +1,59 @@
+import numpy as np
+
+from analizador_local import RASGOS, analizar_local, extraer_rasgos, puntuar_lote
+from analizador_scripts import ORIGEN_LOCAL, SECCIONES_CON_PUNTUACION, origen_analisis, parsear_analisis
+
+BUENO = (
+    "**Título:** Ahorra 100€ al mes\n\n"
+    "**Gancho:**\n¿Sabías que tiras 3 euros al día sin darte cuenta?\n\n"
+    "**Desarrollo del Contenido:**\n"
+    "Escena 1: Te enseño tu café diario 😮\n"
+    "Escena 2: Sumas lo que gastas en un mes.\n"
+    "Escena 3: Lo mueves a tu cuenta de ahorro. ¡Así de fácil!\n\n"
+    "**Llamada a la Acción:**\nGuarda este vídeo y comenta cuánto ahorras tú.\n\n"
+    "**Elementos Visuales/Sonido:**\n- Texto en pantalla\n"
+)
+FLOJO = "este video habla de ahorro y de cosas que pasan en la vida y es un video sobre el ahorro " * 6
+
+def rasgos(texto):
+    return dict(zip(RASGOS, extraer_rasgos(texto)))
+
+def test_rasgos_del_formato_de_script():
+    r = rasgos(BUENO)
+    assert r["gancho_pregunta"] and r["gancho_numero"] and not r["gancho_imperativo"]
+    assert r["escenas"] == 3 and r["cta_presente"] and r["cta_verbos"] == 2
+    assert r["visuales"] and r["emojis"] == 1 and r["exclamaciones"] == 2
+
+def test_rasgos_sin_cabeceras():
+    r = rasgos("Mira esto. Tres trucos para dormir mejor. Sígueme para más.")
+    assert r["gancho_imperativo"] and r["palabras_gancho"] == 2
+    assert r["cta_presente"] and r["escenas"] == 0 and not r["visuales"]
+
+def test_un_buen_script_puntua_mas_que_uno_flojo():
+    puntuaciones, segundos = puntuar_lote([BUENO, FLOJO, ""])
+    assert puntuaciones.shape == (3, len(SECCIONES_CON_PUNTUACION))
+    assert puntuaciones.dtype == np.int64 and ((puntuaciones >= 0) & (puntuaciones <= 100)).all()
+    assert puntuaciones[0].sum() > puntuaciones[1].sum()
+    assert (puntuaciones[2] == 0).all() and segundos[2] == 0
+
+def test_puntuar_en_bloque_coincide_con_uno_a_uno():
+    scripts = [BUENO, FLOJO, "Escena 1: hola."]
+    en_bloque, _ = puntuar_lote(scripts)
+    assert all((en_bloque[i] == puntuar_lote([s])[0][0]).all() for i, s in enumerate(scripts))
+
+def test_analisis_con_el_formato_del_modelo():
+    analisis = analizar_local(BUENO)
+    assert origen_analisis(analisis) == ORIGEN_LOCAL and analisis["error"] is None
+    assert parsear_analisis(analisis["texto"]) == analisis["secciones"]
+    puntuadas = [s["titulo"] for s in analisis["secciones"] if s["puntuacion"] is not None]
+    assert puntuadas == list(SECCIONES_CON_PUNTUACION)
+
+def test_sugerencias_de_longitud_segun_la_duracion():
+    largo = BUENO.replace("Escena 3:", "Escena 3: " + "palabra " * 120)
+    ritmo = {s["titulo"]: s["sugerencia"] for s in analizar_local(largo, duracion=15)["secciones"]}
+    assert ritmo["Longitud y Ritmo"].startswith("Recorta")
+    ritmo = {s["titulo"]: s["sugerencia"] for s in analizar_local(BUENO, duracion=90)["secciones"]}
+    assert ritmo["Longitud y Ritmo"] == "Hay margen para otra escena o un dato más."
+
+def test_script_vacio():
+    assert analizar_local("   ") == {"texto": "", "secciones": [], "error": None, "origen": ORIGEN_LOCAL}
@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from analizador_scripts import (ORDERED_SECTION_TITLES, ParserAnalisisIncremental, construir_prompt_analisis,
+                                obtener_analisis, obtener_analisis_stream, parsear_analisis, puntuaciones_analisis)
+from backends_llm import BackendLocal
+
+SCRIPT = (
+    "**Título:** Gatos: lo que nadie te cuenta\n\n"
+    "**Gancho:**\n¿Sabías que el 90% falla con su gato? Quédate hasta el final.\n\n"
+    "**Desarrollo del Contenido:**\nEscena 1: Un dato clave.\nEscena 2: Otro dato.\n\n"
+    "**Llamada a la Acción:**\nSíguenos y comenta.\n"
+)
+
+def texto_analisis(semilla=0):
+    return BackendLocal._analisis(random.Random(semilla))
+
+def alimentar_por_trozos(texto, tamano):
+    parser = ParserAnalisisIncremental()
+    secciones = []
+    for i in range(0, len(texto), tamano):
+        secciones.extend(parser.alimentar(texto[i:i + tamano]))
+    return secciones + parser.finalizar()
+
+@pytest.mark.parametrize("tamano", [1, 7, 40, 10_000])
+def test_parser_incremental_coincide_con_el_parseo_completo(tamano):
+    texto = texto_analisis()
+    assert alimentar_por_trozos(texto, tamano) == parsear_analisis(texto)
+
+def test_parser_incremental_no_emite_la_ultima_seccion_hasta_la_siguiente():
+    parser = ParserAnalisisIncremental()
+    assert parser.alimentar("1. Tono y Estilo: Cercano. Puntuación: 80% Sugerencia: Nada.\n") == []
+    emitidas = parser.alimentar("2. Gancho (Hook): Bueno. Puntuación: 70%\n")
+    assert [s["titulo"] for s in emitidas] == ["Tono y Estilo"]
+    assert [s["titulo"] for s in parser.finalizar()] == ["Gancho (Hook)"]
+    assert parser.finalizar() == []
+
+def test_parsear_analisis_extrae_puntuacion_y_sugerencia():
+    secciones = parsear_analisis(texto_analisis())
+    assert [s["titulo"] for s in secciones] == [t.split(". ", 1)[1] for t in ORDERED_SECTION_TITLES]
+    tono = secciones[0]
+    assert 0 <= tono["puntuacion"] <= 100
+    assert tono["sugerencia"] == "Añade una pregunta directa."
+    assert "Sugerencia:" not in tono["descripcion"]
+
+def test_obtener_analisis_con_el_backend_local():
+    analisis = obtener_analisis(SCRIPT)
+    assert analisis["error"] is None
+    assert len(analisis["secciones"]) == len(ORDERED_SECTION_TITLES)
+    assert set(puntuaciones_analisis(analisis)) >= {"Tono y Estilo", "Gancho (Hook)"}
+
+def test_analisis_en_streaming_coincide_con_el_completo():
+    eventos = list(obtener_analisis_stream(SCRIPT))
+    tipo, final = eventos[-1]
+    assert tipo == "fin" and final["error"] is None
+    assert [dato for tipo, dato in eventos[:-1]] == final["secciones"] == obtener_analisis(SCRIPT)["secciones"]
+
+def test_prompt_de_analisis_conserva_las_marcas_del_formato():
+    prompt = construir_prompt_analisis(SCRIPT)
+    assert 'Puntuación: [X%]' in prompt
+    assert "--- SCRIPT A ANALIZAR ---" in prompt and "Síguenos y comenta." in prompt
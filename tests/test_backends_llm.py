@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from backends_llm import BackendLocal, ErrorSimulado, _parsear_latencia
+from contenido_estructurado import ContenidoReel
+
+def test_las_respuestas_dependen_solo_del_prompt():
+    uno, otro = BackendLocal(semilla=1), BackendLocal(semilla=2)
+    prompt = "Tema: gatos\nGenera un script."
+    assert uno.generate_content(prompt).text == otro.generate_content(prompt).text
+    assert uno.generate_content("Tema: perros").text != uno.generate_content(prompt).text
+    assert uno.llamadas == 3
+
+def test_formato_segun_el_prompt():
+    cliente = BackendLocal()
+    script = cliente.generate_content("Tema: gatos").text
+    assert script.startswith("**Título:** gatos") and "**Llamada a la Acción:**" in script
+    copy_hooks = cliente.generate_content('Copy y hooks sobre el tema de "gatos". Título Shorts: ...').text
+    assert copy_hooks.startswith("Título Shorts:") and "Hooks:\n- " in copy_hooks
+    assert "Puntuación:" in cliente.generate_content("Analiza. Puntuación: [X%]").text
+
+def test_json_estructurado_valido():
+    texto = BackendLocal().generate_content("Tema: gatos", {"response_mime_type": "application/json"}).text
+    assert ContenidoReel.desde_json(texto).script.titulo.startswith("gatos")
+    assert json.loads(texto)["hooks"]
+
+def test_uso_de_tokens():
+    uso = BackendLocal().generate_content("x" * 400).usage_metadata
+    assert uso.prompt_token_count == 100
+    assert uso.total_token_count == uso.prompt_token_count + uso.candidates_token_count
+
+def test_streaming_en_fragmentos():
+    cliente = BackendLocal(tamano_fragmento=10)
+    completo = cliente.generate_content("Tema: gatos").text
+    fragmentos = [f.text for f in cliente.generate_content("Tema: gatos", stream=True)]
+    assert len(fragmentos) > 1 and all(len(f) <= 10 for f in fragmentos)
+    assert "".join(fragmentos) == completo
+
+def test_tasa_de_fallos():
+    with pytest.raises(ErrorSimulado):
+        BackendLocal(tasa_fallos=1.0).generate_content("Tema: gatos")
+    assert ErrorSimulado.code == 503
+
+def test_en_streaming_el_fallo_llega_a_mitad_de_respuesta():
+    recibidos = []
+    with pytest.raises(ErrorSimulado):
+        for fragmento in BackendLocal(tasa_fallos=1.0, tamano_fragmento=20).generate_content("Tema: gatos", stream=True):
+            recibidos.append(fragmento.text)
+    assert recibidos
+
+def test_plazo_menor_que_la_latencia():
+    with pytest.raises(TimeoutError):
+        BackendLocal(latencia="fija:0.2").generate_content("Tema: gatos", plazo=0.01)
+
+def test_especificaciones_de_latencia():
+    import random
+
+    rng = random.Random(0)
+    assert _parsear_latencia("fija:0.5")(rng) == 0.5
+    assert 0.2 <= _parsear_latencia("uniforme:0.2,0.3")(rng) <= 0.3
+    assert _parsear_latencia("lognormal:-0.5,0.6")(rng) > 0
+    with pytest.raises(ValueError):
+        _parsear_latencia("normal:1")
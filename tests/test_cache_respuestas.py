@@ -0,0 +1,100 @@
+import os
+import time
+
+import pytest
+
+import cache_respuestas
+from cache_respuestas import CacheRespuestas, clave_cache, respuesta_cacheada, respuesta_cacheada_stream
+
+def nueva_cache(directorio, **kwargs):
+    cache = CacheRespuestas(str(directorio), **kwargs)
+    cache.activa = True
+    return cache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Caché activa en un directorio temporal en lugar de la del módulo."""
+    cache = nueva_cache(tmp_path)
+    monkeypatch.setattr(cache_respuestas, "cache", cache)
+    return cache
+
+def contador():
+    llamadas = []
+
+    def generar():
+        llamadas.append(1)
+        return f"respuesta {len(llamadas)}"
+    return generar, llamadas
+
+def test_la_clave_depende_del_modelo_el_prompt_y_la_configuracion():
+    clave = clave_cache("m", "p", {"temperature": 0})
+    assert clave == clave_cache("m", "p", {"temperature": 0})
+    assert len({clave, clave_cache("otro", "p", {"temperature": 0}), clave_cache("m", "otro", {"temperature": 0}),
+                clave_cache("m", "p", {"temperature": 0.5})}) == 4
+
+def test_acierto_en_memoria_y_en_disco_tras_reiniciar(tmp_path):
+    cache = nueva_cache(tmp_path)
+    cache.guardar("clave", "valor")
+    assert cache.obtener("clave") == "valor"
+    reiniciada = nueva_cache(tmp_path)
+    assert reiniciada.obtener("clave") == "valor"
+    assert reiniciada.obtener("clave") == "valor"
+    assert reiniciada.obtener("otra") is None
+    resumen = reiniciada.resumen()
+    assert (resumen["aciertos_disco"], resumen["aciertos_memoria"], resumen["fallos"]) == (1, 1, 1)
+
+def test_un_acierto_en_disco_no_alarga_el_ttl(tmp_path):
+    ttl_horas = 0.4 / 3600
+    nueva_cache(tmp_path, ttl_horas=ttl_horas).guardar("clave", "valor")
+    time.sleep(0.25)
+    cache = nueva_cache(tmp_path, ttl_horas=ttl_horas)
+    assert cache.obtener("clave") == "valor"
+    time.sleep(0.25)
+    assert cache.obtener("clave") is None
+    assert not os.path.exists(cache._ruta("clave"))
+
+def test_desaloja_las_entradas_mas_antiguas_sin_recorrer_el_directorio(tmp_path, monkeypatch):
+    cache = nueva_cache(tmp_path, max_mb=2000 / 1024 / 1024)
+    listados = []
+    listdir = os.listdir
+    monkeypatch.setattr(cache_respuestas.os, "listdir", lambda ruta: listados.append(ruta) or listdir(ruta))
+    for i in range(20):
+        cache.guardar(f"clave{i:02d}", "x" * 200)
+    assert len(listados) == 1
+    en_disco = sorted(nombre for nombre in listdir(tmp_path) if nombre.endswith(".json"))
+    assert sum(os.path.getsize(tmp_path / nombre) for nombre in en_disco) <= 2000
+    assert en_disco[-1] == "clave19.json" and "clave00.json" not in en_disco
+    assert cache.resumen()["entradas_disco"] == len(en_disco)
+
+def test_solo_se_cachean_las_llamadas_deterministas(cache):
+    generar, llamadas = contador()
+    for _ in range(2):
+        respuesta_cacheada("m", "p", {"temperature": 0.7}, generar)
+        respuesta_cacheada("m", "p", None, generar)
+    assert len(llamadas) == 4
+    assert respuesta_cacheada("m", "p", {"temperature": 0}, generar) == "respuesta 5"
+    assert respuesta_cacheada("m", "p", {"temperature": 0}, generar) == "respuesta 5"
+    assert len(llamadas) == 5
+
+def test_streaming_cacheado(cache):
+    partes = ["uno ", "dos"]
+    assert list(respuesta_cacheada_stream("m", "p", {"temperature": 0}, lambda: iter(partes))) == partes
+    assert list(respuesta_cacheada_stream("m", "p", {"temperature": 0}, lambda: iter(["otro"]))) == ["uno dos"]
+    assert list(respuesta_cacheada_stream("m", "p", {"temperature": 1}, lambda: iter(["otro"]))) == ["otro"]
+
+def test_el_analisis_se_cachea_y_el_script_no(cache):
+    import cliente_gemini
+    from analizador_scripts import obtener_analisis
+    from backends_llm import BackendLocal
+    from generadores import generar_script
+
+    backend = BackendLocal()
+    cliente_gemini.configurar_backend(backend)
+    try:
+        script = generar_script("Gatos", "persuasivo", "enérgico", 30)
+        assert generar_script("Gatos", "persuasivo", "enérgico", 30) == script
+        assert backend.llamadas == 2
+        assert obtener_analisis(script) == obtener_analisis(script)
+        assert backend.llamadas == 3
+    finally:
+        cliente_gemini.configurar_backend(None)
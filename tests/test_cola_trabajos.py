@@ -0,0 +1,124 @@
+import json
+import threading
+import time
+
+import pytest
+
+import cola_trabajos
+from cola_trabajos import (CANCELADO, COMPLETADO, EN_CURSO, ERROR, INTERRUMPIDO, ColaTrabajos)
+
+@pytest.fixture
+def ejecutor(monkeypatch):
+    """Ejecutor de prueba: dos etapas; `soltar` deja terminar los trabajos, `fallar` los hace fallar."""
+    control = {"soltar": threading.Event(), "fallar": False}
+
+    def ejecutar(parametros, al_etapa, al_fragmento_script, cancelado):
+        al_etapa("script", f"script de {parametros['tema']}", 0.01)
+        control["soltar"].wait(5)
+        if control["fallar"]:
+            raise RuntimeError("fallo simulado")
+        al_etapa("analisis", {"error": None}, 0.01)
+
+    monkeypatch.setitem(cola_trabajos.EJECUTORES, "prueba", ejecutar)
+    return control
+
+def nueva_cola(directorio, **kwargs):
+    return ColaTrabajos(str(directorio), workers=1, latido=0.05, caducidad=0.3, **kwargs)
+
+def esperar_estado(cola, id_trabajo, estado, limite=5):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        trabajo = cola.obtener(id_trabajo)
+        if trabajo["estado"] == estado:
+            return trabajo
+        time.sleep(0.01)
+    raise AssertionError(f"El trabajo no llegó a {estado}: {cola.obtener(id_trabajo)}")
+
+def test_un_trabajo_completo_guarda_sus_etapas(tmp_path, ejecutor):
+    cola = nueva_cola(tmp_path)
+    ejecutor["soltar"].set()
+    id_trabajo = cola.enviar({"tema": "gatos"}, tipo="prueba")
+    trabajo = esperar_estado(cola, id_trabajo, COMPLETADO)
+    assert trabajo["resultados"]["script"] == "script de gatos"
+    assert set(trabajo["etapas"]) == {"script", "analisis", "total"}
+    with open(tmp_path / f"{id_trabajo}.json", encoding="utf-8") as f:
+        assert json.load(f)["estado"] == COMPLETADO
+
+def test_tipo_desconocido(tmp_path):
+    with pytest.raises(ValueError):
+        nueva_cola(tmp_path).enviar({}, tipo="otro")
+
+def test_cancelar_un_trabajo_pendiente(tmp_path, ejecutor):
+    cola = nueva_cola(tmp_path)
+    primero = cola.enviar({"tema": "uno"}, tipo="prueba")
+    segundo = cola.enviar({"tema": "dos"}, tipo="prueba")
+    assert cola.cancelar(segundo)
+    assert cola.obtener(segundo)["estado"] == CANCELADO
+    ejecutor["soltar"].set()
+    esperar_estado(cola, primero, COMPLETADO)
+    assert cola.obtener(segundo)["resultados"] == {}
+    assert not cola.cancelar(segundo)
+
+def test_reintentar_un_trabajo_fallido(tmp_path, ejecutor):
+    cola = nueva_cola(tmp_path)
+    ejecutor["fallar"] = True
+    ejecutor["soltar"].set()
+    id_trabajo = cola.enviar({"tema": "gatos"}, tipo="prueba")
+    assert esperar_estado(cola, id_trabajo, ERROR)["error"] == "fallo simulado"
+    ejecutor["fallar"] = False
+    assert cola.reintentar(id_trabajo)
+    trabajo = esperar_estado(cola, id_trabajo, COMPLETADO)
+    assert trabajo["intentos"] == 2
+    assert not cola.reintentar(id_trabajo)
+
+def test_otra_replica_ve_los_trabajos_creados_despues_de_arrancar(tmp_path, ejecutor):
+    replica_a, replica_b = nueva_cola(tmp_path), nueva_cola(tmp_path)
+    id_trabajo = replica_a.enviar({"tema": "gatos"}, tipo="prueba")
+    esperar_estado(replica_a, id_trabajo, EN_CURSO)
+
+    assert replica_b.obtener(id_trabajo)["estado"] == EN_CURSO
+    assert [t["id"] for t in replica_b.listar()] == [id_trabajo]
+    # Solo el propietario puede cancelarlo; el latido lo mantiene vivo.
+    assert not replica_b.cancelar(id_trabajo)
+    time.sleep(0.4)
+    assert replica_b.obtener(id_trabajo)["estado"] == EN_CURSO
+
+    ejecutor["soltar"].set()
+    esperar_estado(replica_a, id_trabajo, COMPLETADO)
+    assert esperar_estado(replica_b, id_trabajo, COMPLETADO)["resultados"]["analisis"] == {"error": None}
+
+def test_listar_olvida_los_trabajos_borrados_por_otra_replica(tmp_path, ejecutor):
+    replica_a, replica_b = nueva_cola(tmp_path), nueva_cola(tmp_path)
+    ejecutor["soltar"].set()
+    id_trabajo = replica_a.enviar({"tema": "gatos"}, tipo="prueba")
+    esperar_estado(replica_a, id_trabajo, COMPLETADO)
+    assert [t["id"] for t in replica_b.listar()] == [id_trabajo]
+    (tmp_path / f"{id_trabajo}.json").unlink()
+    assert replica_b.listar() == []
+
+def trabajo_ajeno(directorio, propietario, latido):
+    trabajo = {"id": "0123456789ab", "tipo": "prueba", "parametros": {"tema": "gatos"}, "estado": EN_CURSO,
+               "etapas": {}, "resultados": {}, "error": None, "intentos": 1, "creado": time.time(),
+               "actualizado": time.time(), "propietario": propietario, "latido": latido}
+    (directorio / f"{trabajo['id']}.json").write_text(json.dumps(trabajo), encoding="utf-8")
+    return trabajo["id"]
+
+def test_trabajo_de_un_proceso_muerto_se_interrumpe(tmp_path, ejecutor):
+    cola = nueva_cola(tmp_path)
+    muerto = {"host": cola.propietario["host"], "pid": 2 ** 22 + 1, "instancia": "otra"}
+    id_trabajo = trabajo_ajeno(tmp_path, muerto, time.time())
+    assert cola.obtener(id_trabajo)["estado"] == INTERRUMPIDO
+    ejecutor["soltar"].set()
+    assert cola.reintentar(id_trabajo)
+    assert esperar_estado(cola, id_trabajo, COMPLETADO)["propietario"] == cola.propietario
+
+def test_trabajo_de_otro_host_sin_latido_se_interrumpe(tmp_path):
+    cola = nueva_cola(tmp_path)
+    otro_host = {"host": "otra-maquina", "pid": 1, "instancia": "otra"}
+    assert cola.obtener(trabajo_ajeno(tmp_path, otro_host, time.time()))["estado"] == EN_CURSO
+    assert cola.obtener(trabajo_ajeno(tmp_path, otro_host, time.time() - 10))["estado"] == INTERRUMPIDO
+
+def test_ids_no_validos(tmp_path):
+    cola = nueva_cola(tmp_path)
+    assert cola.obtener("../secreto") is None
+    assert cola.obtener(None) is None
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from analizador_scripts import parsear_analisis
+from backends_llm import BackendLocal
+from contenido_estructurado import (CONFIG_ESTRUCTURADA, DIMENSIONES_ANALISIS, ContenidoReel,
+                                    RespuestaEstructuradaInvalida, construir_prompt_estructurado)
+from generadores import copy_hooks_valido, script_valido
+
+def respuesta_valida():
+    prompt = construir_prompt_estructurado("Gatos", "persuasivo", "enérgico", 30)
+    return json.loads(BackendLocal().generate_content(prompt, CONFIG_ESTRUCTURADA).text)
+
+def test_convierte_a_los_formatos_del_pipeline():
+    contenido = ContenidoReel.desde_json(json.dumps(respuesta_valida()))
+    script = contenido.script.como_texto()
+    assert script_valido(script) and script.startswith("**Título:** Gatos")
+    assert "Escena 1: " in script and "**Elementos Visuales/Sonido:**\n- " in script
+    assert copy_hooks_valido(contenido.copy_hooks()) and len(contenido.copy_hooks()["hooks"]) == 3
+    analisis = contenido.resultado_analisis()
+    assert [s["titulo"] for s in analisis["secciones"]] == DIMENSIONES_ANALISIS
+    assert analisis["error"] is None
+
+def test_el_texto_del_analisis_se_parsea_igual():
+    contenido = ContenidoReel.desde_json(json.dumps(respuesta_valida()))
+    assert parsear_analisis(contenido.texto_analisis()) == contenido.resultado_analisis()["secciones"]
+
+def test_puntuaciones_acotadas_y_dimensiones_en_orden():
+    datos = respuesta_valida()
+    datos["analisis"].reverse()
+    con_puntuacion = next(e for e in datos["analisis"] if e["puntuacion"] is not None)
+    con_puntuacion["puntuacion"] = 140
+    sin_puntuacion = next(e for e in datos["analisis"] if e["puntuacion"] is None)
+    sin_puntuacion["puntuacion"] = 50
+    analisis = ContenidoReel.desde_json(json.dumps(datos)).analisis
+    assert [p.dimension for p in analisis] == DIMENSIONES_ANALISIS
+    por_dimension = {p.dimension: p.puntuacion for p in analisis}
+    assert por_dimension[con_puntuacion["dimension"]] == 100
+    assert por_dimension[sin_puntuacion["dimension"]] is None
+
+def _sin(clave):
+    def modificar(datos):
+        del datos[clave]
+    return modificar
+
+@pytest.mark.parametrize("modificar", [
+    _sin("copy"),
+    _sin("analisis"),
+    lambda d: d.update(hooks=["  "]),
+    lambda d: d.update(script="texto"),
+    lambda d: d["script"].update(escenas=[]),
+    lambda d: d["analisis"].pop(),
+    lambda d: d["analisis"][0].update(dimension="Otra"),
+    lambda d: next(e for e in d["analisis"] if e["puntuacion"] is not None).update(puntuacion=True),
+])
+def test_respuestas_invalidas(modificar):
+    datos = respuesta_valida()
+    modificar(datos)
+    with pytest.raises(RespuestaEstructuradaInvalida):
+        ContenidoReel.desde_json(json.dumps(datos))
+
+@pytest.mark.parametrize("texto", ["", "no es json", "[1, 2]", None])
+def test_json_no_valido(texto):
+    with pytest.raises(RespuestaEstructuradaInvalida):
+        ContenidoReel.desde_json(texto)
@@ -0,0 +1,125 @@
+import csv
+import json
+
+import pytest
+
+import formatos_historial
+from formatos_historial import RegistroInvalido, escribir_registros, leer_registros, validar_registro
+
+REGISTROS = [
+    {"id": 1, "fecha": "2024-01-01 10:00:00", "tema": "Gatos", "script": "Línea 1\nLínea 2, con \"comillas\"",
+     "copy_hooks": {"copy": "🚀 copy", "hooks": ["¿Sabías?", "Hook 2"], "titulo_shorts": "Título #gatos"},
+     "puntuaciones": {"Gancho (Hook)": 80}, "nicho": "Mascotas"},
+    {"id": 2, "fecha": "2024-01-02 11:00:00", "tema": "Perros", "script": "Otro script",
+     "copy_hooks": {"copy": "", "hooks": [], "titulo_shorts": ""}},
+]
+
+def formatos_disponibles():
+    formatos = ["jsonl", "csv"]
+    try:
+        import pyarrow  # noqa: F401
+        formatos.append("parquet")
+    except ImportError:
+        pass
+    return formatos
+
+@pytest.mark.parametrize("formato", formatos_disponibles())
+def test_exportar_e_importar_conserva_los_registros(tmp_path, formato):
+    ruta = str(tmp_path / f"historial.{formato}")
+    assert escribir_registros(iter(REGISTROS), ruta) == len(REGISTROS)
+    assert list(leer_registros(ruta)) == REGISTROS
+
+def test_escribir_no_deja_temporales(tmp_path):
+    escribir_registros(REGISTROS, str(tmp_path / "h.jsonl"))
+    assert [p.name for p in tmp_path.iterdir()] == ["h.jsonl"]
+
+def test_formato_desconocido(tmp_path):
+    with pytest.raises(ValueError):
+        escribir_registros(REGISTROS, str(tmp_path / "h.xml"))
+
+@pytest.mark.parametrize("tamano_bloque", [7, 64, 1024 * 1024])
+def test_json_antiguo_por_bloques(tmp_path, monkeypatch, tamano_bloque):
+    monkeypatch.setattr(formatos_historial, "TAMANO_BLOQUE_JSON", tamano_bloque)
+    ruta = tmp_path / "historial_contenido.json"
+    ruta.write_text(json.dumps(REGISTROS, indent=2, ensure_ascii=False), encoding="utf-8")
+    assert list(leer_registros(str(ruta))) == REGISTROS
+
+def test_json_antiguo_truncado(tmp_path, monkeypatch):
+    monkeypatch.setattr(formatos_historial, "TAMANO_BLOQUE_JSON", 16)
+    ruta = tmp_path / "historial_contenido.json"
+    texto = json.dumps(REGISTROS, ensure_ascii=False)
+    ruta.write_text(texto[:-20], encoding="utf-8")
+    leidos = list(leer_registros(str(ruta)))
+    assert leidos[0] == REGISTROS[0]
+    assert isinstance(leidos[-1], RegistroInvalido)
+
+def test_json_que_no_es_una_lista(tmp_path):
+    ruta = tmp_path / "historial_contenido.json"
+    ruta.write_text('{"tema": "x"}', encoding="utf-8")
+    assert isinstance(next(leer_registros(str(ruta))), RegistroInvalido)
+
+def test_lineas_jsonl_dañadas_se_devuelven_como_invalidas(tmp_path):
+    ruta = tmp_path / "h.jsonl"
+    ruta.write_text(json.dumps(REGISTROS[0], ensure_ascii=False) + "\n{roto\n", encoding="utf-8")
+    leidos = list(leer_registros(str(ruta)))
+    assert leidos[0] == REGISTROS[0] and isinstance(leidos[1], RegistroInvalido)
+
+def test_validar_registro():
+    with pytest.raises(RegistroInvalido):
+        validar_registro({"tema": "x"})
+    with pytest.raises(RegistroInvalido):
+        validar_registro({"tema": "x", "script": "y", "copy_hooks": {"hooks": "no es lista"}})
+    normalizado = validar_registro({"tema": "x", "script": "y", "copy_hooks": {"hooks": [1]}, "extra": True})
+    assert normalizado["copy_hooks"] == {"copy": "", "hooks": ["1"], "titulo_shorts": ""}
+    assert normalizado["extra"] is True
+
+# --- Importación al historial ---
+@pytest.fixture
+def historial(tmp_path, monkeypatch):
+    """historial_manager sobre un historial vacío en un directorio temporal."""
+    monkeypatch.chdir(tmp_path)
+    import historial_manager
+    historial_manager.almacen.limpiar()
+    yield historial_manager
+    historial_manager.almacen.limpiar()
+
+def test_importar_y_exportar_ida_y_vuelta(historial, tmp_path):
+    origen = str(tmp_path / "origen.jsonl")
+    escribir_registros(REGISTROS, origen)
+    informe = historial.importar_historial(origen, ruta_mapa_ids=str(tmp_path / "mapa.csv"))
+    assert (informe["leidos"], informe["importados"], informe["duplicados"], informe["invalidos"]) == (2, 2, 0, 0)
+
+    destino = str(tmp_path / "destino.jsonl")
+    assert historial.exportar_historial(destino)["registros"] == 2
+    exportados = list(leer_registros(destino))
+    sin_id = [{k: v for k, v in r.items() if k != "id"} for r in exportados]
+    assert sin_id == [{k: v for k, v in r.items() if k != "id"} for r in REGISTROS]
+
+    with open(tmp_path / "mapa.csv", newline="", encoding="utf-8") as f:
+        mapa = list(csv.DictReader(f))
+    assert [fila["id_original"] for fila in mapa] == ["1", "2"]
+    assert [int(fila["id_nuevo"]) for fila in mapa] == [r["id"] for r in exportados]
+
+def test_importar_salta_duplicados_e_invalidos(historial, tmp_path):
+    origen = tmp_path / "origen.jsonl"
+    duplicado = {**REGISTROS[0], "id": 9, "tema": "  gatos "}
+    origen.write_text("\n".join(json.dumps(r, ensure_ascii=False) for r in REGISTROS + [duplicado])
+                      + "\n{roto\n", encoding="utf-8")
+    informe = historial.importar_historial(str(origen))
+    assert (informe["importados"], informe["duplicados"], informe["invalidos"]) == (2, 1, 1)
+
+    informe = historial.importar_historial(str(origen))
+    assert (informe["importados"], informe["duplicados"]) == (0, 3)
+    assert len(historial.cargar_historial()) == 2
+
+def test_huellas_en_disco():
+    from historial_manager import HuellasEnDisco
+
+    huellas = HuellasEnDisco([1, -(2 ** 63), 2 ** 63 - 1])
+    try:
+        assert not huellas.agregar(1)
+        assert not huellas.agregar(-(2 ** 63))
+        assert huellas.agregar(2)
+        assert not huellas.agregar(2)
+    finally:
+        huellas.cerrar()
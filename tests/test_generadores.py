@@ -0,0 +1,134 @@
+import threading
+
+import pytest
+
+import cliente_gemini
+import generadores
+import peticiones_gemini as pg
+from backends_llm import BackendLocal
+from generadores import ScriptInterrumpido, generar_contenido_completo, generar_script_stream, script_valido
+
+ARGUMENTOS = ("Gatos", "persuasivo", "enérgico", 30)
+
+@pytest.fixture(autouse=True)
+def gemini(monkeypatch):
+    """Circuito, limitadores y reintentos propios de cada prueba; el backend se restaura al terminar."""
+    monkeypatch.setattr(pg, "circuito", pg.CircuitBreaker(100, 0.2))
+    monkeypatch.setattr(pg, "limitador_peticiones", pg.TokenBucket(1000, 1000))
+    monkeypatch.setattr(pg, "GEMINI_BACKOFF_BASE", 0.001)
+    yield
+    cliente_gemini.configurar_backend(None)
+
+def usar_backend(**kwargs):
+    backend = BackendLocal(**kwargs)
+    cliente_gemini.configurar_backend(backend)
+    return backend
+
+def test_script_en_streaming():
+    usar_backend(tamano_fragmento=20)
+    fragmentos = list(generar_script_stream(*ARGUMENTOS))
+    assert len(fragmentos) > 1
+    assert script_valido("".join(fragmentos))
+
+def test_un_streaming_cortado_no_devuelve_el_script_a_medias():
+    usar_backend(tasa_fallos=1.0, tamano_fragmento=20)
+    recibidos = []
+    with pytest.raises(ScriptInterrumpido) as error:
+        for fragmento in generar_script_stream(*ARGUMENTOS):
+            recibidos.append(fragmento)
+    assert recibidos
+    assert not script_valido(str(error.value))
+
+def test_el_pipeline_descarta_el_script_parcial():
+    backend = usar_backend(tasa_fallos=1.0, tamano_fragmento=20)
+    parciales = []
+    resultados = {etapa.etapa: etapa.resultado
+                  for etapa in generar_contenido_completo(*ARGUMENTOS, al_fragmento_script=parciales.append)}
+    assert parciales
+    assert not script_valido(resultados["script"])
+    assert resultados["script"].startswith("Error inesperado al generar script:")
+    assert parciales[-1] not in resultados["script"]
+    # Sin script no se piden copy/hooks ni análisis.
+    assert backend.llamadas == 1
+    assert not generadores.copy_hooks_valido(resultados["copy_hooks"])
+    assert resultados["analisis"]["error"]
+
+# --- Pipeline ---
+def test_grafo_lanza_en_paralelo_las_etapas_independientes():
+    # Si las dos etapas no corrieran a la vez, la barrera vencería su plazo.
+    barrera = threading.Barrier(2, timeout=5)
+
+    def multiplicar(factor):
+        def etapa(resultados):
+            barrera.wait()
+            return resultados["base"] * factor
+        return etapa
+
+    etapas = {"base": ([], lambda _: 2), "doble": (["base"], multiplicar(2)), "triple": (["base"], multiplicar(3))}
+    resultados = list(generadores.ejecutar_grafo(etapas))
+    assert resultados[0].etapa == "base"
+    assert {r.etapa: r.resultado for r in resultados} == {"base": 2, "doble": 4, "triple": 6}
+
+def test_grafo_con_dependencias_imposibles():
+    with pytest.raises(ValueError):
+        list(generadores.ejecutar_grafo({"a": (["b"], lambda r: 1)}))
+
+def test_pipeline_completo_en_streaming():
+    backend = usar_backend(tamano_fragmento=20)
+    parciales = []
+    etapas = list(generar_contenido_completo(*ARGUMENTOS, al_fragmento_script=parciales.append))
+    assert etapas[0].etapa == "script"
+    resultados = {etapa.etapa: etapa.resultado for etapa in etapas}
+    assert set(resultados) == {"script", "copy_hooks", "analisis"}
+    assert parciales[-1] == resultados["script"] and len(parciales) > 1
+    assert generadores.copy_hooks_valido(resultados["copy_hooks"])
+    assert resultados["analisis"]["secciones"] and not resultados["analisis"]["error"]
+    assert backend.llamadas == 3
+
+def test_pipeline_en_una_llamada():
+    backend = usar_backend()
+    resultados = {etapa.etapa: etapa.resultado for etapa in generadores.generar_contenido_una_llamada(*ARGUMENTOS)}
+    assert script_valido(resultados["script"]) and generadores.copy_hooks_valido(resultados["copy_hooks"])
+    assert resultados["analisis"]["secciones"]
+    assert backend.llamadas == 1
+
+# --- Variantes ---
+class BackendQueCorta(BackendLocal):
+    """Backend local que corta a mitad el streaming de los prompts que contienen `enfoque`."""
+
+    def __init__(self, enfoque, **kwargs):
+        super().__init__(**kwargs)
+        self.enfoque = enfoque
+        self._cortado = BackendLocal(tasa_fallos=1.0, **kwargs)
+
+    def generate_content(self, prompt, *args, **kwargs):
+        if self.enfoque in prompt:
+            return self._cortado.generate_content(prompt, *args, **kwargs)
+        return super().generate_content(prompt, *args, **kwargs)
+
+def test_variantes_ordenadas_de_mejor_a_peor():
+    usar_backend()
+    variantes = generadores.generar_variantes_script(*ARGUMENTOS, n=3, suficientes=3)
+    assert {v.enfoque for v in variantes} == set(generadores.ENFOQUES_VARIANTE[:3])
+    assert [v.puntuacion for v in variantes] == sorted((v.puntuacion for v in variantes), reverse=True)
+    assert all(script_valido(v.texto) for v in variantes)
+
+def test_una_variante_cortada_queda_fuera_del_ranking():
+    cortado = generadores.ENFOQUES_VARIANTE[0]
+    cliente_gemini.configurar_backend(BackendQueCorta(cortado, tamano_fragmento=20))
+    variantes = generadores.generar_variantes_script(*ARGUMENTOS, n=3, suficientes=3)
+    assert len(variantes) == 2
+    assert cortado not in {v.enfoque for v in variantes}
+    assert not any("Error" in v.texto for v in variantes)
+
+def test_el_pipeline_usa_la_mejor_variante():
+    usar_backend()
+    resultados = {etapa.etapa: etapa.resultado for etapa in generar_contenido_completo(*ARGUMENTOS, variantes=2)}
+    assert resultados["script"] == resultados["variantes"][0].texto
+    assert generadores.copy_hooks_valido(resultados["copy_hooks"])
+
+def test_sin_variantes_validas_no_hay_script():
+    usar_backend(tasa_fallos=1.0, tamano_fragmento=20)
+    resultados = {etapa.etapa: etapa.resultado for etapa in generar_contenido_completo(*ARGUMENTOS, variantes=3)}
+    assert resultados["variantes"] == []
+    assert not script_valido(resultados["script"])
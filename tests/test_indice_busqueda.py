@@ -0,0 +1,63 @@
+import pytest
+
+from almacen_historial import AlmacenHistorial
+from indice_busqueda import IndiceInvertido, normalizar, tokenizar
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenHistorial(str(tmp_path / "historial.jsonl"))
+
+def registro(tema, script="", copy="", hooks=(), titulo_shorts=""):
+    return {"tema": tema, "script": script,
+            "copy_hooks": {"copy": copy, "hooks": list(hooks), "titulo_shorts": titulo_shorts}}
+
+def test_normalizar_quita_tildes():
+    assert normalizar("Fórmula NIÑO") == "formula nino"
+    assert normalizar("ascii") == "ascii"
+
+def test_tokenizar_quita_stopwords_e_indexa_hashtags_dos_veces():
+    assert tokenizar("Los secretos de la #Fórmula1") == ["secretos", "#formula1", "formula1"]
+    assert tokenizar("#") == [] and tokenizar(None) == []
+
+def test_busca_todos_los_terminos_sin_tildes(almacen):
+    indice = IndiceInvertido(almacen)
+    almacen.agregar(registro("Fórmula 1 para principiantes"))
+    almacen.agregar(registro("Recetas de cocina", script="Receta rápida para principiantes"))
+    assert [r["tema"] for r in indice.buscar("formula PRINCIPIANTES")] == ["Fórmula 1 para principiantes"]
+    assert len(indice.buscar("principiantes")) == 2
+    assert indice.buscar("formula cocina") == []
+    assert indice.buscar("de la") == []
+
+def test_el_tema_pesa_mas_que_el_script_y_a_igualdad_gana_el_reciente(almacen):
+    indice = IndiceInvertido(almacen)
+    almacen.agregar(registro("Viajes", script="Consejos de ahorro"))
+    almacen.agregar(registro("Ahorro en casa"))
+    almacen.agregar(registro("Ahorro en viajes"))
+    temas = [r["tema"] for r in indice.buscar("ahorro")]
+    assert temas == ["Ahorro en viajes", "Ahorro en casa", "Viajes"]
+    assert len(indice.buscar("ahorro", limite=1)) == 1
+
+def test_copy_hooks_y_titulo_se_indexan(almacen):
+    indice = IndiceInvertido(almacen)
+    almacen.agregar(registro("Gatos", copy="Tips #Mascotas", hooks=["¿Sabías esto?"], titulo_shorts="Gatos felices"))
+    assert indice.buscar("#mascotas") and indice.buscar("sabias") and indice.buscar("felices")
+
+def test_los_borrados_salen_del_indice(almacen):
+    indice = IndiceInvertido(almacen)
+    primero = almacen.agregar(registro("Marketing digital"))
+    almacen.agregar(registro("Marketing de afiliados"))
+    assert len(indice.buscar("marketing")) == 2
+    almacen.borrar([primero["id"]])
+    assert [r["tema"] for r in indice.buscar("marketing")] == ["Marketing de afiliados"]
+    assert indice.buscar("digital") == [] and "digital" not in indice.postings
+
+def test_sigue_los_cambios_de_otra_instancia_y_la_compactacion(almacen):
+    indice = IndiceInvertido(almacen)
+    assert indice.buscar("mindset") == []
+    otro = AlmacenHistorial(almacen.ruta_log)
+    borrado = otro.agregar(registro("Mindset de crecimiento"))
+    otro.agregar(registro("Mindset ganador"))
+    assert len(indice.buscar("mindset")) == 2
+    otro.borrar([borrado["id"]])
+    otro.compactar()
+    assert [r["tema"] for r in indice.buscar("mindset")] == ["Mindset ganador"]
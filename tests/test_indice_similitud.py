@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+import indice_similitud as isim
+from almacen_historial import AlmacenHistorial
+from indice_similitud import IndiceSimilitud, firmas_minhash, firmas_registro
+
+@pytest.fixture
+def almacen(tmp_path):
+    return AlmacenHistorial(str(tmp_path / "historial.jsonl"))
+
+def registro(tema, script=""):
+    return {"tema": tema, "script": script, "copy_hooks": {"copy": "", "hooks": [], "titulo_shorts": ""}}
+
+def test_firmas_deterministas_e_independientes_del_orden():
+    a, b = firmas_minhash([np.array([1, 2, 3], dtype=np.uint64), np.array([3, 2, 1, 1], dtype=np.uint64)])
+    assert (a == b).all()
+    vacia, = firmas_minhash([np.array([], dtype=np.uint64)])
+    assert (vacia == isim.VACIO).all()
+    assert (firmas_registro("marketing de afiliados", "")[0] == firmas_registro("Marketing de afiliados", "")[0]).all()
+
+def test_los_bloques_no_cambian_las_firmas(monkeypatch):
+    conjuntos = [np.arange(i, i + 50, dtype=np.uint64) for i in range(20)]
+    completas = firmas_minhash(conjuntos)
+    monkeypatch.setattr(isim, "_BLOQUE_CARACTERISTICAS", 120)
+    assert (firmas_minhash(conjuntos) == completas).all()
+
+def test_similares_ordena_y_filtra(almacen):
+    indice = IndiceSimilitud(almacen)
+    almacen.agregar(registro("marketing de afiliados para principiantes"))
+    almacen.agregar(registro("recetas veganas rápidas"))
+    almacen.agregar(registro("marketing de afiliado en instagram"))
+    resultado = indice.similares("marketing de afiliados", k=5)
+    assert [r["tema"] for r, _ in resultado][:1] == ["marketing de afiliados para principiantes"]
+    assert "recetas veganas rápidas" not in [r["tema"] for r, _ in resultado]
+    similitudes = [s for _, s in resultado]
+    assert similitudes == sorted(similitudes, reverse=True) and all(s >= 0.3 for s in similitudes)
+    assert len(indice.similares("marketing de afiliados", k=1)) == 1
+    assert indice.similares("???") == []
+
+def test_el_script_desempata(almacen):
+    indice = IndiceSimilitud(almacen)
+    almacen.agregar(registro("gatos", "el gato duerme en el sofá todo el día"))
+    almacen.agregar(registro("gatos", "receta de pan casero con masa madre"))
+    (mejor, _), _ = indice.similares("gatos", "el gato duerme en el sofá", k=2)
+    assert mejor["script"].startswith("el gato duerme")
+
+def test_borrar_y_compactar(almacen, monkeypatch):
+    indice = IndiceSimilitud(almacen)
+    ids = [r["id"] for r in almacen.agregar_lote([registro(f"viajes baratos {i}") for i in range(10)])]
+    assert len(indice.similares("viajes baratos", k=20)) == 10
+    almacen.borrar(ids[:6])
+    restantes = indice.similares("viajes baratos", k=20)
+    assert sorted(r["id"] for r, _ in restantes) == ids[6:]
+    indice._compactar()
+    assert indice._n == 4 and indice._muertas == 0
+    assert sorted(r["id"] for r, _ in indice.similares("viajes baratos", k=20)) == ids[6:]
+
+def test_crece_por_duplicacion(almacen):
+    indice = IndiceSimilitud(almacen)
+    indice._reservar(2)
+    almacen.agregar_lote([registro(f"fitness en casa {i}") for i in range(5)])
+    assert len(indice.similares("fitness en casa", k=10)) == 5
+    assert len(indice._vivas) >= 5
+
+def test_ve_los_cambios_de_otra_instancia(almacen):
+    indice = IndiceSimilitud(almacen)
+    assert indice.similares("finanzas personales") == []
+    AlmacenHistorial(almacen.ruta_log).agregar(registro("finanzas personales para jóvenes"))
+    assert [r["tema"] for r, _ in indice.similares("finanzas personales")] == ["finanzas personales para jóvenes"]
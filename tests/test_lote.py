@@ -0,0 +1,90 @@
+import json
+
+import pytest
+
+import cliente_gemini
+import peticiones_gemini as pg
+import streamlit_app as lote
+from backends_llm import BackendLocal
+
+@pytest.fixture(autouse=True)
+def gemini(monkeypatch):
+    monkeypatch.setattr(pg, "circuito", pg.CircuitBreaker(100, 0.2))
+    monkeypatch.setattr(pg, "limitador_peticiones", pg.TokenBucket(1000, 1000))
+    monkeypatch.setattr(pg, "GEMINI_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(pg, "GEMINI_REINTENTOS", 1)
+    yield
+    cliente_gemini.configurar_backend(None)
+
+@pytest.fixture
+def backend():
+    backend = BackendLocal()
+    cliente_gemini.configurar_backend(backend)
+    return backend
+
+@pytest.fixture
+def entrada(tmp_path):
+    ruta = tmp_path / "temas.jsonl"
+    ruta.write_text("\n".join(json.dumps(fila, ensure_ascii=False) for fila in [
+        {"tema": "Gatos"}, {"tema": "Perros", "estilo": "calmado", "duracion": "45"}, {"tema": " "},
+    ]), encoding="utf-8")
+    return str(ruta)
+
+def leer_salida(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f]
+
+def test_leer_temas_completa_los_valores_por_defecto(tmp_path, entrada):
+    gatos, perros = lote.leer_temas(entrada)
+    assert gatos == {"tema": "Gatos", "objetivo": "persuasivo", "estilo": "enérgico", "duracion": 30}
+    assert perros["estilo"] == "calmado" and perros["duracion"] == 45
+    csv = tmp_path / "temas.csv"
+    csv.write_text("tema,nicho\nGatos,Mascotas\n", encoding="utf-8")
+    assert lote.leer_temas(str(csv))[0]["nicho"] == "Mascotas"
+
+def test_lote_completo(tmp_path, entrada, backend):
+    salida = str(tmp_path / "salida.jsonl")
+    lote.ejecutar_lote(entrada, salida, workers=2)
+    resultados = leer_salida(salida)
+    assert sorted(r["tema"] for r in resultados) == ["Gatos", "Perros"]
+    assert all(r["ok"] and all(r["etapas_ok"].values()) for r in resultados)
+    assert backend.llamadas == 6
+
+    lote.ejecutar_lote(entrada, salida, workers=2)
+    assert backend.llamadas == 6 and len(leer_salida(salida)) == 2
+
+def test_al_reanudar_solo_se_repite_la_etapa_fallida(tmp_path, entrada, backend):
+    peticion = lote.leer_temas(entrada)[0]
+    previo = lote.procesar_peticion(peticion)
+    previo["analisis"] = {"texto": "", "secciones": [], "error": "Error 503"}
+    previo["etapas_ok"] = lote.etapas_completadas(previo)
+    previo["ok"] = False
+    salida = tmp_path / "salida.jsonl"
+    salida.write_text(json.dumps(previo, ensure_ascii=False) + "\n", encoding="utf-8")
+    llamadas = backend.llamadas
+
+    resultado = lote.procesar_peticion(peticion, previo=lote.resultados_previos(str(salida))[previo["clave"]])
+    assert backend.llamadas == llamadas + 1
+    assert resultado["ok"] and resultado["reutilizadas"] == ["copy_hooks", "script"]
+    assert resultado["script"] == previo["script"] and resultado["copy_hooks"] == previo["copy_hooks"]
+    assert not resultado["analisis"]["error"]
+
+def test_un_script_fallido_repite_todo(backend):
+    peticion = {"tema": "Gatos", "objetivo": "persuasivo", "estilo": "enérgico", "duracion": 30}
+    cliente_gemini.configurar_backend(BackendLocal(tasa_fallos=1.0))
+    fallido = lote.procesar_peticion(peticion)
+    assert fallido["etapas_ok"] == {"script": False, "copy_hooks": False, "analisis": False}
+
+    cliente_gemini.configurar_backend(backend)
+    resultado = lote.procesar_peticion(peticion, previo=fallido)
+    assert resultado["ok"] and "reutilizadas" not in resultado
+    assert backend.llamadas == 3
+
+def test_resultados_de_versiones_anteriores(tmp_path):
+    salida = tmp_path / "salida.jsonl"
+    antiguo = {"clave": "abc", "tema": "Gatos", "script": "**Título:** Gatos", "ok": False,
+               "copy_hooks": {"copy": "No se pudo generar copy/hooks/título.", "hooks": [], "titulo_shorts": ""},
+               "analisis": {"texto": "x", "secciones": [], "error": None}}
+    salida.write_text(json.dumps(antiguo) + "\n{cortada", encoding="utf-8")
+    previo = lote.resultados_previos(str(salida))["abc"]
+    assert previo["etapas_ok"] == {"script": True, "copy_hooks": False, "analisis": True}
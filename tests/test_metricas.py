@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import metricas as m
+
+@pytest.fixture
+def registro(monkeypatch):
+    nuevo = m.RegistroMetricas()
+    monkeypatch.setattr(m, "metricas", nuevo)
+    return nuevo
+
+def test_contadores_por_etiquetas(registro):
+    registro.incrementar("acciones_total", accion="generar")
+    registro.incrementar("acciones_total", 2, accion="generar")
+    registro.incrementar("acciones_total", accion="analizar")
+    valores = {c["etiquetas"]["accion"]: c["valor"] for c in registro.como_dict()["contadores"]}
+    assert valores == {"analizar": 1, "generar": 3}
+
+def test_percentiles_del_histograma():
+    h = m.Histograma()
+    assert h.percentil(95) is None
+    for valor in [0.003] * 90 + [0.7] * 10:
+        h.observar(valor)
+    assert h.percentil(50) == 0.005
+    assert h.percentil(95) == 1
+    assert h.total == 100 and h.suma == pytest.approx(7.27)
+    h.observar(120)
+    assert h.percentil(100) == float("inf")
+
+def test_formato_prometheus_con_tipos(registro):
+    registro.incrementar("llamadas_modelo_total", funcion="a", estado="ok")
+    registro.incrementar("llamadas_modelo_total", funcion="b", estado="ok")
+    registro.observar("latencia_modelo_segundos", 0.3, funcion="a")
+    lineas = registro.como_prometheus().splitlines()
+    assert lineas.count("# TYPE reels_llamadas_modelo_total counter") == 1
+    assert lineas.count("# TYPE reels_latencia_modelo_segundos histogram") == 1
+    assert lineas.index("# TYPE reels_llamadas_modelo_total counter") < lineas.index(
+        'reels_llamadas_modelo_total{estado="ok",funcion="a"} 1')
+    assert 'reels_latencia_modelo_segundos_bucket{funcion="a",le="0.25"} 0' in lineas
+    assert 'reels_latencia_modelo_segundos_bucket{funcion="a",le="0.5"} 1' in lineas
+    assert 'reels_latencia_modelo_segundos_bucket{funcion="a",le="+Inf"} 1' in lineas
+    assert 'reels_latencia_modelo_segundos_count{funcion="a"} 1' in lineas
+
+def test_prometheus_escapa_los_valores_de_etiqueta(registro):
+    registro.incrementar("acciones_total", accion='di "hola"\n')
+    assert 'reels_acciones_total{accion="di \\"hola\\"\\n"} 1' in registro.como_prometheus()
+
+def test_resumen_por_funcion(registro):
+    uso = SimpleNamespace(prompt_token_count=1000, candidates_token_count=500)
+    m.registrar_llamada_modelo("generar_script", 0.2, respuesta=SimpleNamespace(usage_metadata=uso))
+    m.registrar_llamada_modelo("generar_script", 0.4, error=TimeoutError())
+    m.registrar_parseo("generar_script", False)
+    m.registrar_accion("generar_contenido")
+    with m.medir("historial", operacion="guardar"):
+        pass
+    resumen = m.resumen_por_funcion()
+    fila, = resumen["funciones"]
+    assert fila["llamadas"] == 2 and fila["errores"] == 1
+    assert fila["tokens_entrada"] == 1000 and fila["tokens_salida"] == 500
+    assert fila["fallos_parseo"] == 1 and fila["p95_s"] == 0.5
+    assert resumen["acciones"] == {"generar_contenido": 1}
+    assert resumen["historial"][0]["operacion"] == "guardar"
+    coste, = resumen["coste_usd_por_dia"].values()
+    assert coste == pytest.approx((1000 * m.PRECIO_ENTRADA_MTOK + 500 * m.PRECIO_SALIDA_MTOK) / 1_000_000)
+
+def test_exportar_textfile_desde_varios_hilos(registro, tmp_path):
+    registro.incrementar("acciones_total", accion="generar")
+    ruta = str(tmp_path / "reels.prom")
+    errores = []
+
+    def exportar():
+        try:
+            for _ in range(20):
+                m.exportar_textfile(ruta)
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=exportar) for _ in range(4)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert not errores
+    assert os.listdir(tmp_path) == ["reels.prom"]
+    assert "# TYPE reels_acciones_total counter" in (tmp_path / "reels.prom").read_text(encoding="utf-8")
+
+def test_exportar_textfile_sin_ruta(monkeypatch):
+    monkeypatch.setattr(m, "METRICAS_TEXTFILE", None)
+    assert m.exportar_textfile() is None
+
+def test_exportar_json(registro, tmp_path):
+    registro.observar("historial_segundos", 0.01, operacion="listar")
+    ruta = m.exportar_json(str(tmp_path / "metricas.json"))
+    datos = json.loads(open(ruta, encoding="utf-8").read())
+    assert datos["histogramas"][0]["etiquetas"] == {"operacion": "listar"}
+    assert datos["contadores"] == []
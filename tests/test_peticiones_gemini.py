@@ -0,0 +1,163 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import peticiones_gemini as pg
+from backends_llm import BackendLocal, ErrorSimulado
+
+class BackendConFallos(BackendLocal):
+    """Backend local que lanza `error` en las primeras `fallos` llamadas."""
+
+    def __init__(self, fallos=0, error=None, **kwargs):
+        super().__init__(**kwargs)
+        self.fallos = fallos
+        self.error = error or ErrorSimulado("503 simulado")
+
+    def generate_content(self, prompt, generation_config=None, stream=False, plazo=None, **kwargs):
+        with self._lock:
+            fallar = self.fallos > 0
+            self.fallos -= 1
+        if fallar:
+            self.llamadas += 1
+            raise self.error
+        return super().generate_content(prompt, generation_config, stream, plazo, **kwargs)
+
+@pytest.fixture(autouse=True)
+def gemini(monkeypatch):
+    """Circuito, limitadores y reintentos propios de cada prueba (y sin esperas largas)."""
+    monkeypatch.setattr(pg, "circuito", pg.CircuitBreaker(2, 0.2))
+    monkeypatch.setattr(pg, "limitador_peticiones", pg.TokenBucket(1000, 1000))
+    monkeypatch.setattr(pg, "limitador_tokens", pg.TokenBucket(10 ** 9, 10 ** 9))
+    monkeypatch.setattr(pg, "GEMINI_REINTENTOS", 3)
+    monkeypatch.setattr(pg, "GEMINI_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(pg, "GEMINI_COBERTURA", False)
+
+def abrir_circuito():
+    # El segundo fallo seguido abre el circuito; lo que venga después ya no llega al backend.
+    cliente = BackendConFallos(fallos=10)
+    while pg.circuito.estado != "abierto":
+        with pytest.raises((ErrorSimulado, pg.CircuitoAbierto)):
+            pg.llamar_modelo(cliente, "Tema: gatos", funcion="prueba")
+    assert cliente.llamadas == 2
+
+def test_reintenta_los_errores_transitorios(monkeypatch):
+    monkeypatch.setattr(pg, "circuito", pg.CircuitBreaker(10, 0.2))
+    cliente = BackendConFallos(fallos=2)
+    respuesta = pg.llamar_modelo(cliente, "Tema: gatos", funcion="prueba")
+    assert "gatos" in respuesta.text
+    assert cliente.llamadas == 3
+    assert pg.circuito.estado == "cerrado"
+
+def test_agotados_los_reintentos_propaga_el_error(monkeypatch):
+    monkeypatch.setattr(pg, "circuito", pg.CircuitBreaker(10, 0.2))
+    cliente = BackendConFallos(fallos=10)
+    with pytest.raises(ErrorSimulado):
+        pg.llamar_modelo(cliente, "Tema: gatos", funcion="prueba")
+    assert cliente.llamadas == pg.GEMINI_REINTENTOS + 1
+
+def test_no_reintenta_errores_del_cliente():
+    cliente = BackendConFallos(fallos=10, error=ValueError("prompt no válido"))
+    with pytest.raises(ValueError):
+        pg.llamar_modelo(cliente, "Tema: gatos", funcion="prueba")
+    assert cliente.llamadas == 1
+    assert pg.circuito.estado == "cerrado"
+
+def test_un_error_del_cliente_no_reinicia_los_fallos(monkeypatch):
+    monkeypatch.setattr(pg, "GEMINI_REINTENTOS", 0)
+    with pytest.raises(ErrorSimulado):
+        pg.llamar_modelo(BackendConFallos(fallos=1), "Tema: gatos", funcion="prueba")
+    with pytest.raises(ValueError):
+        pg.llamar_modelo(BackendConFallos(fallos=1, error=ValueError("prompt no válido")), "Tema: gatos", funcion="prueba")
+    with pytest.raises(ErrorSimulado):
+        pg.llamar_modelo(BackendConFallos(fallos=1), "Tema: gatos", funcion="prueba")
+    assert pg.circuito.estado == "abierto"
+
+def test_un_error_del_cliente_en_semiabierto_no_cierra_el_circuito():
+    abrir_circuito()
+    time.sleep(0.25)
+    with pytest.raises(ValueError):
+        pg.llamar_modelo(BackendConFallos(fallos=1, error=ValueError("prompt no válido")), "Tema: gatos", funcion="prueba")
+    assert pg.circuito.estado == "semiabierto"
+    # La prueba quedó libre: la siguiente llamada la hace y cierra el circuito.
+    assert "gatos" in pg.llamar_modelo(BackendLocal(), "Tema: gatos", funcion="prueba").text
+    assert pg.circuito.estado == "cerrado"
+
+def test_el_circuito_abierto_falla_sin_llamar_al_backend():
+    abrir_circuito()
+    cliente = BackendLocal()
+    with pytest.raises(pg.CircuitoAbierto):
+        pg.llamar_modelo(cliente, "Tema: gatos", funcion="prueba")
+    assert cliente.llamadas == 0
+
+def test_el_circuito_se_cierra_si_la_llamada_de_prueba_sale_bien():
+    abrir_circuito()
+    time.sleep(0.25)
+    assert "gatos" in pg.llamar_modelo(BackendLocal(), "Tema: gatos", funcion="prueba").text
+    assert pg.circuito.estado == "cerrado"
+
+def test_el_circuito_se_reabre_si_la_llamada_de_prueba_falla(monkeypatch):
+    monkeypatch.setattr(pg, "GEMINI_REINTENTOS", 0)
+    abrir_circuito()
+    time.sleep(0.25)
+    with pytest.raises(ErrorSimulado):
+        pg.llamar_modelo(BackendConFallos(fallos=1), "Tema: gatos", funcion="prueba")
+    assert pg.circuito.estado == "abierto"
+
+def test_semiabierto_no_se_bloquea_si_el_limitador_rechaza_la_prueba(monkeypatch):
+    abrir_circuito()
+    time.sleep(0.25)
+    sin_cupo = pg.TokenBucket(1, 0.001)
+    sin_cupo.adquirir(1)
+    limitador = pg.limitador_peticiones
+    monkeypatch.setattr(pg, "limitador_peticiones", sin_cupo)
+    with pytest.raises(pg.LimiteDeTasaExcedido):
+        pg.llamar_modelo(BackendLocal(), "Tema: gatos", funcion="prueba")
+    assert pg.circuito.estado != "semiabierto"
+
+    monkeypatch.setattr(pg, "limitador_peticiones", limitador)
+    assert "gatos" in pg.llamar_modelo(BackendLocal(), "Tema: gatos", funcion="prueba").text
+    assert pg.circuito.estado == "cerrado"
+
+def test_el_plazo_vencido_corta_la_llamada(monkeypatch):
+    # El backend recibe el plazo restante y corta él mismo (TimeoutError, base de PlazoExcedido).
+    monkeypatch.setattr(pg, "GEMINI_REINTENTOS", 0)
+    inicio = time.monotonic()
+    with pytest.raises(TimeoutError):
+        pg.llamar_modelo(BackendLocal(latencia="fija:0.5"), "Tema: gatos", funcion="prueba", plazo=0.1)
+    assert time.monotonic() - inicio < 0.4
+
+def test_la_espera_en_el_pool_no_cuenta_para_el_plazo(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(pg, "_pool_llamadas", pool)
+    cliente = BackendLocal(latencia="fija:0.2")
+
+    def llamar(i):
+        return pg.llamar_modelo(cliente, f"Tema: gatos {i}", funcion="prueba", plazo=0.4).text
+
+    with ThreadPoolExecutor(max_workers=6) as llamantes:
+        textos = list(llamantes.map(llamar, range(6)))
+    pool.shutdown()
+    assert all(textos)
+    assert pg.circuito.estado == "cerrado"
+
+def test_streaming_devuelve_los_fragmentos():
+    fragmentos = list(pg.llamar_modelo(BackendLocal(tamano_fragmento=10), "Tema: gatos", stream=True, funcion="prueba"))
+    assert len(fragmentos) > 1
+    assert "gatos" in "".join(f.text for f in fragmentos)
+
+def test_con_el_pool_lleno_vence_el_plazo_total(monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(pg, "_pool_llamadas", pool)
+    ocupado = BackendLocal(latencia="fija:0.6")
+    bloqueo = pool.submit(ocupado.generate_content, "Tema: gatos")
+    cliente = BackendLocal()
+    inicio = time.monotonic()
+    with pytest.raises(pg.EsperaPoolExcedida):
+        pg.llamar_modelo(cliente, "Tema: gatos", funcion="prueba", plazo=0.1)
+    assert time.monotonic() - inicio < 0.4
+    bloqueo.result()
+    pool.shutdown()
+    # La llamada se sacó de la cola sin llegar al backend ni contar para el circuito.
+    assert cliente.llamadas == 0
+    assert pg.circuito.estado == "cerrado" and pg.circuito._fallos == 0
@@ -0,0 +1,90 @@
+import pytest
+
+import presupuesto_tokens as pt
+from generadores import construir_prompt_copy_hooks, copy_hooks_valido, generar_copy_hooks
+from metricas import metricas
+
+SCRIPT = (
+    "**Título:** Gatos: lo que nadie te cuenta\n\n"
+    "**Gancho:**\n¿Sabías que el 90% falla con su gato? Quédate hasta el final.\n\n"
+    "**Desarrollo del Contenido:**\n"
+    "[Escena 1: Un plano del gato. Luego texto en pantalla con el dato.]\n"
+    "[Escena 2: El dueño reacciona. Corte rápido.]\n\n"
+    "**Llamada a la Acción:**\nSíguenos y comenta qué te sorprendió.\n\n"
+    "**Elementos Visuales/Sonido:**\n- Cortes rápidos cada 2 segundos\n- Música en tendencia\n"
+)
+
+def script_largo(escenas=300):
+    desarrollo = "\n".join(f"Escena {i}: Frase principal de la escena {i}. Detalle que sobra en el resumen."
+                           for i in range(1, escenas + 1))
+    return SCRIPT.replace("[Escena 2: El dueño reacciona. Corte rápido.]", desarrollo)
+
+def ahorrados(funcion):
+    return sum(c["valor"] for c in metricas.como_dict()["contadores"]
+               if c["nombre"] == "tokens_ahorrados_total" and c["etiquetas"] == {"funcion": funcion})
+
+def test_contar_tokens_es_local_y_aproximado():
+    assert pt.contar_tokens("") == 0
+    assert pt.contar_tokens("hola") == 1
+    assert pt.contar_tokens("¿Sabías?") == 4
+    assert pt.contar_tokens("  hola   \n\n  ") == pt.contar_tokens("hola")
+
+def test_compactar_quita_visuales_y_markdown():
+    compacto = pt.compactar_script(SCRIPT)
+    assert "Elementos Visuales" not in compacto and "Música en tendencia" not in compacto
+    assert "**" not in compacto
+    assert compacto.startswith("Título: Gatos")
+    assert compacto.endswith("Síguenos y comenta qué te sorprendió.")
+
+def test_la_seccion_visual_termina_en_el_siguiente_encabezado():
+    script = "Gancho: hola\nElementos Visuales/Sonido:\n- música\nLlamada a la Acción: síguenos"
+    assert pt.compactar_script(script) == "Gancho: hola\nLlamada a la Acción: síguenos"
+
+def test_resumen_conserva_la_primera_frase_y_cierra_corchetes():
+    resumen = pt.resumir_script(pt.compactar_script(SCRIPT))
+    assert "[Escena 1: Un plano del gato.]" in resumen
+    assert "[Escena 2: El dueño reacciona.]" in resumen
+    assert resumen.count("[") == resumen.count("]")
+    assert "Gancho:\n¿Sabías que el 90% falla con su gato? Quédate hasta el final." in resumen
+
+def test_un_script_dentro_del_presupuesto_solo_se_compacta():
+    assert pt.ajustar_script(SCRIPT, "analizar_script") == pt.compactar_script(SCRIPT)
+
+def test_recortar_ajusta_al_presupuesto(monkeypatch):
+    monkeypatch.setattr(pt, "PRESUPUESTO_TOKENS_POLITICA", "recortar")
+    largo = script_largo()
+    presupuesto = pt.PRESUPUESTOS_POR_FUNCION["analizar_script"]
+    assert pt.contar_tokens(pt.compactar_script(largo)) > presupuesto
+    ajustado = pt.ajustar_script(largo, "analizar_script")
+    assert pt.contar_tokens(ajustado) <= presupuesto
+    assert ajustado.startswith("Título: Gatos")
+    assert ajustado.endswith("Síguenos y comenta qué te sorprendió.")
+    assert pt.MARCA_RECORTE in ajustado
+    assert "Detalle que sobra" not in ajustado
+
+def test_rechazar_lanza_presupuesto_excedido(monkeypatch):
+    monkeypatch.setattr(pt, "PRESUPUESTO_TOKENS_POLITICA", "rechazar")
+    with pytest.raises(pt.PresupuestoExcedido):
+        pt.ajustar_script(script_largo(), "generar_copy_hooks")
+
+def test_presupuesto_cero_no_limita(monkeypatch):
+    monkeypatch.setitem(pt.PRESUPUESTOS_POR_FUNCION, "analizar_script", 0)
+    largo = script_largo()
+    assert pt.ajustar_script(largo, "analizar_script") == pt.compactar_script(largo)
+
+def test_el_prompt_registra_los_tokens_ahorrados():
+    antes = ahorrados("generar_copy_hooks")
+    prompt = construir_prompt_copy_hooks("Gatos", [script_largo()])
+    assert "Título Shorts:" in prompt and not prompt.startswith(" ")
+    assert ahorrados("generar_copy_hooks") > antes
+
+def test_copy_hooks_con_el_backend_local_y_script_largo():
+    copy_hooks = generar_copy_hooks("Gatos", [script_largo()])
+    assert copy_hooks_valido(copy_hooks)
+    assert len(copy_hooks["hooks"]) == 3
+
+def test_copy_hooks_rechazado_devuelve_el_error(monkeypatch):
+    monkeypatch.setattr(pt, "PRESUPUESTO_TOKENS_POLITICA", "rechazar")
+    copy_hooks = generar_copy_hooks("Gatos", [script_largo()])
+    assert not copy_hooks_valido(copy_hooks)
+    assert "presupuesto" in copy_hooks["copy"]
@@ -0,0 +1,118 @@
+import asyncio
+import http.client
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import cliente_gemini
+import peticiones_gemini as pg
+import servidor_api as sa
+from backends_llm import BackendLocal
+from generadores import VALORES_POR_DEFECTO
+
+@pytest.fixture(autouse=True)
+def gemini(monkeypatch):
+    monkeypatch.setattr(pg, "circuito", pg.CircuitBreaker(100, 0.2))
+    monkeypatch.setattr(pg, "limitador_peticiones", pg.TokenBucket(1000, 1000))
+    monkeypatch.setattr(pg, "GEMINI_BACKOFF_BASE", 0.001)
+    yield
+    cliente_gemini.configurar_backend(None)
+
+@pytest.fixture
+def puerto():
+    """Servidor en un puerto libre, con su bucle de eventos en un hilo aparte."""
+    loop = asyncio.new_event_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=4))
+    servidor = loop.run_until_complete(asyncio.start_server(sa._conexion, "127.0.0.1", 0))
+    hilo = threading.Thread(target=loop.run_forever, daemon=True)
+    hilo.start()
+    yield servidor.sockets[0].getsockname()[1]
+
+    async def parar():
+        servidor.close()
+        conexiones = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for tarea in conexiones:
+            tarea.cancel()
+        await asyncio.gather(*conexiones, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(parar(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    hilo.join()
+    loop.close()
+
+def pedir(conexion, metodo, ruta, cuerpo=None):
+    datos = json.dumps(cuerpo).encode("utf-8") if cuerpo is not None else None
+    conexion.request(metodo, ruta, body=datos, headers={"Content-Type": "application/json"} if datos else {})
+    respuesta = conexion.getresponse()
+    texto = respuesta.read().decode("utf-8")
+    if respuesta.getheader("Content-Type", "").startswith("application/x-ndjson"):
+        return respuesta.status, [json.loads(linea) for linea in texto.splitlines()]
+    return respuesta.status, json.loads(texto)
+
+@pytest.fixture
+def conexion(puerto):
+    conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=10)
+    yield conexion
+    conexion.close()
+
+def test_parametros_por_defecto():
+    assert sa._parametros_contenido({"tema": " Gatos "}) == ("Gatos", *VALORES_POR_DEFECTO.values())
+    with pytest.raises(sa.ErrorPeticion):
+        sa._parametros_contenido({"tema": "Gatos", "duracion": 500})
+
+def test_salud_y_script_en_la_misma_conexion(conexion):
+    estado, salud = pedir(conexion, "GET", "/salud")
+    assert estado == 200 and salud["ok"] and salud["backend"] == "local-stub"
+    estado, respuesta = pedir(conexion, "POST", "/script", {"tema": "Gatos"})
+    assert estado == 200 and respuesta["ok"]
+    assert respuesta["script"].startswith("**Título:** Gatos")
+
+def test_script_en_streaming(conexion):
+    cliente_gemini.configurar_backend(BackendLocal(tamano_fragmento=20))
+    estado, eventos = pedir(conexion, "POST", "/script", {"tema": "Gatos", "stream": True})
+    assert estado == 200
+    fragmentos, final = eventos[:-1], eventos[-1]
+    assert len(fragmentos) > 1 and final["fin"] and final["ok"]
+    assert "".join(e["fragmento"] for e in fragmentos) == final["script"]
+
+def test_un_streaming_cortado_termina_sin_script(conexion):
+    cliente_gemini.configurar_backend(BackendLocal(tamano_fragmento=20, tasa_fallos=1.0))
+    _, eventos = pedir(conexion, "POST", "/script", {"tema": "Gatos", "stream": True})
+    assert eventos[-1]["fin"] and not eventos[-1]["ok"]
+    assert "".join(e["fragmento"] for e in eventos[:-1]) not in eventos[-1]["script"]
+
+def test_contenido_completo(conexion):
+    estado, respuesta = pedir(conexion, "POST", "/contenido", {"tema": "Gatos"})
+    assert estado == 200 and respuesta["ok"]
+    assert set(respuesta["resultados"]) >= {"script", "copy_hooks", "analisis"}
+    assert set(respuesta["tiempos"]) == set(respuesta["resultados"])
+
+def test_analisis_en_streaming(conexion):
+    script = pedir(conexion, "POST", "/script", {"tema": "Gatos"})[1]["script"]
+    _, eventos = pedir(conexion, "POST", "/analisis", {"script": script, "stream": True})
+    assert any("seccion" in e for e in eventos)
+    assert eventos[-1]["fin"] and eventos[-1]["ok"]
+
+@pytest.mark.parametrize("metodo, ruta, cuerpo, esperado", [
+    ("GET", "/no-existe", None, 404),
+    ("GET", "/script", None, 405),
+    ("POST", "/script", {"objetivo": "x"}, 400),
+    ("POST", "/contenido", {"tema": "Gatos", "variantes": 9}, 400),
+    ("GET", "/historial/analitica?agrupacion=mes", None, 400),
+])
+def test_errores_de_la_peticion(conexion, metodo, ruta, cuerpo, esperado):
+    estado, respuesta = pedir(conexion, metodo, ruta, cuerpo)
+    assert estado == esperado and respuesta["error"]
+
+def test_cuerpo_demasiado_grande(conexion, monkeypatch):
+    monkeypatch.setattr(sa, "SERVIDOR_MAX_CUERPO", 10)
+    estado, respuesta = pedir(conexion, "POST", "/script", {"tema": "Gatos"})
+    assert estado == 413 and "bytes" in respuesta["error"]
+
+def test_las_peticiones_cuentan_en_las_metricas(conexion):
+    pedir(conexion, "GET", "/no-existe")
+    _, datos = pedir(conexion, "GET", "/metricas")
+    assert any(c["nombre"] == "api_peticiones_total" and c["etiquetas"] == {"ruta": "otra", "estado": "404"}
+               for c in datos["contadores"])